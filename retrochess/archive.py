@@ -0,0 +1,332 @@
+#!/usr/bin/env python3
+"""Binary game archives.
+
+An archive stores the main line of each game as an array of 16-bit packed
+moves, ``src | dest << 6 | promotion << 12``, so replaying a game is a loop of
+``Board.make_move`` without any SAN to parse. All numbers are little-endian:
+
+    header     magic, version, game count, offsets of the index and metadata
+    moves      the moves of every game, one after the other
+    index      count + 1 byte offsets, game n spans index[n] to index[n + 1]
+    metadata   a fixed-width record per game: date, result, ratings, names
+
+``GameArchive`` maps the file with mmap. Game n is found through the index
+without reading the others, and its moves come back as a memoryview of the
+map, no copy made. Only games starting from the initial position are stored.
+
+    python archive.py convert games.pgn games.rca
+    python archive.py show games.rca 42
+    python archive.py replay games.rca
+"""
+import argparse
+import mmap
+import os
+import struct
+import sys
+import tempfile
+import time
+from array import array
+from typing import Dict, Iterable, Iterator, NamedTuple, Union
+
+from board import BACKENDS, Board
+from fen import STARTING_FEN, load_fen
+from pgn import Game, PgnError, format_game, read_games
+
+MAGIC = b"RCGA"
+VERSION = 1
+# magic, version, reserved, game count, index offset, metadata offset
+HEADER = struct.Struct("<4sHHIQQ4x")
+# year, month, day, result, reserved, white and black ratings, white, black, event
+META = struct.Struct("<HBBBxHH32s32s32s")
+NAME_SIZE = 32
+RESULTS = ("*", "1-0", "0-1", "1/2-1/2")
+# the arrays of the file can be used in place on little-endian machines only
+NATIVE = sys.byteorder == "little"
+
+
+class GameInfo(NamedTuple):
+    """The metadata of an archived game, 0 and ? for what is unknown."""
+    white: str
+    black: str
+    event: str
+    date: str
+    result: str
+    white_elo: int
+    black_elo: int
+
+    def headers(self) -> Dict[str, str]:
+        """The PGN tags of the game."""
+        headers = {"Event": self.event or "?", "Date": self.date,
+                   "White": self.white or "?", "Black": self.black or "?"}
+        if self.white_elo:
+            headers["WhiteElo"] = str(self.white_elo)
+        if self.black_elo:
+            headers["BlackElo"] = str(self.black_elo)
+        return headers
+
+
+def _name(text: str) -> bytes:
+    # truncated to the field without splitting a character
+    return text.encode("utf-8")[:NAME_SIZE].decode("utf-8", "ignore").encode("utf-8")
+
+
+def _number(text: str) -> int:
+    # ASCII only, isdigit also takes superscripts and digits of other scripts
+    return int(text) if text.isascii() and text.isdigit() else 0
+
+
+def pack_info(headers: Dict[str, str], result: str) -> bytes:
+    """The metadata record of a game from its PGN tags."""
+    year, month, day = (headers.get("Date", "").split(".") + ["", "", ""])[:3]
+    return META.pack(min(_number(year), 0xFFFF), min(_number(month), 255), min(_number(day), 255),
+                     RESULTS.index(result) if result in RESULTS else 0,
+                     min(_number(headers.get("WhiteElo", "")), 0xFFFF),
+                     min(_number(headers.get("BlackElo", "")), 0xFFFF),
+                     _name(headers.get("White", "")), _name(headers.get("Black", "")),
+                     _name(headers.get("Event", "")))
+
+
+def unpack_info(data, offset: int = 0) -> GameInfo:
+    year, month, day, result, white_elo, black_elo, white, black, event = META.unpack_from(data, offset)
+    date = f"{year:04d}" if year else "????"
+    date += f".{month:02d}" if month else ".??"
+    date += f".{day:02d}" if day else ".??"
+
+    def text(raw: bytes) -> str:
+        return raw.rstrip(b"\0").decode("utf-8", "replace")
+    return GameInfo(text(white), text(black), text(event), date, RESULTS[result], white_elo, black_elo)
+
+
+class ArchiveWriter():
+    """Write games to a new archive. Use it as a context manager or close it,
+    the header and index are only written then.
+
+    The moves go straight to the file and the metadata to a temporary one, so
+    only the index, 8 bytes a game, is kept in memory.
+
+    Args:
+        path (str | PathLike): archive to create, replaced if it exists.
+    """
+
+    def __init__(self, path: Union[str, os.PathLike]) -> None:
+        self.file = open(path, "wb", buffering=1 << 20)
+        self.file.write(bytes(HEADER.size))
+        self.meta = tempfile.TemporaryFile(buffering=1 << 20)
+        self.offsets = array("Q", [HEADER.size])
+
+    def __len__(self) -> int:
+        return len(self.offsets) - 1
+
+    def __enter__(self) -> "ArchiveWriter":
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def add(self, moves: Iterable[int], headers: Union[Dict[str, str], None] = None, result: str = "*") -> int:
+        """Append a game played from the initial position, return its number.
+
+        Args:
+            moves (Iterable[int]): packed moves of the game.
+            headers (Dict[str, str], optional): PGN tags, for the metadata.
+            result (str): 1-0, 0-1, 1/2-1/2 or *.
+        """
+        codes = array("H", moves)
+        if not NATIVE:
+            codes.byteswap()
+        self.file.write(codes.tobytes())
+        self.offsets.append(self.offsets[-1] + 2 * len(codes))
+        self.meta.write(pack_info(headers or {}, result))
+        return len(self.offsets) - 2
+
+    def close(self):
+        if self.file.closed:
+            return
+        # the index is aligned to be used in place
+        index_offset = -self.offsets[-1] % 8 + self.offsets[-1]
+        self.file.write(bytes(index_offset - self.offsets[-1]))
+        offsets = array("Q", self.offsets)
+        if not NATIVE:
+            offsets.byteswap()
+        self.file.write(offsets.tobytes())
+        self.meta.seek(0)
+        while chunk := self.meta.read(1 << 20):
+            self.file.write(chunk)
+        self.meta.close()
+        self.file.seek(0)
+        self.file.write(HEADER.pack(MAGIC, VERSION, 0, len(self), index_offset,
+                                    index_offset + 8 * len(self.offsets)))
+        self.file.close()
+
+
+class GameArchive():
+    """An archive file, mapped in memory. Use it as a context manager or close it.
+
+    The move arrays given out are views of the map, they must be released or
+    dropped before the archive is closed.
+
+    Args:
+        path (str | PathLike): the archive.
+
+    Raises:
+        ValueError: the file is not an archive.
+    """
+
+    def __init__(self, path: Union[str, os.PathLike]) -> None:
+        self.path = path
+        with open(path, "rb") as f:
+            try:
+                self.map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            except ValueError:
+                raise ValueError(f"{path} is empty") from None
+        if len(self.map) < HEADER.size:
+            self.map.close()
+            raise ValueError(f"{path} is not a game archive")
+        magic, version, _, self.count, index_offset, self.meta_offset = HEADER.unpack_from(self.map)
+        if magic != MAGIC or version != VERSION or self.meta_offset + self.count * META.size > len(self.map):
+            self.map.close()
+            raise ValueError(f"{path} is not a game archive")
+        view = memoryview(self.map)
+        if NATIVE:
+            self.words = view[:index_offset].cast("H")
+            self.index = view[index_offset:self.meta_offset].cast("Q")
+        else:
+            words, index = array("H", view[:index_offset]), array("Q", view[index_offset:self.meta_offset])
+            words.byteswap()
+            index.byteswap()
+            self.words, self.index = memoryview(words), memoryview(index)
+        view.release()
+
+    def __len__(self) -> int:
+        return self.count
+
+    def __enter__(self) -> "GameArchive":
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        self.words.release()
+        self.index.release()
+        self.map.close()
+
+    def moves(self, number: int) -> memoryview:
+        """The packed moves of a game, a view of the file."""
+        if not 0 <= number < self.count:
+            raise IndexError(f"no game {number}, the archive has {self.count}")
+        return self.words[self.index[number] >> 1:self.index[number + 1] >> 1]
+
+    def __iter__(self) -> Iterator[memoryview]:
+        """The moves of every game, in order."""
+        words, index = self.words, self.index
+        start = index[0] >> 1
+        for number in range(self.count):
+            end = index[number + 1] >> 1
+            yield words[start:end]
+            start = end
+
+    def info(self, number: int) -> GameInfo:
+        if not 0 <= number < self.count:
+            raise IndexError(f"no game {number}, the archive has {self.count}")
+        return unpack_info(self.map, self.meta_offset + number * META.size)
+
+    def replay(self, number: int, board: Union[Board, None] = None) -> Board:
+        """Play the moves of a game on a board, reused if given, and return it."""
+        board = load_fen(board or Board(backend="bitboard"), STARTING_FEN)
+        make_move = board.make_move
+        for move in self.moves(number):
+            make_move(move)
+        return board
+
+    def game(self, number: int, board: Union[Board, None] = None) -> Game:
+        """A game of the archive, with its moves in SAN, to be written as PGN."""
+        info = self.info(number)
+        return Game.from_moves(self.moves(number), info.headers(), result=info.result, board=board)
+
+
+def convert(source, path: Union[str, os.PathLike], board: Union[Board, None] = None) -> Dict[str, int]:
+    """Write the games of a PGN file to an archive.
+
+    Games with illegal moves are reported on stderr and skipped, as are games
+    set up from another position than the initial one.
+
+    Args:
+        source (str | PathLike | IO[str]): PGN path or text file.
+        path (str | PathLike): archive to create.
+        board (Board, optional): board to check the moves on.
+
+    Returns:
+        Dict[str, int]: the number of games written, plies, errors and skipped games.
+    """
+    board = board or Board(backend="bitboard")
+    stats = {"games": 0, "plies": 0, "errors": 0, "skipped": 0}
+    with ArchiveWriter(path) as writer:
+        for game in read_games(source):
+            if game.fen != STARTING_FEN:
+                stats["skipped"] += 1
+                continue
+            try:
+                moves = game.moves(board)
+            except PgnError as e:
+                stats["errors"] += 1
+                print(e, file=sys.stderr)
+                continue
+            writer.add(moves, game.headers, game.result)
+            stats["games"] += 1
+            stats["plies"] += len(moves)
+    return stats
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Convert PGN files to binary game archives and read them.")
+    parser.add_argument("--backend", choices=BACKENDS, default="bitboard")
+    modes = parser.add_subparsers(dest="mode", required=True)
+    to_archive = modes.add_parser("convert", help="write the games of a PGN file to an archive")
+    to_archive.add_argument("pgn", help="PGN file to read, - for the standard input")
+    to_archive.add_argument("path", help="archive to create")
+    show = modes.add_parser("show", help="print a game of an archive as PGN")
+    show.add_argument("path", help="archive to read")
+    show.add_argument("number", type=int, help="game number, from 0")
+    replay = modes.add_parser("replay", help="replay every game of an archive and time it")
+    replay.add_argument("path", help="archive to read")
+    args = parser.parse_args(argv)
+
+    board = Board(backend=args.backend)
+    if args.mode == "convert":
+        start = time.perf_counter()
+        stats = convert(sys.stdin if args.pgn == "-" else args.pgn, args.path, board)
+        seconds = time.perf_counter() - start
+        size = os.path.getsize(args.path)
+        print(f"{stats['games']} games  {stats['plies']} plies  {stats['errors']} errors  "
+              f"{stats['skipped']} skipped  {seconds:.3f}s  {size:,} bytes", end="")
+        if args.pgn != "-":
+            print(f"  {os.path.getsize(args.pgn) / size:.1f}x smaller than the PGN", end="")
+        print()
+        return 1 if stats["errors"] else 0
+
+    try:
+        archive = GameArchive(args.path)
+    except ValueError as e:
+        parser.error(str(e))
+    with archive:
+        if args.mode == "show":
+            try:
+                game = archive.game(args.number, board)
+            except IndexError as e:
+                parser.error(str(e))
+            sys.stdout.write(format_game(game))
+        else:
+            start = time.perf_counter()
+            plies = 0
+            for number in range(len(archive)):
+                plies += len(archive.moves(number))
+                archive.replay(number, board)
+            seconds = time.perf_counter() - start
+            rate = round(len(archive) / seconds) if seconds else 0
+            print(f"{len(archive)} games  {plies} plies  {seconds:.3f}s  {rate:,} games/s")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,457 @@
+"""Bitboard position backend.
+
+Squares use the same layout as ``Board.board``: the index of ``(row, col)`` is
+``row * 8 + col``, so a8 is bit 0 and h1 is bit 63. White pawns move towards
+lower indices.
+"""
+from typing import List, Tuple
+
+from board import BLACK, BLACK_LONG, BLACK_SHORT, EMPTY, GameState, WHITE_LONG, WHITE_SHORT
+
+FULL = 0xFFFF_FFFF_FFFF_FFFF
+
+PAWN, KNIGHT, BISHOP, ROOK, QUEEN, KING = range(1, 7)
+
+COORDS: List[Tuple[int, int]] = [divmod(sq, 8) for sq in range(64)]
+
+ROW_BB = [0xFF << (8 * r) for r in range(8)]
+COL_BB = [0x0101010101010101 << c for c in range(8)]
+
+KNIGHT_DELTAS = ((2, -1), (2, 1), (-2, -1), (-2, 1), (-1, -2), (-1, 2), (1, -2), (1, 2))
+KING_DELTAS = ((-1, -1), (-1, 0), (-1, 1), (0, -1), (0, 1), (1, -1), (1, 0), (1, 1))
+ROOK_DIRECTIONS = ((-1, 0), (1, 0), (0, -1), (0, 1))
+BISHOP_DIRECTIONS = ((-1, -1), (-1, 1), (1, -1), (1, 1))
+
+
+def squares(bb: int):
+    """Yield the index of every set bit, lowest first."""
+    while bb:
+        lsb = bb & -bb
+        yield lsb.bit_length() - 1
+        bb ^= lsb
+
+
+def _leaper_attacks(deltas) -> List[int]:
+    table = []
+    for r, c in COORDS:
+        bb = 0
+        for dr, dc in deltas:
+            if 0 <= r + dr < 8 and 0 <= c + dc < 8:
+                bb |= 1 << ((r + dr) * 8 + c + dc)
+        table.append(bb)
+    return table
+
+
+def _ray(sq: int, direction) -> List[int]:
+    r, c = COORDS[sq]
+    dr, dc = direction
+    ray = []
+    r, c = r + dr, c + dc
+    while 0 <= r < 8 and 0 <= c < 8:
+        ray.append(r * 8 + c)
+        r, c = r + dr, c + dc
+    return ray
+
+
+def _subsets(mask: int):
+    # carry-rippler enumeration of every subset of mask, starting with 0
+    sub = 0
+    while True:
+        yield sub
+        sub = (sub - mask) & mask
+        if sub == 0:
+            return
+
+
+def _slider_tables(directions):
+    """Build the occupancy lookup tables of a sliding piece.
+
+    For every square the relevant occupancy mask excludes the board edge, and
+    the table maps each subset of the mask to the attacked squares. The masked
+    occupancy is used directly as the dictionary key, the dictionary hashing
+    playing the role of the magic multiplication.
+    """
+    masks, tables = [], []
+    for sq in range(64):
+        mask = 0
+        rays = []
+        for direction in directions:
+            ray = _ray(sq, direction)
+            ray_mask = 0
+            for s in ray[:-1]:
+                ray_mask |= 1 << s
+            ray_table = {}
+            for sub in _subsets(ray_mask):
+                attacks = 0
+                for s in ray:
+                    attacks |= 1 << s
+                    if sub >> s & 1:
+                        break
+                ray_table[sub] = attacks
+            rays.append((ray_mask, ray_table))
+            mask |= ray_mask
+        table = {}
+        for sub in _subsets(mask):
+            attacks = 0
+            for ray_mask, ray_table in rays:
+                attacks |= ray_table[sub & ray_mask]
+            table[sub] = attacks
+        masks.append(mask)
+        tables.append(table)
+    return masks, tables
+
+
+KNIGHT_ATTACKS = _leaper_attacks(KNIGHT_DELTAS)
+KING_ATTACKS = _leaper_attacks(KING_DELTAS)
+# PAWN_ATTACKS[0] for white pawns, PAWN_ATTACKS[1] for black ones
+PAWN_ATTACKS = [_leaper_attacks(((-1, -1), (-1, 1))), _leaper_attacks(((1, -1), (1, 1)))]
+
+ROOK_MASKS, ROOK_TABLES = _slider_tables(ROOK_DIRECTIONS)
+BISHOP_MASKS, BISHOP_TABLES = _slider_tables(BISHOP_DIRECTIONS)
+
+
+def _between_table() -> List[List[int]]:
+    # BETWEEN[a][b] holds the squares strictly between two aligned squares
+    table = [[0] * 64 for _ in range(64)]
+    for sq in range(64):
+        for direction in ROOK_DIRECTIONS + BISHOP_DIRECTIONS:
+            bb = 0
+            for s in _ray(sq, direction):
+                table[sq][s] = bb
+                bb |= 1 << s
+    return table
+
+
+BETWEEN = _between_table()
+
+# castling per color: right, squares to be empty, squares the king crosses,
+# rook square and king destination
+CASTLINGS = (
+    ((WHITE_SHORT, 0b11 << 61, (61, 62), 63, 62), (WHITE_LONG, 0b111 << 57, (59, 58), 56, 58)),
+    ((BLACK_SHORT, 0b11 << 5, (5, 6), 7, 6), (BLACK_LONG, 0b111 << 1, (3, 2), 0, 2)),
+)
+KING_SQUARES = (60, 4)
+PROMOTIONS = (QUEEN, ROOK, BISHOP, KNIGHT)
+
+
+def rook_attacks(sq: int, occupied: int) -> int:
+    return ROOK_TABLES[sq][occupied & ROOK_MASKS[sq]]
+
+
+def bishop_attacks(sq: int, occupied: int) -> int:
+    return BISHOP_TABLES[sq][occupied & BISHOP_MASKS[sq]]
+
+
+class BitboardBackend():
+    """Piece placement stored as one bitboard per piece code.
+
+    The backend holds the squares of a ``Board``, which keeps it up to date
+    through ``move_piece``, ``put`` and ``remove``.
+    """
+
+    def __init__(self, squares: bytes) -> None:
+        self.mailbox = bytearray(64)
+        self.sync(squares)
+
+    def sync(self, squares: bytes):
+        """Rebuild every bitboard from the piece code of each square.
+
+        The mailbox is refilled in place, the board holding it keeps seeing it.
+        """
+        self.mailbox[:] = squares
+        self.pieces = [0] * 16
+        self.colors = [0, 0]
+        for sq, code in enumerate(self.mailbox):
+            if code != EMPTY:
+                self.pieces[code] |= 1 << sq
+                self.colors[code >> 3] |= 1 << sq
+        self.occupied = self.colors[0] | self.colors[1]
+
+    def move_piece(self, src: int, dest: int):
+        code = self.mailbox[src]
+        captured = self.mailbox[dest]
+        color = code >> 3
+        if captured != EMPTY:
+            self.pieces[captured] ^= 1 << dest
+            self.colors[captured >> 3] ^= 1 << dest
+        move_bb = 1 << src | 1 << dest
+        self.pieces[code] ^= move_bb
+        self.colors[color] ^= move_bb
+        self.occupied = self.colors[0] | self.colors[1]
+        self.mailbox[src] = EMPTY
+        self.mailbox[dest] = code
+
+    def put(self, sq: int, code: int):
+        """Place a piece on an empty square."""
+        self.mailbox[sq] = code
+        self.pieces[code] |= 1 << sq
+        self.colors[code >> 3] |= 1 << sq
+        self.occupied |= 1 << sq
+
+    def remove(self, sq: int):
+        code = self.mailbox[sq]
+        self.mailbox[sq] = EMPTY
+        self.pieces[code] &= ~(1 << sq)
+        self.colors[code >> 3] &= ~(1 << sq)
+        self.occupied &= ~(1 << sq)
+
+    def attackers(self, sq: int, color: int, occupied: int) -> int:
+        """Pieces of ``color`` attacking ``sq`` given the occupancy."""
+        pieces = self.pieces
+        base = color << 3
+        queens = pieces[base | QUEEN]
+        return ((KNIGHT_ATTACKS[sq] & pieces[base | KNIGHT])
+                | (PAWN_ATTACKS[color ^ 1][sq] & pieces[base | PAWN])
+                | (KING_ATTACKS[sq] & pieces[base | KING])
+                | (BISHOP_TABLES[sq][occupied & BISHOP_MASKS[sq]] & (pieces[base | BISHOP] | queens))
+                | (ROOK_TABLES[sq][occupied & ROOK_MASKS[sq]] & (pieces[base | ROOK] | queens)))
+
+    def in_check(self, white: bool) -> bool:
+        color = 0 if white else 1
+        ksq = self.pieces[color << 3 | KING].bit_length() - 1
+        return self.attackers(ksq, color ^ 1, self.occupied) != 0
+
+    def king_safety(self, color: int):
+        """Find the checks and the pins against the king of ``color``.
+
+        Returns:
+            Tuple: the king square, the bitboard of the checking pieces, and a
+            dict mapping each pinned square to the ray it can move along.
+        """
+        pieces = self.pieces
+        own = self.colors[color]
+        occupied = self.occupied
+        them = (color ^ 1) << 3
+        ksq = pieces[color << 3 | KING].bit_length() - 1
+        queens = pieces[them | QUEEN]
+
+        checkers = ((KNIGHT_ATTACKS[ksq] & pieces[them | KNIGHT])
+                    | (PAWN_ATTACKS[color][ksq] & pieces[them | PAWN]))
+        pins = {}
+        # enemy sliders seeing the king through an empty board
+        snipers = ((ROOK_TABLES[ksq][0] & (pieces[them | ROOK] | queens))
+                   | (BISHOP_TABLES[ksq][0] & (pieces[them | BISHOP] | queens)))
+        between_king = BETWEEN[ksq]
+        while snipers:
+            lsb = snipers & -snipers
+            snipers ^= lsb
+            between = between_king[lsb.bit_length() - 1]
+            blockers = between & occupied
+            if not blockers:
+                checkers |= lsb
+            elif blockers & (blockers - 1) == 0 and blockers & own:
+                pins[blockers.bit_length() - 1] = between | lsb
+        return ksq, checkers, pins
+
+    def _pawn_targets(self, sq: int, color: int) -> int:
+        empty = ~self.occupied & FULL
+        targets = PAWN_ATTACKS[color][sq] & self.colors[color ^ 1]
+        if color == 0:
+            push = 1 << sq >> 8 & empty
+            if push and sq >> 3 == 6:
+                push |= push >> 8 & empty
+        else:
+            push = 1 << sq << 8 & empty
+            if push and sq >> 3 == 1:
+                push |= push << 8 & empty
+        return targets | push
+
+    def _king_targets(self, ksq: int, color: int, checkers: int, state: GameState) -> int:
+        # king moves, looking through the king itself for the attacks, and
+        # castling as a move of two squares when not in check
+        them = color ^ 1
+        occupied = self.occupied
+        without_king = occupied ^ 1 << ksq
+        targets = KING_ATTACKS[ksq] & ~self.colors[color] & FULL
+        safe = 0
+        while targets:
+            lsb = targets & -targets
+            targets ^= lsb
+            if not self.attackers(lsb.bit_length() - 1, them, without_king):
+                safe |= lsb
+        if not checkers and ksq == KING_SQUARES[color]:
+            rooks = self.pieces[color << 3 | ROOK]
+            for right, empty, path, rook, dest in CASTLINGS[color]:
+                if (state.castling_rights & right and not occupied & empty and rooks >> rook & 1
+                        and not any(self.attackers(s, them, occupied) for s in path)):
+                    safe |= 1 << dest
+        return safe
+
+    def _en_passant_sources(self, ksq: int, color: int, check_mask: int, state: GameState) -> int:
+        # pawns that can take en passant without leaving their king in check
+        ep = state.en_passant
+        if ep is None:
+            return 0
+        them = color ^ 1
+        captured = ep - 8 if color else ep + 8
+        if not check_mask & (1 << ep | 1 << captured):
+            return 0
+        pieces = self.pieces
+        queens = pieces[them << 3 | QUEEN]
+        bb = PAWN_ATTACKS[them][ep] & pieces[color << 3 | PAWN]
+        sources = 0
+        while bb:
+            lsb = bb & -bb
+            bb ^= lsb
+            # both pawns leave their squares, so look at the sliders
+            # again with the occupancy after the capture
+            after = self.occupied ^ lsb ^ 1 << captured | 1 << ep
+            if ROOK_TABLES[ksq][after & ROOK_MASKS[ksq]] & (pieces[them << 3 | ROOK] | queens):
+                continue
+            if BISHOP_TABLES[ksq][after & BISHOP_MASKS[ksq]] & (pieces[them << 3 | BISHOP] | queens):
+                continue
+            sources |= lsb
+        return sources
+
+    def generate_possible_moves(self, sq: int, state: GameState) -> List[Tuple[int, int]]:
+        """Generate the legal destinations of the piece on a square.
+
+        Only the moves of that piece are generated, restricted by the check
+        mask and its pin ray, computed once for the position as in
+        generate_moves. Promotions give their destination once.
+        """
+        code = self.mailbox[sq]
+        color = 0 if state.white_turn else 1
+        if code == EMPTY or code >> 3 != color:
+            return []
+        ksq, checkers, pins = self.king_safety(color)
+        kind = code & 7
+        if kind == KING:
+            targets = self._king_targets(ksq, color, checkers, state)
+        elif checkers & (checkers - 1):
+            # double check, only the king can move
+            return []
+        else:
+            check_mask = BETWEEN[ksq][checkers.bit_length() - 1] | checkers if checkers else FULL
+            occupied = self.occupied
+            if kind == PAWN:
+                targets = self._pawn_targets(sq, color) & check_mask
+                if self._en_passant_sources(ksq, color, check_mask, state) >> sq & 1:
+                    targets |= 1 << state.en_passant
+            elif kind == KNIGHT:
+                targets = KNIGHT_ATTACKS[sq] & check_mask
+            elif kind == BISHOP:
+                targets = BISHOP_TABLES[sq][occupied & BISHOP_MASKS[sq]] & check_mask
+            elif kind == ROOK:
+                targets = ROOK_TABLES[sq][occupied & ROOK_MASKS[sq]] & check_mask
+            else:
+                targets = (BISHOP_TABLES[sq][occupied & BISHOP_MASKS[sq]]
+                           | ROOK_TABLES[sq][occupied & ROOK_MASKS[sq]]) & check_mask
+            targets &= ~self.colors[color]
+            if sq in pins:
+                targets &= pins[sq]
+        moves = []
+        while targets:
+            lsb = targets & -targets
+            targets ^= lsb
+            moves.append(COORDS[lsb.bit_length() - 1])
+        return moves
+
+    def generate_moves(self, state: GameState) -> List[int]:
+        """Generate the legal moves of the side to move.
+
+        Checks and pins are computed once for the position: pieces other than
+        the king may only land on the check mask, and pinned pieces only along
+        their pin ray, so no move has to be played to be validated.
+
+        Returns:
+            List[int]: moves packed as ``src | dest << 6 | promotion << 12``.
+        """
+        white = state.white_turn
+        color = 0 if white else 1
+        them = color ^ 1
+        own = self.colors[color]
+        not_own = ~own & FULL
+        occupied = self.occupied
+        pieces = self.pieces
+        base = color << 3
+        moves = []
+        append = moves.append
+
+        ksq, checkers, pins = self.king_safety(color)
+
+        targets = self._king_targets(ksq, color, checkers, state)
+        while targets:
+            lsb = targets & -targets
+            targets ^= lsb
+            append(ksq | (lsb.bit_length() - 1) << 6)
+
+        if checkers & (checkers - 1):
+            # double check, only the king can move
+            return moves
+        check_mask = BETWEEN[ksq][checkers.bit_length() - 1] | checkers if checkers else FULL
+        pinned = 0
+        for sq in pins:
+            pinned |= 1 << sq
+
+        # pawns that are not pinned are generated set-wise, one shift per kind of move
+        pawns = pieces[base | PAWN]
+        free_pawns = pawns & ~pinned
+        empty = ~occupied & FULL
+        enemy = self.colors[them]
+        if white:
+            single = free_pawns >> 8 & empty
+            double = (single & ROW_BB[5]) >> 8 & empty & check_mask
+            left = (free_pawns & ~COL_BB[0]) >> 9 & enemy & check_mask
+            right = (free_pawns & ~COL_BB[7]) >> 7 & enemy & check_mask
+            deltas = ((single & check_mask, 8), (double, 16), (left, 9), (right, 7))
+            last_row = ROW_BB[0]
+        else:
+            single = free_pawns << 8 & empty
+            double = (single & ROW_BB[2]) << 8 & empty & check_mask
+            left = (free_pawns & ~COL_BB[0]) << 7 & enemy & check_mask
+            right = (free_pawns & ~COL_BB[7]) << 9 & enemy & check_mask
+            deltas = ((single & check_mask, -8), (double, -16), (left, -7), (right, -9))
+            last_row = ROW_BB[7]
+        for bb, delta in deltas:
+            while bb:
+                lsb = bb & -bb
+                bb ^= lsb
+                dest = lsb.bit_length() - 1
+                if lsb & last_row:
+                    for promotion in PROMOTIONS:
+                        append(dest + delta | dest << 6 | promotion << 12)
+                else:
+                    append(dest + delta | dest << 6)
+        bb = pawns & pinned
+        while bb:
+            lsb = bb & -bb
+            bb ^= lsb
+            src = lsb.bit_length() - 1
+            targets = self._pawn_targets(src, color) & check_mask & pins[src]
+            while targets:
+                lsb = targets & -targets
+                targets ^= lsb
+                if lsb & last_row:
+                    for promotion in PROMOTIONS:
+                        append(src | (lsb.bit_length() - 1) << 6 | promotion << 12)
+                else:
+                    append(src | (lsb.bit_length() - 1) << 6)
+
+        bb = self._en_passant_sources(ksq, color, check_mask, state) if state.en_passant is not None else 0
+        while bb:
+            lsb = bb & -bb
+            bb ^= lsb
+            append(lsb.bit_length() - 1 | state.en_passant << 6)
+
+        for kind in (KNIGHT, BISHOP, ROOK, QUEEN):
+            bb = pieces[base | kind]
+            while bb:
+                lsb = bb & -bb
+                src = lsb.bit_length() - 1
+                bb ^= lsb
+                if kind == KNIGHT:
+                    targets = KNIGHT_ATTACKS[src] & not_own & check_mask
+                elif kind == BISHOP:
+                    targets = BISHOP_TABLES[src][occupied & BISHOP_MASKS[src]] & not_own & check_mask
+                elif kind == ROOK:
+                    targets = ROOK_TABLES[src][occupied & ROOK_MASKS[src]] & not_own & check_mask
+                else:
+                    targets = (BISHOP_TABLES[src][occupied & BISHOP_MASKS[src]] | ROOK_TABLES[src][occupied & ROOK_MASKS[src]]) & not_own & check_mask
+                if lsb & pinned:
+                    targets &= pins[src]
+                while targets:
+                    lsb = targets & -targets
+                    append(src | (lsb.bit_length() - 1) << 6)
+                    targets ^= lsb
+        return moves
@@ -1,6 +1,10 @@
+from array import array
+import re
 from enum import Enum
 from typing import List, Tuple, Union
 
+from zobrist import CASTLING_KEYS, EN_PASSANT_KEYS, PIECE_KEYS, WHITE_TURN_KEY, en_passant_counts, position_key
+
 class PieceColor(Enum):
     WHITE = "white"
     BLACK = "black"
@@ -18,9 +22,22 @@ class PieceType(str, Enum):
 
 
 class Piece():
-    def __init__(self, ptype, pcolor):
-        self.type_: PieceType = ptype
-        self.color_: PieceColor = pcolor
+    """A piece type and color. Pieces are immutable and interned: creating a
+    piece returns the one instance shared by every piece of its type and color."""
+    __slots__ = ("type_", "color_")
+    __interned = {}
+
+    def __new__(cls, ptype, pcolor):
+        piece = cls.__interned.get((ptype, pcolor))
+        if piece is None:
+            piece = super().__new__(cls)
+            piece.type_ = ptype
+            piece.color_ = pcolor
+            cls.__interned[(ptype, pcolor)] = piece
+        return piece
+
+    def __reduce__(self):
+        return (Piece, (self.type_, self.color_))
     
     @property
     def color(self):
@@ -35,15 +52,124 @@ class Piece():
 
 
 
+# integer piece codes shared by the position backends: the low three bits
+# hold the type and the BLACK bit the color, 0 is an empty square
+EMPTY = 0
+BLACK = 8
+TYPE_CODES = {
+    PieceType.PAWN: 1,
+    PieceType.KNIGHT: 2,
+    PieceType.BISHOP: 3,
+    PieceType.ROOK: 4,
+    PieceType.QUEEN: 5,
+    PieceType.KING: 6,
+}
+PAWN, KNIGHT, BISHOP, ROOK, QUEEN, KING = (TYPE_CODES[t] for t in PieceType)
+
+BACKENDS = ("mailbox", "bitboard")
+
+# castling rights bits
+WHITE_SHORT = 1
+WHITE_LONG = 2
+BLACK_SHORT = 4
+BLACK_LONG = 8
+
+# rights still available after a move touching the square: moving the king or
+# a rook, or capturing a rook on its original square, loses the right
+CASTLING_MASKS = [15] * 64
+CASTLING_MASKS[60] = 15 & ~(WHITE_SHORT | WHITE_LONG)
+CASTLING_MASKS[63] = 15 & ~WHITE_SHORT
+CASTLING_MASKS[56] = 15 & ~WHITE_LONG
+CASTLING_MASKS[4] = 15 & ~(BLACK_SHORT | BLACK_LONG)
+CASTLING_MASKS[7] = 15 & ~BLACK_SHORT
+CASTLING_MASKS[0] = 15 & ~BLACK_LONG
+
+# moves are packed in an int as src | dest << 6 | promotion << 12, where the
+# promotion is the type code of the new piece
+PROMOTION_TYPES = (PieceType.QUEEN, PieceType.ROOK, PieceType.BISHOP, PieceType.KNIGHT)
+CODE_TYPES = {code: ptype for ptype, code in TYPE_CODES.items()}
+
+# a move in standard algebraic notation, without castling, check marks and
+# annotations: piece letter, origin file and rank, destination and promotion
+SAN_PATTERN = re.compile(r"([NBRQK])?([a-h])?([1-8])?x?([a-h][1-8])(=?[NBRQnbrq])?$")
+
+# an undo record packs the move with the state it overwrites in a single int:
+# move | captured code << 16 | castling rights << 20 | en passant << 24 |
+# halfmove clock << 31, where an en passant square of 64 means none
+NO_EN_PASSANT = 64
+
+
+def piece_code(piece: Union[Piece, None]) -> int:
+    if piece is None:
+        return EMPTY
+    return TYPE_CODES[piece.type] | (BLACK if piece.color == PieceColor.BLACK else 0)
+
+def _flyweights() -> List[Union[Piece, None]]:
+    pieces = [None] * 16
+    for ptype, code in TYPE_CODES.items():
+        pieces[code] = Piece(ptype, PieceColor.WHITE)
+        pieces[code | BLACK] = Piece(ptype, PieceColor.BLACK)
+    return pieces
+
+# the Piece of each code, None for EMPTY
+PIECES = _flyweights()
+
+def square(row: int, col: int) -> int:
+    """Index of a square, a8 is 0 and h1 is 63."""
+    return row * 8 + col
+
+ORTHOGONAL = ((-1, 0), (1, 0), (0, -1), (0, 1))
+DIAGONAL = ((-1, -1), (-1, 1), (1, -1), (1, 1))
+KNIGHT_JUMPS = ((2, -1), (2, 1), (-2, -1), (-2, 1), (-1, -2), (-1, 2), (1, -2), (1, 2))
+
+def square_name(sq: int) -> str:
+    return f"{'abcdefgh'[sq & 7]}{8 - (sq >> 3)}"
+
+def move_to_uci(move: int) -> str:
+    """Long algebraic notation of a packed move, e.g. e2e4 or e7e8q."""
+    promotion = move >> 12
+    return square_name(move & 63) + square_name(move >> 6 & 63) + (CODE_TYPES[promotion].value if promotion else "")
+
+def uci_to_move(text: str) -> int:
+    """Pack a move given in long algebraic notation, e.g. e2e4 or e7e8q.
+
+    The move is not checked against the position.
+    """
+    if len(text) not in (4, 5) or text[0] not in "abcdefgh" or text[2] not in "abcdefgh" or text[1] not in "12345678" or text[3] not in "12345678":
+        raise ValueError(f"invalid move {text!r}")
+    src = square(8 - int(text[1]), "abcdefgh".index(text[0]))
+    dest = square(8 - int(text[3]), "abcdefgh".index(text[2]))
+    promotion = TYPE_CODES[PieceType(text[4])] if len(text) == 5 else 0
+    return src | dest << 6 | promotion << 12
+
 def is_in(p0, p1):
     return (0<= p0<8) and (0 <= p1 < 8)
 
+def _castling_flag(right: int) -> property:
+    def getter(self) -> bool:
+        return bool(self.castling_rights & right)
+
+    def setter(self, value: bool):
+        if value:
+            self.castling_rights |= right
+        else:
+            self.castling_rights &= ~right
+    return property(getter, setter)
+
 class GameState():
+    __slots__ = ("castling_rights", "en_passant", "white_in_check", "black_in_check", "white_turn", "fisher_random",
+                 "__selected_piece", "__selected_piece_possible_moves", "__moves", "last_move", "halfmove_clock",
+                 "fullmove_number", "undo_stack", "key", "key_history", "draw")
+
+    white_can_castle_short = _castling_flag(WHITE_SHORT)
+    white_can_castle_long = _castling_flag(WHITE_LONG)
+    black_can_castle_short = _castling_flag(BLACK_SHORT)
+    black_can_castle_long = _castling_flag(BLACK_LONG)
+
     def __init__(self):
-        self.white_can_castle_short = True
-        self.black_can_castle_short = True
-        self.white_can_castle_long = True
-        self.black_can_castle_long = True
+        self.castling_rights = WHITE_SHORT | WHITE_LONG | BLACK_SHORT | BLACK_LONG
+        # square skipped by a pawn double push in the last move, if any
+        self.en_passant: Union[int, None] = None
         self.white_in_check = False
         self.black_in_check = False
         self.white_turn = True
@@ -52,6 +178,16 @@ class GameState():
         self.__selected_piece_possible_moves = None
         self.__moves = []
         self.last_move = None
+        # half moves since the last capture or pawn move, and move number
+        self.halfmove_clock = 0
+        self.fullmove_number = 1
+        # undo records of the moves played, see Board.make_move
+        self.undo_stack = array('Q')
+        # zobrist key of the position and the keys before each undo record
+        self.key = 0
+        self.key_history = array('Q')
+        # draw claimed after the last move played with Board.move, if any
+        self.draw: Union[str, None] = None
     
     @property
     def selected_piece(self):
@@ -79,24 +215,117 @@ class GameState():
     def add_move(self, move):
         if self.white_turn:
             self.moves.append((move, None))
+        elif not self.moves:
+            # the game was set up with black to move
+            self.moves.append(("...", move))
         else:
             self.moves[-1] = (self.moves[-1][0], move)
     
+    def remove_move(self):
+        """Remove the name of the last move, undoing add_move."""
+        white, black = self.moves[-1]
+        if black is None or white == "...":
+            self.moves.pop()
+        else:
+            self.moves[-1] = (white, None)
+
     def game_started(self):
         return len(self.moves) > 0
 
+    def repetitions(self) -> int:
+        """How many times the position occurred before.
+
+        Only the positions since the last capture or pawn move, with the same
+        side to move, are looked at: the halfmove clock bounds the scan, so it
+        is cheap enough for every node of a search.
+        """
+        if self.halfmove_clock < 4:
+            return 0
+        history = self.key_history
+        end = len(history)
+        start = max(0, end - self.halfmove_clock)
+        start += (end - start) & 1
+        return history[start:end:2].count(self.key)
+
 class Board():
-    
-    def __init__(self):
+    __slots__ = ("__backend", "move_cache", "clock", "__state", "__squares", "__bitboards")
+
+    def __init__(self, backend: str = "mailbox", move_cache=None, clock=None):
+        """Create a board in the starting position.
+
+        Args:
+            backend (str): position representation used for move generation,
+                "mailbox" walks the 8x8 board, "bitboard" uses 64-bit bitboards.
+            move_cache (tt.MoveCache, optional): cache of the destinations
+                returned by generate_possible_moves, keyed by position.
+            clock (timer.Clock, optional): clock pressed by move(), set back by reset().
+        """
+        if backend not in BACKENDS:
+            raise ValueError(f"unknown backend {backend!r}, expected one of {BACKENDS}")
+        self.__backend = backend
+        self.move_cache = move_cache
+        self.clock = clock
         self.reset()
     
     def reset(self):
-        self.__state = GameState()
-        self.__board = self._init_board()
+        self.set_position(self._init_board(), GameState())
+        if self.clock is not None:
+            self.clock.reset()
+
+    def set_position(self, rows: List[List[Union[Piece, None]]], state: GameState):
+        """Replace the position with the given one.
+
+        Args:
+            rows (List[List[Piece | None]]): the 8x8 board, row 0 is the 8th rank
+            state (GameState): side to move, castling rights and clocks
+        """
+        self.set_squares(bytes(piece_code(p) for row in rows for p in row), state)
+
+    def set_squares(self, squares: bytes, state: GameState):
+        """Replace the position with the given one.
+
+        Args:
+            squares (bytes): the piece code of each square, from a8 to h1
+            state (GameState): side to move, castling rights and clocks
+        """
+        self.__state = state
+        self.__bitboards = None
+        if self.__backend == "bitboard":
+            from bitboard import BitboardBackend
+            self.__bitboards = BitboardBackend(squares)
+            # the backend keeps its mailbox up to date, the board reads it
+            self.__squares = self.__bitboards.mailbox
+        else:
+            self.__squares = bytearray(squares)
+        state.key = position_key(self.__squares, state.white_turn, state.castling_rights, state.en_passant)
+        check = self.in_check()
+        state.white_in_check = check and state.white_turn
+        state.black_in_check = check and not state.white_turn
+    
+    @property
+    def backend(self) -> str:
+        return self.__backend
+
+    @property
+    def key(self) -> int:
+        """64-bit zobrist key of the position, equal to its Polyglot key."""
+        return self.__state.key
+
+    @property
+    def bitboards(self):
+        """The bitboard backend mirroring the board, None for the mailbox backend."""
+        return self.__bitboards
     
     @property
-    def board(self) -> List[Piece | None]:
-        return self.__board
+    def board(self) -> List[List[Piece | None]]:
+        """A copy of the board as 8 rows of pieces, row 0 is the 8th rank."""
+        squares = self.__squares
+        return [[PIECES[code] for code in squares[i:i + 8]] for i in range(0, 64, 8)]
+
+    @property
+    def squares(self) -> bytearray:
+        """The piece code of each square, from a8 to h1. Not to be modified."""
+        return self.__squares
     
     @property
     def state(self) -> GameState:
@@ -123,6 +352,10 @@ class Board():
         return board
     
     def select(self, row:int, col:int):
+        # nothing can be moved once the game is over
+        if self.result() is not None:
+            self.state.selected_piece = None
+            return
         piece = self.at(row, col)
         turn = PieceColor.WHITE if self.state.white_turn else PieceColor.BLACK
         # the cell is not empty
@@ -140,7 +373,7 @@ class Board():
 
     def can_move(self, src_pos, dest_pos) -> bool:
         sx, sy = src_pos
-        src_piece = self.board[sx][sy]
+        src_piece = self.at(sx, sy)
         
         if src_piece:
             if dest_pos in self.state.possible_moves:
@@ -149,13 +382,40 @@ class Board():
             return False
     
     def generate_possible_moves(self, src_pos):
+        """Generate the legal destinations of the piece on src_pos.
+
+        Args:
+            src_pos (Tuple[int, int]): row and col of the piece
+
+        Returns:
+            List[Tuple[int, int]]: the cells the piece can move to, empty if it is
+            not the turn of the piece. Castling is a king move of two cells.
+        """
         sx, sy = src_pos
-        src_piece: Piece = self.board[sx][sy]
-        moves = []
+        src_piece: Piece = self.at(sx, sy)
 
-        if (src_piece.color == PieceColor.WHITE and not self.state.white_turn) or (src_piece.color == PieceColor.BLACK and self.state.white_turn):
-            return moves
+        if src_piece is None or (src_piece.color == PieceColor.WHITE) != self.state.white_turn:
+            return []
+
+        cache = self.move_cache
+        if cache is not None:
+            moves = cache.get(self.key, square(sx, sy))
+            if moves is not None:
+                return moves
         
+        if self.__bitboards is not None:
+            moves = self.__bitboards.generate_possible_moves(square(sx, sy), self.state)
+        else:
+            moves = self.__legal_moves_from(src_pos, self.__king_safety(src_piece.color))
+
+        if cache is not None:
+            cache.put(self.key, square(sx, sy), moves)
+        return moves
+
+    def __pseudo_legal_moves(self, src_pos):
+        sx, sy = src_pos
+        src_piece: Piece = self.at(sx, sy)
+        moves = []
 
         def diagonal_moves(max_range=8):
             # look on the four diagonals
@@ -295,53 +555,514 @@ class Board():
         elif src_piece.type is PieceType.KING:
             diagonal_moves(max_range=2)
             horizontal_moves(max_range=2)
-            # cannot move in position under checks
-
-            # add castling
         
         
         return moves
+
+    def __find_king(self, color: PieceColor) -> Tuple[int, int]:
+        for row in range(8):
+            for col in range(8):
+                p = self.at(row, col)
+                if p is not None and p.type is PieceType.KING and p.color == color:
+                    return (row, col)
+        raise ValueError(f"no {color.value} king on the board")
+
+    def __is_attacked(self, pos, by_color: PieceColor, ignore=None) -> bool:
+        """Tell whether a cell is attacked by the pieces of by_color.
+
+        Args:
+            pos (Tuple[int, int]): the cell
+            by_color (PieceColor): color of the attacking side
+            ignore (Tuple[int, int], optional): a cell considered empty, used to
+                look through the king when it moves along a checking ray.
+        """
+        r, c = pos
+        for point in ((r+dr, c+dc) for dr, dc in KNIGHT_JUMPS):
+            if is_in(*point):
+                p = self.at(*point)
+                if p is not None and p.color == by_color and p.type is PieceType.KNIGHT:
+                    return True
+
+        # pawns attack forward, so look one row behind the cell
+        pawn_row = r + 1 if by_color == PieceColor.WHITE else r - 1
+        for point in ((pawn_row, c-1), (pawn_row, c+1)):
+            if is_in(*point):
+                p = self.at(*point)
+                if p is not None and p.color == by_color and p.type is PieceType.PAWN:
+                    return True
+
+        for directions, slider in ((ORTHOGONAL, PieceType.ROOK), (DIAGONAL, PieceType.BISHOP)):
+            for dr, dc in directions:
+                for i in range(1, 8):
+                    point = (r + i*dr, c + i*dc)
+                    if not is_in(*point):
+                        break
+                    p = self.at(*point)
+                    if p is None or point == ignore:
+                        continue
+                    if p.color == by_color and (p.type is slider or p.type is PieceType.QUEEN or (i == 1 and p.type is PieceType.KING)):
+                        return True
+                    break
+        return False
+
+    def __king_safety(self, color: PieceColor):
+        """Find the checks and the pins against the king of a side.
+
+        Every ray leaving the king is walked once: an enemy slider reached
+        directly gives check, one reached through a single friendly piece pins
+        that piece to the ray.
+
+        Returns:
+            Tuple: the king cell, the number of checking pieces, the cells a
+            move must land on to stop the check (None when not in check) and a
+            dict mapping each pinned cell to the cells of its ray.
+        """
+        king = self.__find_king(color)
+        kr, kc = king
+        checkers = 0
+        check_mask = None
+        pins = {}
+
+        for directions, slider in ((ORTHOGONAL, PieceType.ROOK), (DIAGONAL, PieceType.BISHOP)):
+            for dr, dc in directions:
+                ray = []
+                blocker = None
+                for i in range(1, 8):
+                    point = (kr + i*dr, kc + i*dc)
+                    if not is_in(*point):
+                        break
+                    ray.append(point)
+                    p = self.at(*point)
+                    if p is None:
+                        continue
+                    if p.color == color:
+                        if blocker is not None:
+                            break
+                        blocker = point
+                        continue
+                    if p.type is slider or p.type is PieceType.QUEEN:
+                        if blocker is None:
+                            checkers += 1
+                            check_mask = set(ray)
+                        else:
+                            pins[blocker] = set(ray)
+                    break
+
+        for point in ((kr+dr, kc+dc) for dr, dc in KNIGHT_JUMPS):
+            if is_in(*point):
+                p = self.at(*point)
+                if p is not None and p.color != color and p.type is PieceType.KNIGHT:
+                    checkers += 1
+                    check_mask = {point}
+
+        pawn_row = kr - 1 if color == PieceColor.WHITE else kr + 1
+        for point in ((pawn_row, kc-1), (pawn_row, kc+1)):
+            if is_in(*point):
+                p = self.at(*point)
+                if p is not None and p.color != color and p.type is PieceType.PAWN:
+                    checkers += 1
+                    check_mask = {point}
+
+        return king, checkers, check_mask, pins
+
+    def __legal_moves_from(self, src_pos, safety):
+        king, checkers, check_mask, pins = safety
+        src_piece: Piece = self.at(*src_pos)
+        enemy = PieceColor.BLACK if src_piece.color == PieceColor.WHITE else PieceColor.WHITE
+
+        if src_piece.type is PieceType.KING:
+            moves = [m for m in self.__pseudo_legal_moves(src_pos) if not self.__is_attacked(m, enemy, ignore=src_pos)]
+            if checkers == 0:
+                moves.extend(self.__castling_moves(src_pos, src_piece.color))
+            return moves
+
+        # in double check only the king can move
+        if checkers > 1:
+            return []
+
+        moves = self.__pseudo_legal_moves(src_pos)
+        if src_pos in pins:
+            moves = [m for m in moves if m in pins[src_pos]]
+        if check_mask is not None:
+            moves = [m for m in moves if m in check_mask]
+
+        if src_piece.type is PieceType.PAWN and self.state.en_passant is not None:
+            sx, sy = src_pos
+            ep = divmod(self.state.en_passant, 8)
+            forward = -1 if src_piece.color == PieceColor.WHITE else 1
+            if ep[0] == sx + forward and abs(ep[1] - sy) == 1 and self.__en_passant_is_legal(src_pos, ep, king, enemy):
+                moves.append(ep)
+        return moves
+
+    def __en_passant_is_legal(self, src_pos, dest_pos, king, enemy) -> bool:
+        # the captured pawn leaves a cell that is not the destination, which
+        # the pin and check masks cannot describe (e.g. both pawns shielding
+        # the king on a row), so lift the pawns and look at the king
+        sx, sy = src_pos
+        dx, dy = dest_pos
+        squares = self.__squares
+        src, dest, taken = square(sx, sy), square(dx, dy), square(sx, dy)
+        pawn, captured = squares[src], squares[taken]
+        squares[src] = squares[taken] = EMPTY
+        squares[dest] = pawn
+        legal = not self.__is_attacked(king, enemy)
+        squares[src], squares[taken], squares[dest] = pawn, captured, EMPTY
+        return legal
+
+    def __castling_moves(self, king_pos, color: PieceColor):
+        if color == PieceColor.WHITE:
+            row, short, long = 7, WHITE_SHORT, WHITE_LONG
+            enemy = PieceColor.BLACK
+        else:
+            row, short, long = 0, BLACK_SHORT, BLACK_LONG
+            enemy = PieceColor.WHITE
+        if king_pos != (row, 4):
+            return []
+
+        def has_rook(col):
+            p = self.at(row, col)
+            return p is not None and p.color == color and p.type is PieceType.ROOK
+
+        moves = []
+        rights = self.state.castling_rights
+        if rights & short and has_rook(7) and self.at(row, 5) is None and self.at(row, 6) is None:
+            if not self.__is_attacked((row, 5), enemy) and not self.__is_attacked((row, 6), enemy):
+                moves.append((row, 6))
+        if rights & long and has_rook(0) and self.at(row, 1) is None and self.at(row, 2) is None and self.at(row, 3) is None:
+            if not self.__is_attacked((row, 3), enemy) and not self.__is_attacked((row, 2), enemy):
+                moves.append((row, 2))
+        return moves
+
+    def in_check(self, white: Union[bool, None] = None) -> bool:
+        """Tell whether a side is in check, the side to move by default."""
+        if white is None:
+            white = self.state.white_turn
+        if self.__bitboards is not None:
+            return self.__bitboards.in_check(white)
+        color, enemy = (PieceColor.WHITE, PieceColor.BLACK) if white else (PieceColor.BLACK, PieceColor.WHITE)
+        return self.__is_attacked(self.__find_king(color), enemy)
+
+    def generate_moves(self) -> List[int]:
+        """Generate the legal moves of the side to move.
+
+        Returns:
+            List[int]: moves packed as ``src | dest << 6 | promotion << 12``, one
+            per promotion piece when a pawn reaches the last row.
+        """
+        if self.__bitboards is not None:
+            return self.__bitboards.generate_moves(self.state)
+        color = PieceColor.WHITE if self.state.white_turn else PieceColor.BLACK
+        safety = self.__king_safety(color)
+        moves = []
+        for sx in range(8):
+            for sy in range(8):
+                p = self.at(sx, sy)
+                if p is None or p.color != color:
+                    continue
+                src = square(sx, sy)
+                for dest in self.__legal_moves_from((sx, sy), safety):
+                    m = src | square(*dest) << 6
+                    if p.type is PieceType.PAWN and dest[0] in (0, 7):
+                        moves.extend(m | TYPE_CODES[t] << 12 for t in PROMOTION_TYPES)
+                    else:
+                        moves.append(m)
+        return moves
     
-    def move(self, src, dest):
+    def move(self, src, dest, promotion: PieceType = PieceType.QUEEN):
+        """Play a move, which must be legal, and record its name.
+
+        Args:
+            src (Tuple[int, int]): cell of the moving piece
+            dest (Tuple[int, int]): destination cell, two cells aside the king
+                for castling and the skipped cell for en passant
+            promotion (PieceType): piece a pawn reaching the last row becomes
+
+        Returns:
+            bool: False when the game is over and the move was not played.
+        """
+        # a side whose time ran out since the last tick loses before moving
+        if self.clock is not None:
+            self.clock.check_flag()
+        if self.result() is not None:
+            return False
         sx, sy = src
         dx, dy = dest
-        self.state.add_move(self.__generate_move_name(src, dest))
-        self.board[sx][sy], self.board[dx][dy] = None, self.board[sx][sy]
-        self.state.selected_piece = None
-        self.state.possible_moves = None
-        
-        self.state.white_turn = not self.state.white_turn
-        self.state.last_move = (src, dest)
-    
-    def __generate_move_name(self, src, dest, castle=None):
+        state = self.state
+        piece = self.at(sx, sy)
+
+        promotes = piece.type is PieceType.PAWN and dx in (0, 7)
+
+        move = square(sx, sy) | square(dx, dy) << 6 | (TYPE_CODES[promotion] << 12 if promotes else 0)
+        state.add_move(self.move_to_san(move))
+        self.make_move(move)
+        if self.clock is not None:
+            self.clock.press()
+
+        state.selected_piece = None
+        state.possible_moves = None
+        state.last_move = (src, dest)
+        self.__update_check()
+        # draws are claimed as soon as they can be
+        state.draw = self.draw_claim()
+        if state.draw and self.clock is not None:
+            self.clock.stop()
+        return True
+
+    def takeback(self):
+        """Take back the last move played with move()."""
+        state = self.state
+        if not state.undo_stack:
+            return
+        self.unmake_move()
+        state.remove_move()
+        if self.clock is not None:
+            self.clock.switch()
+        state.selected_piece = None
+        state.possible_moves = None
+        if state.undo_stack:
+            last = state.undo_stack[-1]
+            state.last_move = (divmod(last & 63, 8), divmod(last >> 6 & 63, 8))
+        else:
+            state.last_move = None
+        state.draw = None
+        self.__update_check()
+
+    def result(self) -> Union[Tuple[str, str], None]:
+        """The result of the game played with move() once it is over, else None.
+
+        Returns:
+            Tuple[str, str] | None: the score, 1-0, 0-1 or 1/2-1/2, and how it
+                ended, "on time" when a side ran out of time, else the draw
+                claimed, see draw_claim.
+        """
+        if self.clock is not None and self.clock.flagged is not None:
+            return ("0-1" if self.clock.flagged else "1-0"), "on time"
+        if self.state.draw is not None:
+            return "1/2-1/2", self.state.draw
+        return None
+
+    def draw_claim(self) -> Union[str, None]:
+        """The draw the side to move can claim in the position, if any.
+
+        Returns:
+            str | None: "threefold repetition" when the position occurred twice
+                before, "fifty-move rule" after fifty moves of each side without
+                capture or pawn move, unless the last one mated, else None.
+        """
+        state = self.state
+        if state.repetitions() >= 2:
+            return "threefold repetition"
+        if state.halfmove_clock >= 100 and not (self.in_check() and not self.generate_moves()):
+            return "fifty-move rule"
+        return None
+
+    def __update_check(self):
+        state = self.state
+        check = self.in_check()
+        state.white_in_check = check and state.white_turn
+        state.black_in_check = check and not state.white_turn
 
-        if castle:
-            if castle == 's':
-                return "O-O"
+    def make_move(self, move: int):
+        """Play a legal packed move, pushing an undo record on the game state.
+
+        Unlike move() the name of the move is not recorded and the check flags
+        are not refreshed, which keeps it cheap enough for searches.
+
+        Args:
+            move (int): ``src | dest << 6 | promotion << 12``, as generated by
+                generate_moves()
+        """
+        state = self.__state
+        squares = self.__squares
+        bitboards = self.__bitboards
+        src = move & 63
+        dest = move >> 6 & 63
+        code = squares[src]
+        captured = squares[dest]
+        ep = state.en_passant
+        color = code & BLACK
+
+        state.undo_stack.append(move | captured << 16 | state.castling_rights << 20
+                                | (NO_EN_PASSANT if ep is None else ep) << 24 | state.halfmove_clock << 31)
+        key = state.key
+        state.key_history.append(key)
+        if en_passant_counts(squares, ep, state.white_turn):
+            key ^= EN_PASSANT_KEYS[ep & 7]
+
+        # with bitboards the backend updates the squares
+        if bitboards is not None:
+            bitboards.move_piece(src, dest)
+        else:
+            squares[src] = EMPTY
+            squares[dest] = code
+        key ^= PIECE_KEYS[code][src] ^ PIECE_KEYS[code][dest]
+        if captured:
+            key ^= PIECE_KEYS[captured][dest]
+
+        state.en_passant = None
+        if code & 7 == PAWN:
+            state.halfmove_clock = 0
+            if dest == ep:
+                taken = src & 56 | dest & 7
+                if bitboards is not None:
+                    bitboards.remove(taken)
+                else:
+                    squares[taken] = EMPTY
+                key ^= PIECE_KEYS[code ^ BLACK][taken]
+            elif dest - src in (16, -16):
+                state.en_passant = (src + dest) >> 1
+            elif move >> 12:
+                promoted = move >> 12 | color
+                if bitboards is not None:
+                    bitboards.remove(dest)
+                    bitboards.put(dest, promoted)
+                else:
+                    squares[dest] = promoted
+                key ^= PIECE_KEYS[code][dest] ^ PIECE_KEYS[promoted][dest]
+        else:
+            state.halfmove_clock = 0 if captured else state.halfmove_clock + 1
+            if code & 7 == KING and dest - src in (2, -2):
+                rook_src, rook_dest = (src + 3, src + 1) if dest > src else (src - 4, src - 1)
+                if bitboards is not None:
+                    bitboards.move_piece(rook_src, rook_dest)
+                else:
+                    squares[rook_src], squares[rook_dest] = EMPTY, squares[rook_src]
+                rook = PIECE_KEYS[ROOK | color]
+                key ^= rook[rook_src] ^ rook[rook_dest]
+
+        rights = state.castling_rights
+        state.castling_rights = rights & CASTLING_MASKS[src] & CASTLING_MASKS[dest]
+        key ^= CASTLING_KEYS[rights] ^ CASTLING_KEYS[state.castling_rights]
+        if not state.white_turn:
+            state.fullmove_number += 1
+        state.white_turn = not state.white_turn
+        if en_passant_counts(squares, state.en_passant, state.white_turn):
+            key ^= EN_PASSANT_KEYS[state.en_passant & 7]
+        state.key = key ^ WHITE_TURN_KEY
+
+    def unmake_move(self):
+        """Take back the last move played with make_move()."""
+        state = self.__state
+        squares = self.__squares
+        bitboards = self.__bitboards
+        record = state.undo_stack.pop()
+        src = record & 63
+        dest = record >> 6 & 63
+        captured = record >> 16 & 15
+        ep = record >> 24 & 127
+
+        state.white_turn = not state.white_turn
+        if not state.white_turn:
+            state.fullmove_number -= 1
+        state.castling_rights = record >> 20 & 15
+        state.en_passant = None if ep == NO_EN_PASSANT else ep
+        state.halfmove_clock = record >> 31
+        state.key = state.key_history.pop()
+
+        code = squares[dest]
+        if bitboards is not None:
+            if record >> 12 & 7:
+                code = PAWN | code & BLACK
+                bitboards.remove(dest)
+                bitboards.put(dest, code)
+            bitboards.move_piece(dest, src)
+            if captured:
+                bitboards.put(dest, captured)
+        else:
+            if record >> 12 & 7:
+                code = PAWN | code & BLACK
+            squares[src] = code
+            squares[dest] = captured
+
+        if code & 7 == PAWN:
+            if dest == ep:
+                taken = src & 56 | dest & 7
+                if bitboards is not None:
+                    bitboards.put(taken, code ^ BLACK)
+                else:
+                    squares[taken] = code ^ BLACK
+        elif code & 7 == KING and dest - src in (2, -2):
+            rook_src, rook_dest = (src + 3, src + 1) if dest > src else (src - 4, src - 1)
+            if bitboards is not None:
+                bitboards.move_piece(rook_dest, rook_src)
             else:
-                return "O-O-O"
+                squares[rook_src], squares[rook_dest] = squares[rook_dest], EMPTY
 
-        def coord_to_cell_name(x,y):  
-            return f"{'abcdefgh'[y]}{8-x}"
+    def move_to_san(self, move: int) -> str:
+        """Standard algebraic notation of a legal packed move, e.g. Nbd7, exd6 or e8=Q#."""
+        squares = self.__squares
+        src = move & 63
+        dest = move >> 6 & 63
+        piece = PIECES[squares[src]]
+        ptype = piece.type
+        if ptype is PieceType.KING and (dest & 7) - (src & 7) in (2, -2):
+            san = "O-O" if dest > src else "O-O-O"
+        elif ptype is PieceType.PAWN:
+            # a pawn changing column always captures, en passant lands on an empty cell
+            san = f"{square_name(src)[0]}x" if src & 7 != dest & 7 else ""
+            san += square_name(dest)
+            if move >> 12:
+                san += "=" + CODE_TYPES[move >> 12].value.upper()
+        else:
+            # name the file of the piece, else its rank, else both, when
+            # another piece of the same kind can go to the same square
+            rivals = [m & 63 for m in self.generate_moves()
+                      if m >> 6 & 63 == dest and m & 63 != src and squares[m & 63] == squares[src]]
+            disambiguation = ""
+            if rivals:
+                if all(sq & 7 != src & 7 for sq in rivals):
+                    disambiguation = square_name(src)[0]
+                elif all(sq >> 3 != src >> 3 for sq in rivals):
+                    disambiguation = square_name(src)[1]
+                else:
+                    disambiguation = square_name(src)
+            takes = "x" if squares[dest] else ""
+            san = f"{ptype.value.upper()}{disambiguation}{takes}{square_name(dest)}"
 
-        src_piece = self.at(*src)
-        dest_piece = self.at(*dest)
+        self.make_move(move)
+        if self.in_check():
+            san += "+" if self.generate_moves() else "#"
+        self.unmake_move()
+        return san
 
-        move = "{piece}{src_square}{takes}{dest}{promotion}{check}{checkmate}"
+    def san_to_move(self, text: str) -> int:
+        """Pack a move of the side to move given in standard algebraic notation.
 
-        piece = src_piece.type.value.capitalize() if src_piece.type.value != PieceType.PAWN else coord_to_cell_name(*src)[0]
-        src_square   = ""
-        takes = "x" if dest_piece else ""
-        dest = coord_to_cell_name(*dest)
-        promotion = ""
-        check = ""
-        checkmate = ""
-        move_string = move.format(piece=piece, src_square=src_square, takes=takes, dest=dest, promotion=promotion, check=check, checkmate=checkmate)
-        return move_string if move_string[0] != move_string[1] else move_string[1:]
+        Check marks and annotations such as ``+``, ``#``, ``!`` or ``?`` are
+        ignored, castling may be written with zeros.
 
+        Raises:
+            ValueError: the move is malformed, illegal or ambiguous.
+        """
+        san = text.rstrip("+#!?")
+        squares = self.__squares
+        moves = self.generate_moves()
+        if san in ("O-O", "0-0", "O-O-O", "0-0-0"):
+            row = 7 if self.__state.white_turn else 0
+            src = square(row, 4)
+            dest = square(row, 6 if len(san) == 3 else 2)
+            candidates = [m for m in moves if m == src | dest << 6 and squares[src] & 7 == KING]
+        else:
+            match = SAN_PATTERN.match(san)
+            if match is None:
+                raise ValueError(f"invalid move {text!r}")
+            letter, file, rank, dest, promotion = match.groups()
+            ptype = TYPE_CODES[PieceType(letter.lower())] if letter else PAWN
+            dest = square(8 - int(dest[1]), "abcdefgh".index(dest[0]))
+            promotion = TYPE_CODES[PieceType(promotion[-1].lower())] if promotion else 0
+            candidates = []
+            for m in moves:
+                src = m & 63
+                if (m >> 6 & 63 != dest or m >> 12 != promotion or squares[src] & 7 != ptype
+                        or file and square_name(src)[0] != file or rank and square_name(src)[1] != rank):
+                    continue
+                candidates.append(m)
+        if len(candidates) != 1:
+            raise ValueError(f"{'illegal' if not candidates else 'ambiguous'} move {text!r}")
+        return candidates[0]
 
     def at(self, p0, p1):
-        return self.board[p0][p1]
+        return PIECES[self.__squares[p0 << 3 | p1]]
                 
     
 
@@ -0,0 +1,162 @@
+#!/usr/bin/env python3
+"""Polyglot opening books.
+
+A Polyglot ``.bin`` book is an array of 16-byte big-endian entries sorted by
+key: the Zobrist key of a position, a move, a weight and a learn field. The
+keys of ``Board`` are Polyglot keys, so a position is looked up by its key.
+
+``PolyglotBook`` maps the file with mmap and binary searches it. Nothing is
+read up front: a lookup touches the few pages of its probes, and processes
+using the same book share them through the page cache.
+
+    python book.py book.bin --fen "<fen>"
+"""
+import argparse
+import mmap
+import os
+import random
+import struct
+import sys
+import time
+from typing import Iterator, List, NamedTuple, Tuple, Union
+
+from board import BACKENDS, KING, Board, move_to_uci
+from fen import STARTING_FEN, load_fen
+
+ENTRY = struct.Struct(">QHHI")
+KEY = struct.Struct(">Q")
+
+
+class BookEntry(NamedTuple):
+    """A move of a book position, packed, with its weight and learn field."""
+    move: int
+    weight: int
+    learn: int
+
+
+def decode_move(raw: int, squares) -> int:
+    """Pack a Polyglot move for the position given by its square codes.
+
+    Polyglot numbers ranks from the first one and writes castling as the king
+    taking its own rook.
+    """
+    to_file, to_rank = raw & 7, raw >> 3 & 7
+    from_file, from_rank = raw >> 6 & 7, raw >> 9 & 7
+    promotion = raw >> 12 & 7
+    src = (7 - from_rank) << 3 | from_file
+    dest = (7 - to_rank) << 3 | to_file
+    if squares[src] & 7 == KING and from_file == 4 and to_file in (0, 7) and from_rank == to_rank:
+        dest = src + 2 if to_file == 7 else src - 2
+    # knight to queen are 1 to 4, the piece codes are 2 to 5
+    return src | dest << 6 | ((promotion + 1) << 12 if promotion else 0)
+
+
+class PolyglotBook():
+    """A Polyglot book file, mapped in memory. Use it as a context manager or close it.
+
+    Args:
+        path (str | PathLike): the .bin file.
+    """
+
+    def __init__(self, path: Union[str, os.PathLike]) -> None:
+        self.path = path
+        self.file = open(path, "rb")
+        size = os.fstat(self.file.fileno()).st_size
+        # an empty file cannot be mapped
+        self.map = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ) if size else b""
+        self.count = size // ENTRY.size
+
+    def __len__(self) -> int:
+        return self.count
+
+    def __enter__(self) -> "PolyglotBook":
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        if isinstance(self.map, mmap.mmap):
+            self.map.close()
+        self.file.close()
+
+    def __first(self, key: int) -> int:
+        # index of the first entry whose key is not below key
+        lo, hi = 0, self.count
+        data = self.map
+        while lo < hi:
+            mid = (lo + hi) >> 1
+            if KEY.unpack_from(data, mid << 4)[0] < key:
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo
+
+    def raw_entries(self, key: int) -> Iterator[Tuple[int, int, int]]:
+        """The (Polyglot move, weight, learn) entries of a key, as in the file."""
+        data = self.map
+        for index in range(self.__first(key), self.count):
+            entry_key, raw, weight, learn = ENTRY.unpack_from(data, index << 4)
+            if entry_key != key:
+                break
+            yield raw, weight, learn
+
+    def entries(self, board: Board) -> List[BookEntry]:
+        """The book moves of the position of a board that are legal in it."""
+        raw_entries = list(self.raw_entries(board.key))
+        if not raw_entries:
+            return []
+        squares = board.squares
+        legal = set(board.generate_moves())
+        entries = []
+        for raw, weight, learn in raw_entries:
+            move = decode_move(raw, squares)
+            if move in legal:
+                entries.append(BookEntry(move, weight, learn))
+        return entries
+
+    def choose(self, board: Board, rng: Union[random.Random, None] = None,
+               weighted: bool = True) -> Union[int, None]:
+        """Pick a book move for the position of a board, None when out of book.
+
+        Args:
+            rng (random.Random, optional): random generator, the module's one by default.
+            weighted (bool): pick at random in proportion to the weights,
+                otherwise the move with the highest weight.
+        """
+        entries = [entry for entry in self.entries(board) if entry.weight]
+        if not entries:
+            return None
+        if not weighted:
+            return max(entries, key=lambda entry: entry.weight).move
+        return (rng or random).choices([e.move for e in entries], [e.weight for e in entries])[0]
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="List the moves of a Polyglot book for a position.")
+    parser.add_argument("path", help="Polyglot .bin book")
+    parser.add_argument("--fen", default=STARTING_FEN, help="position to look up, the initial one by default")
+    parser.add_argument("--backend", choices=BACKENDS, default="bitboard")
+    parser.add_argument("--repeat", type=int, default=10000, help="lookups timed (default: 10000)")
+    args = parser.parse_args(argv)
+
+    board = load_fen(Board(backend=args.backend), args.fen)
+    with PolyglotBook(args.path) as book:
+        entries = book.entries(board)
+        total = sum(entry.weight for entry in entries)
+        for entry in sorted(entries, key=lambda entry: -entry.weight):
+            share = entry.weight / total * 100 if total else 0
+            print(f"{move_to_uci(entry.move):<6} weight {entry.weight:>6}  {share:5.1f}%  learn {entry.learn}")
+        key = board.key
+        start = time.perf_counter()
+        for _ in range(args.repeat):
+            for _ in book.raw_entries(key):
+                pass
+        seconds = time.perf_counter() - start
+        print(f"{len(book):,} entries  {len(entries)} moves  "
+              f"{seconds / args.repeat * 1e6 if args.repeat else 0:.2f} us per lookup")
+    return 0 if entries else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
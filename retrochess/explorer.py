@@ -0,0 +1,279 @@
+#!/usr/bin/env python3
+"""Position index of a game archive, for opening explorer queries.
+
+Every game of an archive is replayed and each position it goes through is
+recorded with the game number, the ply, the result and the move played from
+it. The records are sorted by Zobrist key into an index file:
+
+    header     magic, version, record count
+    records    16 bytes big-endian each: key, game, ply << 2 | result, move
+
+The records do not fit in memory for large collections, so they are sorted in
+runs written to temporary files, then merged. ``PositionIndex`` maps the index
+and binary searches it: the games reaching a position and the moves played
+from it come from a single contiguous slice of the file.
+
+    python explorer.py build games.rca games.rcx
+    python explorer.py query games.rcx --moves "e2e4 c7c5" --archive games.rca
+"""
+import argparse
+import heapq
+import mmap
+import os
+import struct
+import sys
+import tempfile
+import time
+from typing import IO, Dict, Iterator, List, NamedTuple, Union
+
+from archive import RESULTS, GameArchive
+from board import BACKENDS, Board, move_to_uci, uci_to_move
+from fen import STARTING_FEN, load_fen
+
+MAGIC = b"RCPI"
+VERSION = 1
+# magic, version, reserved, record count
+HEADER = struct.Struct(">4sHHQ")
+# key, game, ply << 2 | result, move, where a move of 0 ends the game
+ENTRY = struct.Struct(">QIHH")
+KEY = struct.Struct(">Q")
+# records sorted in memory at once while building, about 50 MB as a list of
+# 128-bit ints though they take 16 MB on disk
+RUN_SIZE = 1 << 20
+# records written at a time
+CHUNK = 1 << 16
+
+
+class MoveStats(NamedTuple):
+    """How often a move was played from a position, and the results of those games."""
+    move: int
+    count: int
+    white: int
+    draws: int
+    black: int
+
+
+class PositionStats(NamedTuple):
+    """The games reaching a position, in order, and the moves played from it, most played first."""
+    games: List[int]
+    moves: List[MoveStats]
+
+
+def _write_records(file: IO[bytes], records: Iterator[int]) -> int:
+    # records packed in an int in the order of the fields, written big-endian
+    count = 0
+    chunk = []
+    for record in records:
+        chunk.append(record.to_bytes(16, "big"))
+        if len(chunk) == CHUNK:
+            file.write(b"".join(chunk))
+            count += len(chunk)
+            chunk.clear()
+    file.write(b"".join(chunk))
+    return count + len(chunk)
+
+
+def _read_records(file: IO[bytes]) -> Iterator[int]:
+    file.seek(0)
+    while data := file.read(16 * CHUNK):
+        for start in range(0, len(data), 16):
+            yield int.from_bytes(data[start:start + 16], "big")
+
+
+def build_index(archive: GameArchive, path: Union[str, os.PathLike], board: Union[Board, None] = None,
+                run_size: int = RUN_SIZE) -> int:
+    """Replay the games of an archive and write the index of their positions.
+
+    Args:
+        archive (GameArchive): the games.
+        path (str | PathLike): index to create.
+        board (Board, optional): board to replay the games on.
+        run_size (int): records sorted in memory before going to a temporary file.
+
+    Returns:
+        int: the number of records written.
+    """
+    board = board or Board(backend="bitboard")
+    runs: List[IO[bytes]] = []
+    records: List[int] = []
+
+    def spill():
+        records.sort()
+        run = tempfile.TemporaryFile()
+        _write_records(run, iter(records))
+        runs.append(run)
+        records.clear()
+
+    for number, moves in enumerate(archive):
+        result = RESULTS.index(archive.info(number).result)
+        load_fen(board, STARTING_FEN)
+        game = number << 32
+        make_move = board.make_move
+        for ply, move in enumerate(moves):
+            records.append(board.key << 64 | game | (ply << 2 | result) << 16 | move)
+            make_move(move)
+        records.append(board.key << 64 | game | (len(moves) << 2 | result) << 16)
+        if len(records) >= run_size:
+            spill()
+
+    with open(path, "wb", buffering=1 << 20) as f:
+        f.write(bytes(HEADER.size))
+        if runs:
+            if records:
+                spill()
+            count = _write_records(f, heapq.merge(*(_read_records(run) for run in runs)))
+            for run in runs:
+                run.close()
+        else:
+            records.sort()
+            count = _write_records(f, iter(records))
+        f.seek(0)
+        f.write(HEADER.pack(MAGIC, VERSION, 0, count))
+    return count
+
+
+class PositionIndex():
+    """An index file, mapped in memory. Use it as a context manager or close it.
+
+    Args:
+        path (str | PathLike): the index.
+
+    Raises:
+        ValueError: the file is not a position index.
+    """
+
+    def __init__(self, path: Union[str, os.PathLike]) -> None:
+        self.path = path
+        with open(path, "rb") as f:
+            try:
+                self.map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            except ValueError:
+                raise ValueError(f"{path} is not a position index") from None
+        magic, version, _, self.count = HEADER.unpack_from(self.map) if len(self.map) >= HEADER.size else (b"", 0, 0, 0)
+        if magic != MAGIC or version != VERSION or HEADER.size + self.count * ENTRY.size > len(self.map):
+            self.map.close()
+            raise ValueError(f"{path} is not a position index")
+
+    def __len__(self) -> int:
+        return self.count
+
+    def __enter__(self) -> "PositionIndex":
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        self.map.close()
+
+    def __first(self, key: int) -> int:
+        # index of the first record whose key is not below key
+        lo, hi = 0, self.count
+        data = self.map
+        while lo < hi:
+            mid = (lo + hi) >> 1
+            if KEY.unpack_from(data, HEADER.size + (mid << 4))[0] < key:
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo
+
+    def records(self, key: int) -> Iterator[tuple]:
+        """The (game, ply, result, move) records of a key, by game and ply."""
+        start = self.__first(key)
+        end = self.__first(key + 1) if key < 0xFFFF_FFFF_FFFF_FFFF else self.count
+        with memoryview(self.map)[HEADER.size + (start << 4):HEADER.size + (end << 4)] as view:
+            for _, game, ply, move in ENTRY.iter_unpack(view):
+                yield game, ply >> 2, RESULTS[ply & 3], move
+
+    def query(self, board: Board) -> PositionStats:
+        """The games reaching the position of a board and the moves played from it."""
+        games = []
+        stats: Dict[int, List[int]] = {}
+        last = None
+        for game, _, result, move in self.records(board.key):
+            if game != last:
+                games.append(game)
+                last = game
+            if move:
+                counts = stats.setdefault(move, [0, 0, 0, 0])
+                counts[0] += 1
+                if result == "1-0":
+                    counts[1] += 1
+                elif result == "1/2-1/2":
+                    counts[2] += 1
+                elif result == "0-1":
+                    counts[3] += 1
+        moves = [MoveStats(move, *counts) for move, counts in stats.items()]
+        moves.sort(key=lambda m: -m.count)
+        return PositionStats(games, moves)
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Index the positions of a game archive and look them up.")
+    parser.add_argument("--backend", choices=BACKENDS, default="bitboard")
+    modes = parser.add_subparsers(dest="mode", required=True)
+    build = modes.add_parser("build", help="replay the games of an archive and index their positions")
+    build.add_argument("archive", help="archive to index, see archive.py")
+    build.add_argument("path", help="index to create")
+    build.add_argument("--run-size", type=int, default=RUN_SIZE,
+                       help=f"records sorted in memory at once (default: {RUN_SIZE})")
+    query = modes.add_parser("query", help="list the games reaching a position and the moves played from it")
+    query.add_argument("path", help="index to read")
+    query.add_argument("--fen", default=STARTING_FEN, help="position to look up, the initial one by default")
+    query.add_argument("--moves", default="", help="moves in UCI notation played from the position")
+    query.add_argument("--archive", help="archive of the index, to show the players of the games")
+    query.add_argument("--games", type=int, default=10, help="games listed (default: 10)")
+    args = parser.parse_args(argv)
+
+    board = Board(backend=args.backend)
+    if args.mode == "build":
+        try:
+            archive = GameArchive(args.archive)
+        except ValueError as e:
+            parser.error(str(e))
+        start = time.perf_counter()
+        with archive:
+            count = build_index(archive, args.path, board, args.run_size)
+        seconds = time.perf_counter() - start
+        print(f"{len(archive)} games  {count} positions  {seconds:.3f}s  {os.path.getsize(args.path):,} bytes")
+        return 0
+
+    try:
+        load_fen(board, args.fen)
+        for text in args.moves.split():
+            move = uci_to_move(text)
+            if move not in board.generate_moves():
+                parser.error(f"illegal move {text}")
+            board.make_move(move)
+    except (ValueError, IndexError, KeyError):
+        parser.error("invalid position")
+    try:
+        index = PositionIndex(args.path)
+    except ValueError as e:
+        parser.error(str(e))
+    with index:
+        try:
+            archive = GameArchive(args.archive) if args.archive else None
+        except ValueError as e:
+            parser.error(str(e))
+        start = time.perf_counter()
+        stats = index.query(board)
+        seconds = time.perf_counter() - start
+        for m in stats.moves:
+            print(f"{move_to_uci(m.move):<6} {m.count:>8}  1-0 {m.white / m.count:>4.0%}  "
+                  f"draw {m.draws / m.count:>4.0%}  0-1 {m.black / m.count:>4.0%}")
+        print(f"{len(stats.games)} games  {len(stats.moves)} moves  {seconds * 1000:.2f} ms")
+        for number in stats.games[:args.games]:
+            if archive is not None:
+                info = archive.info(number)
+                print(f"{number:>8}  {info.white} - {info.black}  {info.result}  {info.event}  {info.date}")
+            else:
+                print(f"{number:>8}")
+        if archive is not None:
+            archive.close()
+    return 0 if stats.games else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
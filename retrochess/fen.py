@@ -1,13 +1,34 @@
-import itertools
-from select import select
+"""Forsyth-Edwards Notation.
 
-class InvalidFexException(Exception):
+A FEN string holds the six fields of a position: piece placement, side to
+move, castling rights, en passant square, halfmove clock and fullmove number.
+
+    rnbqkbnr/pppppppp/8/8/4P3/8/PPPP1PPP/RNBQKBNR b KQkq e3 0 1
+
+``parse_fen`` validates a string into a ``FenRecord``, ``load_fen`` sets it up
+on a ``Board`` and ``board_to_fen`` writes the position back. ``read_fens``
+parses a file of positions, one per line, as a stream:
+
+    python fen.py positions.fen --load
+"""
+import argparse
+import os
+import re
+import sys
+import time
+from typing import IO, Iterator, List, NamedTuple, Union
+
+from board import (BACKENDS, BLACK_LONG, BLACK_SHORT, PIECES, WHITE_LONG, WHITE_SHORT, Board, GameState, Piece,
+                   PieceColor, PieceType, square, square_name)
+
+
+class InvalidFenException(ValueError):
     pass
 
-from ctypes import Union
-from curses.ascii import isupper
-from typing import List
-from board import Board, Piece, PieceColor, PieceType
+# former, misspelled name of the exception
+InvalidFexException = InvalidFenException
+
+STARTING_FEN = "rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1"
 
 letter_to_type = {
     'p' : PieceType.PAWN,
@@ -20,55 +41,237 @@ letter_to_type = {
 
 type_to_letter = {v: k for k, v in letter_to_type.items()}
 
+castling_letters = {
+    'K': WHITE_SHORT,
+    'Q': WHITE_LONG,
+    'k': BLACK_SHORT,
+    'q': BLACK_LONG,
+}
+
+# king and rook a castling right needs on their original squares
+_CASTLING_PIECES = {
+    WHITE_SHORT: ((60, 6), (63, 4)),
+    WHITE_LONG: ((60, 6), (56, 4)),
+    BLACK_SHORT: ((4, 14), (7, 12)),
+    BLACK_LONG: ((4, 14), (0, 12)),
+}
+
+# the placement is expanded to one character per square, "." for empty ones,
+# then translated to a byte of piece code per square
+_PIECE_LETTERS = b"PNBRQKpnbrqk"
+_EXPAND = [(str(n).encode(), b"." * n) for n in range(8, 0, -1)]
+_LETTER_CODES = bytes.maketrans(b"." + _PIECE_LETTERS, bytes([0, 1, 2, 3, 4, 5, 6, 9, 10, 11, 12, 13, 14]))
+_CODE_LETTERS = bytes.maketrans(bytes([0, 1, 2, 3, 4, 5, 6, 9, 10, 11, 12, 13, 14]), b"1" + _PIECE_LETTERS)
+_RANK_SEPARATORS = b"/" * 7
+_ADJACENT_DIGITS = re.compile(r"[1-8]{2}")
+_PAWNS = frozenset((1, 9))
+# runs of empty squares, longest first
+_EMPTY_RUNS = [(b"1" * n, str(n).encode()) for n in range(8, 1, -1)]
+
+
+class FenRecord(NamedTuple):
+    """A parsed FEN, ``codes`` holds the piece code of each square from a8 to h1."""
+    codes: bytes
+    white_turn: bool
+    castling_rights: int
+    en_passant: Union[int, None]
+    halfmove_clock: int
+    fullmove_number: int
+
+
 def char_to_piece_list(c: str) -> List[Piece]:
-    if c.isdigit():
+    if c.isascii() and c.isdigit():
         return [None]*int(c)
     else:
         if c.isupper():
             color = PieceColor.WHITE
         else:
             color = PieceColor.BLACK
-        
+
         pt = letter_to_type[c.lower()]
         return[Piece(pt, color)]
 
 def piece_to_char(p: Piece):
     if p.color == PieceColor.BLACK:
-        retval = type_to_letter[p.type]
-    else:
-        retval = type_to_letter[p.type].upper()
-    print(f"{retval=}")
-    return retval
-
-def fen_to_board(fen_str: str):
-    rows, rest = fen_str.split(" ")
-    rows = rows.split("/")
-    board_list = [list(itertools.chain(*[char_to_piece_list(c) for c in r])) for r in rows]
-    return board_list
-
-
-def board_to_fen(board) -> str:
-    rows = []
-    for row in board.board:
-        row_fen = ""
-        counter = 0
-        for piece in row:
-            if piece:
-                row_fen += piece_to_char(piece)
-                if counter:
-                    row_fen += str(counter)
-                    counter = 0
-            else:
-                counter += 1
-        if counter:
-            row_fen += str(counter)
-        rows.append(row_fen)
-    return "/".join(rows)
+        return type_to_letter[p.type]
+    return type_to_letter[p.type].upper()
 
 
-if __name__ == '__main__':
-    b = Board()
-    print(type_to_letter)
-    print(board_to_fen(b))
-        
+def parse_fen(fen_str: str) -> FenRecord:
+    """Parse and validate a FEN string.
+
+    The fields after the placement may be left out, they default to white to
+    move, no castling, no en passant square and clocks of 0 and 1. Whether
+    the side not to move is in check is left to ``load_fen``, which has the
+    board to test it.
+
+    Raises:
+        InvalidFenException: the string is not a valid position.
+    """
+    fields = fen_str.split()
+    if not 1 <= len(fields) <= 6:
+        raise InvalidFenException(f"expected 1 to 6 fields, got {len(fields)} in {fen_str!r}")
+    fields += ["w", "-", "-", "0", "1"][len(fields) - 1:]
+    placement, turn, castling, ep, halfmove, fullmove = fields
+
+    expanded = placement.encode("ascii", "replace")
+    for digit, run in _EXPAND:
+        expanded = expanded.replace(digit, run)
+    if len(expanded) != 71 or expanded[8::9] != _RANK_SEPARATORS or _ADJACENT_DIGITS.search(placement):
+        raise InvalidFenException(f"ranks of the placement must be 8 squares long in {fen_str!r}")
+    letters = expanded.replace(b"/", b"")
+    if letters.translate(None, b"." + _PIECE_LETTERS):
+        raise InvalidFenException(f"unknown piece letter in {fen_str!r}")
+    codes = letters.translate(_LETTER_CODES)
+    if codes.count(6) != 1 or codes.count(14) != 1:
+        raise InvalidFenException(f"each side must have exactly one king in {fen_str!r}")
+    if not _PAWNS.isdisjoint(codes[:8] + codes[56:]):
+        raise InvalidFenException(f"pawns on the first or last rank in {fen_str!r}")
+
+    if turn not in ("w", "b"):
+        raise InvalidFenException(f"side to move must be w or b in {fen_str!r}")
+    white_turn = turn == "w"
+
+    castling_rights = 0
+    if castling != "-":
+        for c in castling:
+            right = castling_letters.get(c, 0)
+            if not right or castling_rights & right:
+                raise InvalidFenException(f"invalid castling rights {castling!r} in {fen_str!r}")
+            if any(codes[sq] != code for sq, code in _CASTLING_PIECES[right]):
+                raise InvalidFenException(f"castling right {c} without king and rook in place in {fen_str!r}")
+            castling_rights |= right
+
+    en_passant = None
+    if ep != "-":
+        # the square skipped by the pawn that just moved, with the pawn in front of it
+        rank = "6" if white_turn else "3"
+        if len(ep) != 2 or ep[0] not in "abcdefgh" or ep[1] != rank:
+            raise InvalidFenException(f"invalid en passant square {ep!r} in {fen_str!r}")
+        en_passant = square(8 - int(rank), "abcdefgh".index(ep[0]))
+        forward = 8 if white_turn else -8
+        if codes[en_passant] or codes[en_passant - forward] or codes[en_passant + forward] != (9 if white_turn else 1):
+            raise InvalidFenException(f"no pawn can be taken en passant on {ep} in {fen_str!r}")
 
+    # isdigit alone takes other scripts' digits, which int() reads or rejects
+    if not (halfmove + fullmove).isascii() or not halfmove.isdigit() or not fullmove.isdigit() or int(fullmove) < 1:
+        raise InvalidFenException(f"invalid move clocks in {fen_str!r}")
+
+    return FenRecord(codes, white_turn, castling_rights, en_passant, int(halfmove), int(fullmove))
+
+
+def record_to_board(record: FenRecord) -> List[List[Union[Piece, None]]]:
+    codes = record.codes
+    return [[PIECES[code] for code in codes[i:i + 8]] for i in range(0, 64, 8)]
+
+def record_to_state(record: FenRecord) -> GameState:
+    state = GameState()
+    state.white_turn = record.white_turn
+    state.castling_rights = record.castling_rights
+    state.en_passant = record.en_passant
+    state.halfmove_clock = record.halfmove_clock
+    state.fullmove_number = record.fullmove_number
+    return state
+
+def fen_to_board(fen_str: str) -> List[List[Union[Piece, None]]]:
+    """Read the piece placement, rows of the board from the 8th rank."""
+    return record_to_board(parse_fen(fen_str))
+
+def fen_to_state(fen_str: str) -> GameState:
+    """Read side to move, castling rights, en passant square and clocks."""
+    return record_to_state(parse_fen(fen_str))
+
+def _set_up(board: Board, record: FenRecord, fen_str: str):
+    board.set_squares(record.codes, record_to_state(record))
+    # the side that just moved cannot have left its king attacked, the king
+    # could be taken and the move generators expect it on the board
+    if board.in_check(not record.white_turn):
+        raise InvalidFenException(f"the side not to move is in check in {fen_str!r}")
+
+def load_fen(board: Board, fen_str: str) -> Board:
+    """Set up the position described by a FEN string on the board.
+
+    Raises:
+        InvalidFenException: the string is not a valid position. A side not
+            to move in check is only found once the board holds the position,
+            which it keeps.
+    """
+    _set_up(board, parse_fen(fen_str), fen_str)
+    return board
+
+
+def record_to_fen(record: FenRecord) -> str:
+    placement = record.codes.translate(_CODE_LETTERS)
+    placement = b"/".join([placement[i:i + 8] for i in range(0, 64, 8)])
+    for run, digit in _EMPTY_RUNS:
+        placement = placement.replace(run, digit)
+    castling = "".join(c for c, right in castling_letters.items() if record.castling_rights & right) or "-"
+    ep = "-" if record.en_passant is None else square_name(record.en_passant)
+    return " ".join((placement.decode("ascii"), "w" if record.white_turn else "b", castling, ep,
+                     str(record.halfmove_clock), str(record.fullmove_number)))
+
+def board_to_fen(board: Board) -> str:
+    """Write the position of the board with its six fields."""
+    codes = bytes(board.squares)
+    state = board.state
+    return record_to_fen(FenRecord(codes, state.white_turn, state.castling_rights, state.en_passant,
+                                   state.halfmove_clock, state.fullmove_number))
+
+
+def read_fens(source: Union[str, os.PathLike, IO[str]], board: Union[Board, None] = None,
+              skip_invalid: bool = False) -> Iterator[Union[FenRecord, Board]]:
+    """Parse a file of FEN strings, one per line, as a stream.
+
+    Blank lines and lines starting with ``#`` are ignored.
+
+    Args:
+        source (str | PathLike | IO[str]): path or text file to read.
+        board (Board, optional): when given, every position is loaded on it and
+            the board is yielded instead of the parsed record.
+        skip_invalid (bool): skip invalid lines instead of raising.
+
+    Raises:
+        InvalidFenException: on the first invalid line, unless skip_invalid.
+    """
+    if isinstance(source, (str, os.PathLike)):
+        with open(source, encoding="ascii", errors="replace", buffering=1 << 20) as f:
+            yield from read_fens(f, board, skip_invalid)
+        return
+    for number, line in enumerate(source, 1):
+        line = line.strip()
+        if not line or line[0] == "#":
+            continue
+        try:
+            record = parse_fen(line)
+            if board is not None:
+                _set_up(board, record, line)
+        except InvalidFenException as e:
+            if skip_invalid:
+                continue
+            raise InvalidFenException(f"line {number}: {e}") from None
+        yield record if board is None else board
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Parse a file of FEN positions, one per line.")
+    parser.add_argument("path", help="file to read, - for the standard input")
+    parser.add_argument("--load", action="store_true", help="set up every position on a board")
+    parser.add_argument("--backend", choices=BACKENDS, default="bitboard")
+    parser.add_argument("--skip-invalid", action="store_true", help="ignore invalid lines instead of stopping")
+    args = parser.parse_args(argv)
+
+    source = sys.stdin if args.path == "-" else args.path
+    board = Board(backend=args.backend) if args.load else None
+    start = time.perf_counter()
+    try:
+        count = sum(1 for _ in read_fens(source, board, args.skip_invalid))
+    except InvalidFenException as e:
+        print(e, file=sys.stderr)
+        return 1
+    seconds = time.perf_counter() - start
+    print(f"{count} positions  {seconds:.3f}s  {round(count / seconds) if seconds else 0:,} positions/s")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,16 +1,35 @@
 #!/usr/bin/env python3
+from time import perf_counter
+# steps of the startup and when they ended, see --profile-startup
+STARTUP = [("start", perf_counter())]
+
 from os import environ
 environ['PYGAME_HIDE_SUPPORT_PROMPT'] = '1'
 
-from ui.fen import FenViewer
-import pygame
+import argparse
 import atexit
-from board import Board
+import sys
+from typing import TYPE_CHECKING, List, Union
+
+import pygame
+from pygame.color import Color
+STARTUP.append(("import pygame", perf_counter()))
+
+from board import CODE_TYPES, Board
+from timer import Clock, TimeControl
+from tt import MoveCache
+STARTUP.append(("import board", perf_counter()))
+
+from ui.fen import FenViewer
 from ui.moves import MovesViewer
 from ui.timer import TimerViewer
 from ui.board import BoardViewer
 from ui.config import Config
-from pygame.color import Color
+STARTUP.append(("import ui", perf_counter()))
+
+if TYPE_CHECKING:
+    # imported by main() when a book is given
+    from book import PolyglotBook
 
 BOARD_SIZE = 520
 assert BOARD_SIZE % 8 == 0
@@ -20,136 +39,278 @@ TIMER_OFFSET = (4*Config.SPACING + BOARD_SIZE, 2*Config.SPACING)
 MOVES_OFFSET = (TIMER_OFFSET[0], TIMER_OFFSET[1] + BOARD_SIZE / 4 + 20)
 FEN_OFFSET = (BOARD_OFFSET[0], BOARD_SIZE + 40)
 
-def mouse_to_surface(surface_offset):
-    mouse_pos = pygame.mouse.get_pos()
+# posted when the time shown by the running clock changes
+CLOCK_TICK = pygame.event.custom_type()
+
+# events the main loop wakes up for
+HANDLED_EVENTS = [
+    CLOCK_TICK,
+    pygame.QUIT,
+    pygame.MOUSEMOTION,
+    pygame.MOUSEBUTTONDOWN,
+    pygame.MOUSEBUTTONUP,
+    pygame.MOUSEWHEEL,
+    pygame.KEYDOWN,
+    pygame.VIDEOEXPOSE,
+    pygame.WINDOWEXPOSED,
+]
+
+def coalesce(events):
+    """Drop the mouse motions followed by another one, only the last
+    position matters."""
+    return [event for event, following in zip(events, events[1:] + [None])
+            if not (event.type == pygame.MOUSEMOTION and following is not None
+                    and following.type == pygame.MOUSEMOTION)]
+
+def mouse_to_surface(mouse_pos, surface_offset):
     return (mouse_pos[0]-surface_offset[0], mouse_pos[1]-surface_offset[1])
 
 
+class App():
+    """The viewers of a board laid out on a screen, and the handling of the events.
 
-def main():
-    pygame.init()
-    atexit.register(pygame.quit)
+    Args:
+        screen (Surface): the display surface, 850x600.
+        time_control (str): time control of the clock, like 300+3.
+        book (PolyglotBook, optional): opening book the b key plays a move of.
+    """
 
-    screen = pygame.display.set_mode((850, 600))
-    pygame.display.set_caption('RetroChess')
+    def __init__(self, screen: pygame.Surface, time_control: str = Config.TIME_CONTROL,
+                 book: Union["PolyglotBook", None] = None) -> None:
+        self.screen = screen
+        self.book = book
+        # mouse position of the last event that had one
+        self.mouse_pos = pygame.mouse.get_pos()
 
-    # board creation
-    board_size = BOARD_SIZE
-    board_surface = pygame.Surface((board_size, board_size))
-    board = Board()
-    board_viewer = BoardViewer(board, board_surface)
-
-    # fen creation
-    fen_surface_w = board_size
-    fen_surface_h = 20
-    fen_surface = pygame.Surface((fen_surface_w, fen_surface_h))
-    fen_viewer = FenViewer(board, fen_surface)
-
-    # timer creation
-    timer_surface_w = (board_size) / 2
-    timer_surface_h = (board_size) / 4
-    timer_surface = pygame.Surface((timer_surface_w, timer_surface_h))
-    timer_viewer = TimerViewer(board, timer_surface)
-
-    # moves viewer creation
-    moves_viewer_surface_w = timer_surface_w
-    moves_viewer_surface_h = 560 - 60 - timer_surface_h
-    moves_viewer_surface = pygame.Surface((moves_viewer_surface_w, moves_viewer_surface_h))
-    moves_viewer = MovesViewer(board, moves_viewer_surface)
+        # board creation
+        board_size = BOARD_SIZE
+        self.board_surface = pygame.Surface((board_size, board_size))
+        self.board = Board(move_cache=MoveCache(), clock=Clock(TimeControl.parse(time_control)))
+        self.board_viewer = BoardViewer(self.board, self.board_surface)
 
-    running = True
-    
-    while running:
-        event = pygame.event.wait(1000)
+        # fen creation
+        fen_surface_w = board_size
+        fen_surface_h = 20
+        self.fen_surface = pygame.Surface((fen_surface_w, fen_surface_h))
+        self.fen_viewer = FenViewer(self.board, self.fen_surface)
+
+        # timer creation
+        timer_surface_w = (board_size) / 2
+        timer_surface_h = (board_size) / 4
+        self.timer_surface = pygame.Surface((timer_surface_w, timer_surface_h))
+        self.timer_viewer = TimerViewer(self.board, self.timer_surface)
+
+        # moves viewer creation
+        moves_viewer_surface_w = timer_surface_w
+        moves_viewer_surface_h = 560 - 60 - timer_surface_h
+        self.moves_viewer_surface = pygame.Surface((moves_viewer_surface_w, moves_viewer_surface_h))
+        self.moves_viewer = MovesViewer(self.board, self.moves_viewer_surface)
 
+        # screen areas showing each viewer
+        self.viewers = (
+            (self.board_viewer, BOARD_OFFSET),
+            (self.fen_viewer, FEN_OFFSET),
+            (self.timer_viewer, TIMER_OFFSET),
+            (self.moves_viewer, MOVES_OFFSET),
+        )
+        self.screen.fill(Color(0,0,0))
+
+    def mouse_to_surface(self, surface_offset):
+        return mouse_to_surface(self.mouse_pos, surface_offset)
+
+    def handle(self, event) -> bool:
+        """Dispatch an event to the viewers, return False to quit."""
         if event.type == pygame.QUIT:
-            running = False
-            continue
+            return False
+        if event.type == CLOCK_TICK:
+            self.board.clock.check_flag()
+            return True
+        if event.type in (pygame.MOUSEMOTION, pygame.MOUSEBUTTONDOWN, pygame.MOUSEBUTTONUP):
+            self.mouse_pos = event.pos
 
         # dispatch the events
         if event.type == pygame.MOUSEMOTION:
             # handle board
-            mouse_pos = mouse_to_surface(BOARD_OFFSET)
-            if board_surface.get_rect().collidepoint(mouse_pos):
-                board_viewer.on_mouse_on(mouse_pos)                
+            mouse_pos = self.mouse_to_surface(BOARD_OFFSET)
+            if self.board_surface.get_rect().collidepoint(mouse_pos):
+                self.board_viewer.on_mouse_on(mouse_pos)                
             else:
-                board_viewer.on_mouse_off(mouse_pos)
+                self.board_viewer.on_mouse_off(mouse_pos)
             # handle timer
-            mouse_pos = mouse_to_surface(TIMER_OFFSET)
-            if timer_surface.get_rect().collidepoint(mouse_pos):
-                timer_viewer.on_mouse_on(mouse_pos)
+            mouse_pos = self.mouse_to_surface(TIMER_OFFSET)
+            if self.timer_surface.get_rect().collidepoint(mouse_pos):
+                self.timer_viewer.on_mouse_on(mouse_pos)
             else:
-                timer_viewer.on_mouse_off(mouse_pos)
+                self.timer_viewer.on_mouse_off(mouse_pos)
             # handle moves history
 
 
         elif event.type == pygame.MOUSEBUTTONUP:
-            mouse_pos = mouse_to_surface(BOARD_OFFSET)
+            mouse_pos = self.mouse_to_surface(BOARD_OFFSET)
             # handle board
             if event.button == pygame.BUTTON_LEFT:
-                board_viewer.set_dragging(False)
+                self.board_viewer.set_dragging(False)
 
-                if board_surface.get_rect().collidepoint(mouse_pos) and board.state.selected_piece:
-                    (y,x) = board_viewer.mouse_coords_to_board_cell(mouse_pos)
-                    if board.can_move(board.state.selected_piece, (x,y)): # check if that's a move
-                        board.move(board.state.selected_piece, (x,y))
+                if self.board_surface.get_rect().collidepoint(mouse_pos) and self.board.state.selected_piece:
+                    (y,x) = self.board_viewer.mouse_coords_to_board_cell(mouse_pos)
+                    if self.board.can_move(self.board.state.selected_piece, (x,y)): # check if that's a move
+                        self.board.move(self.board.state.selected_piece, (x,y))
                     else:
                         #board.select(x, y)
-                        if board.state.selected_piece != (x,y):
-                            board.state.selected_piece = None
+                        if self.board.state.selected_piece != (x,y):
+                            self.board.state.selected_piece = None
                 else:
-                    board.state.selected_piece = None
+                    self.board.state.selected_piece = None
 
         elif event.type == pygame.MOUSEBUTTONDOWN:
             # handle board
-            mouse_pos = mouse_to_surface(BOARD_OFFSET)
+            mouse_pos = self.mouse_to_surface(BOARD_OFFSET)
             # right click unselect things
             if event.button == pygame.BUTTON_RIGHT:
-                board.state.selected_piece = None
+                self.board.state.selected_piece = None
 
-            elif board_surface.get_rect().collidepoint(mouse_pos):
-                (y,x) = board_viewer.mouse_coords_to_board_cell(mouse_pos)
-                if board.state.selected_piece != None:
-                    if board.can_move(board.state.selected_piece, (x,y)): # check if that's a move
-                        board.move(board.state.selected_piece, (x,y))
+            elif self.board_surface.get_rect().collidepoint(mouse_pos):
+                (y,x) = self.board_viewer.mouse_coords_to_board_cell(mouse_pos)
+                if self.board.state.selected_piece != None:
+                    if self.board.can_move(self.board.state.selected_piece, (x,y)): # check if that's a move
+                        self.board.move(self.board.state.selected_piece, (x,y))
                     else:
-                        board.select(x, y)
-                        board_viewer.set_dragging(False)
+                        self.board.select(x, y)
+                        self.board_viewer.set_dragging(False)
                 else:
-                    board.select(x, y)
-                    board_viewer.set_dragging(True)
+                    self.board.select(x, y)
+                    self.board_viewer.set_dragging(True)
             else:
-                board.state.selected_piece = None
-        
+                self.board.state.selected_piece = None
+
+        elif event.type == pygame.MOUSEWHEEL:
+            # scroll the moves history under the mouse
+            if self.moves_viewer_surface.get_rect().collidepoint(self.mouse_to_surface(MOVES_OFFSET)):
+                self.moves_viewer.scroll(-event.y)
+
         elif event.type == pygame.KEYDOWN:
             match event.key:
                 case pygame.K_r:
-                    board.reset()
+                    self.board.reset()
                 case pygame.K_f:
-                    board_viewer.flip()
+                    self.board_viewer.flip()
+                case pygame.K_u:
+                    self.board.takeback()
+                case pygame.K_b:
+                    self.play_book_move()
                 case pygame.K_x:
-                    running = False
-                    continue
+                    return False
 
+        elif event.type in (pygame.VIDEOEXPOSE, pygame.WINDOWEXPOSED):
+            # the window was uncovered, show the whole screen again
+            pygame.display.flip()
+        return True
 
-        screen.fill(Color(0,0,0))
-        # updates
-        board_viewer.update()
-        fen_viewer.update()
-        timer_viewer.update()
-        moves_viewer.update()
+    def play_book_move(self):
+        """Play a move of the opening book, picked by weight, if the position is in it."""
+        if self.book is None:
+            return
+        move = self.book.choose(self.board)
+        if move is None:
+            return
+        # the book only gives moves legal in the position
+        src, dest = divmod(move & 63, 8), divmod(move >> 6 & 63, 8)
+        self.board.state.selected_piece = None
+        if move >> 12:
+            self.board.move(src, dest, CODE_TYPES[move >> 12])
+        else:
+            self.board.move(src, dest)
 
-        screen.blit(fen_viewer.surface, FEN_OFFSET)
-        screen.blit(timer_viewer.surface, TIMER_OFFSET)
-        screen.blit(moves_viewer.surface, MOVES_OFFSET)
-        screen.blit(board_viewer.surface, BOARD_OFFSET)
+    def render(self) -> List[pygame.Rect]:
+        """Draw what changed and push it to the display, return the screen areas updated."""
+        # updates, only the areas the viewers painted go to the display
+        dirty = []
+        for viewer, offset in self.viewers:
+            for rect in viewer.update():
+                screen_rect = rect.move(offset)
+                self.screen.blit(viewer.surface, screen_rect, rect)
+                dirty.append(screen_rect)
         #if board_viewer.piece_dragging_surface:
         #    screen.blit(board_viewer.piece_dragging_surface, pygame.mouse.get_pos())
 
-        pygame.display.update()
-        
-    
+        if dirty:
+            pygame.display.update(dirty)
+        return dirty
+
+    def schedule_tick(self):
+        """Have a single CLOCK_TICK posted when the running clock shows another
+        time, none while it is stopped."""
+        wait = self.board.clock.next_change()
+        pygame.time.set_timer(CLOCK_TICK, 0 if wait is None else max(1, wait), loops=1)
+
+
+def print_startup(steps):
+    """Print the time of each step, and since main.py started."""
+    for (_, previous), (name, end) in zip(steps, steps[1:]):
+        print(f"{name:<14} {(end - previous) * 1000:8.1f} ms  {(end - steps[0][1]) * 1000:8.1f} ms")
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Play chess.")
+    parser.add_argument("--fps", type=int, default=Config.FPS,
+                        help=f"maximum number of frames drawn per second (default: {Config.FPS})")
+    parser.add_argument("--time-control", default=Config.TIME_CONTROL,
+                        help=f"seconds per game, +increment, dDelay, stages split by colons (default: {Config.TIME_CONTROL})")
+    parser.add_argument("--book", metavar="PATH",
+                        help="Polyglot opening book, the b key plays one of its moves")
+    parser.add_argument("--profile-startup", action="store_true",
+                        help="print the time taken by each step until the first frame")
+    args = parser.parse_args(argv)
+    fps = args.fps
+    try:
+        TimeControl.parse(args.time_control)
+    except ValueError as e:
+        parser.error(str(e))
+    STARTUP.append(("arguments", perf_counter()))
+
+    # only the modules used, pygame.init() would start audio and joysticks too
+    pygame.display.init()
+    pygame.font.init()
+    atexit.register(pygame.quit)
+    STARTUP.append(("pygame init", perf_counter()))
+
+    screen = pygame.display.set_mode((850, 600))
+    pygame.display.set_caption('RetroChess')
+    STARTUP.append(("window", perf_counter()))
+
+    book = None
+    if args.book:
+        from book import PolyglotBook
+        try:
+            book = PolyglotBook(args.book)
+        except OSError as e:
+            parser.error(f"cannot open book {args.book}: {e.strerror}")
+        atexit.register(book.close)
+    app = App(screen, args.time_control, book)
+    STARTUP.append(("viewers", perf_counter()))
+    app.render()
+    STARTUP.append(("first frame", perf_counter()))
+    if args.profile_startup:
+        print_startup(STARTUP)
+
+    # only the events handled below wake the loop up
+    pygame.event.set_blocked(None)
+    pygame.event.set_allowed(HANDLED_EVENTS)
+
+    frames = pygame.time.Clock()
+    running = True
+    while running:
+        # sleep until something happens, then handle everything pending at once
+        events = coalesce([pygame.event.wait()] + pygame.event.get())
+        running = all(app.handle(event) for event in events)
+        if running:
+            app.render()
+            app.schedule_tick()
+            # the events coming in until the next frame is due are handled together
+            frames.tick(fps)
+    return 0
+
 
 if __name__ == '__main__':
-    main()
+    sys.exit(main())
 
@@ -0,0 +1,230 @@
+#!/usr/bin/env python3
+"""Run perft, searches and move generation on several processes.
+
+An ``AnalysisPool`` keeps worker processes alive between calls, each with its
+own ``Board`` and transposition table. Perft splits the move tree of a
+position near the root, the other modes split a batch of positions; results
+always come back in the order of the input, whatever the number of workers.
+
+    python parallel.py perft --depth 6 --workers 16
+    python parallel.py search positions.fen --depth 6
+    python parallel.py annotate positions.fen > moves.txt
+"""
+import argparse
+import os
+import sys
+import time
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor
+from typing import Deque, Dict, Iterable, Iterator, List, Tuple, Union
+
+from board import BACKENDS, Board, move_to_uci
+from fen import STARTING_FEN, InvalidFenException, load_fen
+from perft import Perft
+from search import Search, SearchResult, format_score
+from tt import TranspositionTable
+
+# positions sent to a worker at once, and batches queued per worker
+CHUNK_SIZE = 256
+QUEUED_PER_WORKER = 4
+# perft splits the tree until there are this many subtrees per worker
+TASKS_PER_WORKER = 8
+
+# state of a worker process, set once by _init_worker
+_board: Union[Board, None] = None
+_tt: Union[TranspositionTable, None] = None
+
+
+def _init_worker(backend: str, hash_mb: float):
+    global _board, _tt
+    _board = Board(backend=backend)
+    _tt = TranspositionTable(hash_mb)
+
+
+def _perft_task(fen: str, moves: Tuple[int, ...], depth: int) -> int:
+    load_fen(_board, fen)
+    for move in moves:
+        _board.make_move(move)
+    return Perft(_board).count(depth)
+
+
+def _failed(fen: str, error: Exception) -> None:
+    # invalid positions are expected in a stream, anything else is a bug to report;
+    # either way the position gets None and the rest of the batch goes on
+    if not isinstance(error, InvalidFenException):
+        print(f"{fen}: {error!r}", file=sys.stderr)
+    return None
+
+
+def _search_task(fens: List[str], depth: int) -> List[Union[SearchResult, None]]:
+    results = []
+    for fen in fens:
+        try:
+            load_fen(_board, fen)
+            _tt.clear()
+            results.append(Search(_board, _tt).run(depth=depth))
+        except Exception as e:
+            results.append(_failed(fen, e))
+    return results
+
+
+def _annotate_task(fens: List[str]) -> List[Union[List[int], None]]:
+    results = []
+    for fen in fens:
+        try:
+            load_fen(_board, fen)
+            results.append(_board.generate_moves())
+        except Exception as e:
+            results.append(_failed(fen, e))
+    return results
+
+
+class AnalysisPool():
+    """Worker processes holding a board each, to be used as a context manager.
+
+    Args:
+        workers (int, optional): number of processes, one per core by default.
+        backend (str): board backend of the workers.
+        hash_mb (float): transposition table size of each worker, in MB.
+    """
+
+    def __init__(self, workers: Union[int, None] = None, backend: str = "bitboard", hash_mb: float = 16) -> None:
+        self.workers = workers or os.cpu_count() or 1
+        self.backend = backend
+        self.executor = ProcessPoolExecutor(self.workers, initializer=_init_worker, initargs=(backend, hash_mb))
+
+    def __enter__(self) -> "AnalysisPool":
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        self.executor.shutdown(cancel_futures=True)
+
+    def perft(self, fen: str, depth: int) -> Dict[str, int]:
+        """Node count below each root move, keyed by its UCI name, in move generation order."""
+        board = load_fen(Board(backend=self.backend), fen)
+        # split the tree one ply deeper until there is enough work to balance
+        # between the workers, each subtree knowing the root move it comes from
+        root_moves = board.generate_moves()
+        frontier = [((move,), depth - 1) for move in root_moves]
+        while frontier and frontier[0][1] > 1 and len(frontier) < self.workers * TASKS_PER_WORKER:
+            deeper = []
+            for moves, left in frontier:
+                for move in moves:
+                    board.make_move(move)
+                deeper.extend((moves + (move,), left - 1) for move in board.generate_moves())
+                for _ in moves:
+                    board.unmake_move()
+            frontier = deeper
+
+        futures = [self.executor.submit(_perft_task, fen, moves, left) for moves, left in frontier]
+        # a root move whose subtrees all end in mate or stalemate before the
+        # frontier has no task, it still counts with 0 nodes
+        divide = {move_to_uci(move): 0 for move in root_moves}
+        for (moves, _), future in zip(frontier, futures):
+            divide[move_to_uci(moves[0])] += future.result()
+        return divide
+
+    def search(self, fens: Iterable[str], depth: int) -> Iterator[Tuple[str, Union[SearchResult, None]]]:
+        """Search each position to a fixed depth, with a cleared table.
+
+        Yields the FEN and search result of each position, None for invalid
+        ones and ones the search failed on.
+        """
+        return self.__map(fens, _search_task, depth)
+
+    def annotate(self, fens: Iterable[str]) -> Iterator[Tuple[str, Union[List[int], None]]]:
+        """Yield the FEN and legal packed moves of each position, None for invalid
+        ones and ones the move generation failed on."""
+        return self.__map(fens, _annotate_task)
+
+    def __map(self, fens: Iterable[str], task, *args) -> Iterator[tuple]:
+        # a bounded number of batches is in flight, so that a stream of any
+        # length goes through in constant memory
+        pending: Deque[Tuple[List[str], Future]] = deque()
+        batch: List[str] = []
+        for fen in fens:
+            batch.append(fen)
+            if len(batch) == CHUNK_SIZE:
+                pending.append((batch, self.executor.submit(task, batch, *args)))
+                batch = []
+                if len(pending) >= self.workers * QUEUED_PER_WORKER:
+                    done, future = pending.popleft()
+                    yield from zip(done, future.result())
+        if batch:
+            pending.append((batch, self.executor.submit(task, batch, *args)))
+        while pending:
+            done, future = pending.popleft()
+            yield from zip(done, future.result())
+
+
+def read_lines(path: str) -> Iterator[str]:
+    """Non blank lines of a file, - for the standard input, skipping # comments."""
+    f = sys.stdin if path == "-" else open(path, encoding="ascii", errors="replace", buffering=1 << 20)
+    try:
+        for line in f:
+            line = line.strip()
+            if line and line[0] != "#":
+                yield line
+    finally:
+        if f is not sys.stdin:
+            f.close()
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Analyse positions on several processes.")
+    parser.add_argument("--workers", type=int, help="number of processes (default: one per core)")
+    parser.add_argument("--backend", choices=BACKENDS, default="bitboard")
+    modes = parser.add_subparsers(dest="mode", required=True)
+    perft = modes.add_parser("perft", help="count the leaves of the move tree of a position")
+    perft.add_argument("--fen", default=STARTING_FEN)
+    perft.add_argument("--depth", type=int, default=5)
+    perft.add_argument("--divide", action="store_true", help="print the node count below each root move")
+    search = modes.add_parser("search", help="search each position of a file to a fixed depth")
+    search.add_argument("path", help="file of FEN positions, - for the standard input")
+    search.add_argument("--depth", type=int, default=4)
+    search.add_argument("--hash", type=float, default=16, help="table size of each worker in MB (default: 16)")
+    annotate = modes.add_parser("annotate", help="list the legal moves of each position of a file")
+    annotate.add_argument("path", help="file of FEN positions, - for the standard input")
+    args = parser.parse_args(argv)
+    if args.mode != "annotate" and args.depth < 1:
+        parser.error("the depth must be at least 1")
+
+    start = time.perf_counter()
+    with AnalysisPool(args.workers, args.backend, getattr(args, "hash", 1)) as pool:
+        if args.mode == "perft":
+            divide = pool.perft(args.fen, args.depth)
+            if args.divide:
+                for move, nodes in divide.items():
+                    print(f"{move}: {nodes}")
+            count = sum(divide.values())
+            unit = "nodes"
+            print(f"depth {args.depth}  nodes {count}")
+        elif args.mode == "search":
+            count = 0
+            unit = "positions"
+            for fen, result in pool.search(read_lines(args.path), args.depth):
+                count += 1
+                if result is None:
+                    print(f"{fen}; invalid")
+                else:
+                    pv = " ".join(move_to_uci(m) for m in result.pv)
+                    best = move_to_uci(result.move) if result.move else "0000"
+                    print(f"{fen}; bestmove {best} score {format_score(result.score)} "
+                          f"nodes {result.nodes} pv {pv}")
+        else:
+            count = 0
+            unit = "positions"
+            for fen, moves in pool.annotate(read_lines(args.path)):
+                count += 1
+                print(f"{fen}; " + ("invalid" if moves is None else " ".join(move_to_uci(m) for m in moves)))
+    seconds = time.perf_counter() - start
+    print(f"{pool.workers} workers  {seconds:.3f}s  {round(count / seconds) if seconds else 0:,} {unit}/s",
+          file=sys.stderr)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,202 @@
+#!/usr/bin/env python3
+"""Perft: count the leaves of the legal move tree of a position.
+
+The node counts validate the move generator against well known values, and the
+time taken measures the throughput of ``Board.generate_moves`` and
+``Board.make_move``/``Board.unmake_move`` for a backend.
+
+    python perft.py --fen "<fen>" --depth 4 --divide
+    python perft.py --suite --depth 3 --json perft.json
+"""
+import argparse
+import json
+import platform
+import sys
+import time
+from datetime import datetime, timezone
+from typing import Dict
+
+from board import BACKENDS, Board, move_to_uci
+from fen import STARTING_FEN, InvalidFenException, load_fen
+
+# name, fen and node counts from depth 1 onwards
+REFERENCE_POSITIONS = [
+    ("initial", STARTING_FEN,
+     [20, 400, 8902, 197281, 4865609, 119060324]),
+    ("kiwipete", "r3k2r/p1ppqpb1/bn2pnp1/3PN3/1p2P3/2N2Q1p/PPPBBPPP/R3K2R w KQkq - 0 1",
+     [48, 2039, 97862, 4085603, 193690690]),
+    ("position3", "8/2p5/3p4/KP5r/1R3p1k/8/4P1P1/8 w - - 0 1",
+     [14, 191, 2812, 43238, 674624, 11030083]),
+    ("position4", "r3k2r/Pppp1ppp/1b3nbN/nP6/BBP1P3/q4N2/Pp1P2PP/R2Q1RK1 w kq - 0 1",
+     [6, 264, 9467, 422333, 15833292]),
+    ("position5", "rnbq1k1r/pp1Pbppp/2p5/8/2B5/8/PPP1NnPP/RNBQK2R w KQ - 1 8",
+     [44, 1486, 62379, 2103487, 89941194]),
+    ("position6", "r4rk1/1pp1qppp/p1np1n2/2b1p1B1/2B1P1b1/P1NP1N2/1PP1QPPP/R4RK1 w - - 0 10",
+     [46, 2079, 89890, 3894594, 164075551]),
+]
+
+
+class Perft():
+    """Count the nodes of a position, optionally timing each phase.
+
+    With ``timed`` the time spent generating, making and unmaking moves is
+    accumulated in ``phases`` (in seconds). Timing every call slows the
+    count down, so node rates should be compared between untimed runs.
+    """
+
+    def __init__(self, board: Board, timed: bool = False) -> None:
+        self.board = board
+        self.timed = timed
+        self.phases = {"generate": 0.0, "make": 0.0, "unmake": 0.0}
+
+    def count(self, depth: int) -> int:
+        """Number of leaves of the move tree ``depth`` plies deep.
+
+        Raises:
+            ValueError: the depth is negative.
+        """
+        if depth <= 0:
+            if depth < 0:
+                raise ValueError(f"cannot count at depth {depth}")
+            return 1
+        if self.timed:
+            ns = {"generate": 0, "make": 0, "unmake": 0}
+            nodes = self.__count_timed(depth, ns)
+            for phase, value in ns.items():
+                self.phases[phase] += value / 1e9
+            return nodes
+        return self.__count(depth)
+
+    def divide(self, depth: int) -> Dict[str, int]:
+        """Node count below each root move, keyed by its UCI name, empty
+        when the side to move has no legal move.
+
+        Raises:
+            ValueError: the depth is below 1.
+        """
+        if depth < 1:
+            raise ValueError(f"cannot divide at depth {depth}")
+        result = {}
+        for move in self.board.generate_moves():
+            self.board.make_move(move)
+            result[move_to_uci(move)] = self.count(depth - 1)
+            self.board.unmake_move()
+        return result
+
+    def __count(self, depth: int) -> int:
+        board = self.board
+        moves = board.generate_moves()
+        # the leaves are not played, their number is the number of moves
+        if depth == 1:
+            return len(moves)
+        nodes = 0
+        for move in moves:
+            board.make_move(move)
+            nodes += self.__count(depth - 1)
+            board.unmake_move()
+        return nodes
+
+    def __count_timed(self, depth: int, ns: Dict[str, int]) -> int:
+        board = self.board
+        clock = time.perf_counter_ns
+        t0 = clock()
+        moves = board.generate_moves()
+        ns["generate"] += clock() - t0
+        if depth == 1:
+            return len(moves)
+        nodes = 0
+        for move in moves:
+            t0 = clock()
+            board.make_move(move)
+            ns["make"] += clock() - t0
+            nodes += self.__count_timed(depth - 1, ns)
+            t0 = clock()
+            board.unmake_move()
+            ns["unmake"] += clock() - t0
+        return nodes
+
+
+def run(fen: str, depth: int, backend: str = "bitboard", timed: bool = False, divide: bool = False) -> dict:
+    """Run perft on a position and return a JSON serializable result."""
+    board = load_fen(Board(backend=backend), fen)
+    perft = Perft(board, timed)
+    start = time.perf_counter()
+    moves = perft.divide(depth) if divide else None
+    nodes = sum(moves.values()) if divide else perft.count(depth)
+    seconds = time.perf_counter() - start
+    result = {
+        "fen": fen,
+        "depth": depth,
+        "nodes": nodes,
+        "seconds": round(seconds, 6),
+        "nps": round(nodes / seconds) if seconds else None,
+    }
+    if timed:
+        result["phases"] = {phase: round(value, 6) for phase, value in perft.phases.items()}
+    if divide:
+        result["divide"] = moves
+    return result
+
+
+def format_result(name: str, result: dict) -> str:
+    line = f"{name:<10} depth {result['depth']}  nodes {result['nodes']:>10}"
+    if "expected" in result:
+        line += "  ok  " if result["ok"] else f"  FAIL (expected {result['expected']})"
+    line += f"  {result['seconds']:8.3f}s  {result['nps'] or 0:>9,} nps"
+    if "phases" in result:
+        line += "  " + "  ".join(f"{phase} {value:.3f}s" for phase, value in result["phases"].items())
+    return line
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Count the move tree leaves of chess positions.")
+    parser.add_argument("--fen", default=STARTING_FEN, help="position to search, the initial one by default")
+    parser.add_argument("--depth", type=int, default=3, help="depth in plies (default: 3)")
+    parser.add_argument("--divide", action="store_true", help="print the node count below each root move")
+    parser.add_argument("--suite", action="store_true", help="run the reference positions and check their counts")
+    parser.add_argument("--backend", choices=BACKENDS, default="bitboard")
+    parser.add_argument("--phases", action="store_true", help="time move generation, make and unmake separately")
+    parser.add_argument("--json", metavar="PATH", help="write the results to a JSON file")
+    args = parser.parse_args(argv)
+    if args.depth < 1:
+        parser.error("the depth must be at least 1")
+
+    results = []
+    failed = False
+    if args.suite:
+        positions = REFERENCE_POSITIONS
+    else:
+        positions = [("position", args.fen, None)]
+
+    for name, fen, counts in positions:
+        depth = min(args.depth, len(counts)) if counts else args.depth
+        try:
+            result = run(fen, depth, args.backend, args.phases, args.divide)
+        except InvalidFenException as e:
+            parser.error(str(e))
+        result["name"] = name
+        if counts:
+            result["expected"] = counts[depth - 1]
+            result["ok"] = result["nodes"] == result["expected"]
+            failed |= not result["ok"]
+        if args.divide:
+            for move, nodes in sorted(result["divide"].items()):
+                print(f"{move}: {nodes}")
+        print(format_result(name, result))
+        results.append(result)
+
+    if args.json:
+        report = {
+            "timestamp": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "backend": args.backend,
+            "results": results,
+        }
+        with open(args.json, "w") as f:
+            json.dump(report, f, indent=2)
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
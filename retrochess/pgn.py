@@ -0,0 +1,285 @@
+#!/usr/bin/env python3
+"""Portable Game Notation.
+
+``read_games`` streams the games of a PGN file one at a time, keeping a single
+game in memory, and ``write_games`` writes them back. The moves of a ``Game``
+are kept as SAN strings as read; ``Game.moves`` replays them on a board,
+parsing each one against its legal moves.
+
+    python pgn.py games.pgn --parse
+    python pgn.py games.pgn --output clean.pgn
+"""
+import argparse
+import os
+import re
+import sys
+import time
+from typing import IO, Dict, Iterable, Iterator, List, Union
+
+from board import BACKENDS, Board
+from fen import STARTING_FEN, InvalidFenException, board_to_fen, load_fen, parse_fen
+
+# tags every game has, in this order, with their value when unknown
+SEVEN_TAG_ROSTER = {
+    "Event": "?",
+    "Site": "?",
+    "Date": "????.??.??",
+    "Round": "?",
+    "White": "?",
+    "Black": "?",
+    "Result": "*",
+}
+
+LINE_LENGTH = 79
+
+_TAG = re.compile(r'\[\s*(\w+)\s+"((?:[^"\\]|\\.)*)"\s*\]')
+# comments, variations, NAGs, move numbers and results are recognized to be
+# skipped, anything else is a move
+_TOKEN = re.compile(r"""
+    \{[^}]*\}? | ;[^\n]* | \$\d+ | [()]
+    | (?P<result>1-0|0-1|1/2-1/2|\*)
+    | \d+\.+
+    | (?P<san>[^\s{}();$]+)
+""", re.VERBOSE)
+
+
+class PgnError(ValueError):
+    pass
+
+
+def _players(headers: Dict[str, str]) -> str:
+    return f"{headers.get('White', '?')} - {headers.get('Black', '?')}"
+
+
+def _load(board: Union[Board, None], fen: str, headers: Dict[str, str]) -> Board:
+    # an invalid FEN tag is an error of the game like an illegal move
+    try:
+        return load_fen(board or Board(backend="bitboard"), fen)
+    except InvalidFenException as e:
+        raise PgnError(f"invalid starting position of {_players(headers)}: {e}") from None
+
+
+class Game():
+    """A game read from or to be written to a PGN file.
+
+    Args:
+        headers (Dict[str, str], optional): tag pairs, in file order.
+        sans (List[str], optional): moves of the main line in SAN.
+        result (str): 1-0, 0-1, 1/2-1/2 or * for an unfinished game.
+    """
+
+    def __init__(self, headers: Union[Dict[str, str], None] = None, sans: Union[List[str], None] = None,
+                 result: str = "*") -> None:
+        self.headers = headers if headers is not None else {}
+        self.sans = sans if sans is not None else []
+        self.result = result
+
+    @property
+    def fen(self) -> str:
+        """The starting position, given by the FEN tag if any."""
+        return self.headers.get("FEN", STARTING_FEN)
+
+    def moves(self, board: Union[Board, None] = None) -> List[int]:
+        """Replay the game and return its moves packed.
+
+        Args:
+            board (Board, optional): board to play the moves on, reused to
+                avoid creating one per game. It is left in the final position.
+
+        Raises:
+            PgnError: the FEN tag is invalid or a move is illegal or ambiguous.
+        """
+        board = _load(board, self.fen, self.headers)
+        moves = []
+        for ply, san in enumerate(self.sans):
+            try:
+                move = board.san_to_move(san)
+            except ValueError as e:
+                raise PgnError(f"{e} at ply {ply + 1} of {_players(self.headers)}") from None
+            board.make_move(move)
+            moves.append(move)
+        return moves
+
+    @classmethod
+    def from_moves(cls, moves: Iterable[int], headers: Union[Dict[str, str], None] = None, fen: str = STARTING_FEN,
+                   result: str = "*", board: Union[Board, None] = None) -> "Game":
+        """Build a game from packed legal moves, naming them in SAN.
+
+        Raises:
+            PgnError: the starting position is invalid.
+        """
+        board = _load(board, fen, headers or {})
+        sans = []
+        for move in moves:
+            sans.append(board.move_to_san(move))
+            board.make_move(move)
+        headers = dict(headers or {})
+        if fen != STARTING_FEN:
+            headers["SetUp"] = "1"
+            headers["FEN"] = fen
+        return cls(headers, sans, result)
+
+    @classmethod
+    def from_board(cls, board: Board, headers: Union[Dict[str, str], None] = None, result: str = "*") -> "Game":
+        """Build a game from the moves played on a board since its position was set."""
+        moves = list(board.state.undo_stack)
+        for _ in moves:
+            board.unmake_move()
+        fen = board_to_fen(board)
+        for undo in moves:
+            board.make_move(undo & 0xFFFF)
+        return cls.from_moves((undo & 0xFFFF for undo in moves), headers, fen, result)
+
+
+def _parse(headers: Dict[str, str], movetext: List[str]) -> Game:
+    game = Game(headers)
+    depth = 0
+    for token in _TOKEN.finditer("".join(movetext)):
+        san = token.group("san")
+        if san is not None:
+            if depth == 0:
+                game.sans.append(san)
+        elif token.group("result") is not None:
+            if depth == 0:
+                game.result = token.group("result")
+        elif token.group() == "(":
+            depth += 1
+        elif token.group() == ")":
+            depth = max(0, depth - 1)
+    if game.result == "*":
+        game.result = headers.get("Result", "*")
+    return game
+
+
+def read_games(source: Union[str, os.PathLike, IO[str]]) -> Iterator[Game]:
+    """Read the games of a PGN file one at a time.
+
+    Comments, variations and NAGs are skipped, only the main line is kept.
+    The moves are not checked, see Game.moves.
+
+    Args:
+        source (str | PathLike | IO[str]): path or text file to read.
+    """
+    if isinstance(source, (str, os.PathLike)):
+        with open(source, encoding="utf-8", errors="replace", buffering=1 << 20) as f:
+            yield from read_games(f)
+        return
+    headers: Dict[str, str] = {}
+    movetext: List[str] = []
+    in_comment = False
+    for line in source:
+        if line[:1] == "[" and not in_comment:
+            # a tag after moves starts the next game
+            if movetext:
+                yield _parse(headers, movetext)
+                headers, movetext = {}, []
+            tag = _TAG.match(line)
+            if tag:
+                headers[tag.group(1)] = tag.group(2).replace('\\"', '"').replace("\\\\", "\\")
+        elif line[:1] == "%":
+            continue
+        elif movetext or line.strip():
+            movetext.append(line)
+            # a comment going on over the next lines may hold lines like tags
+            if "{" in line or "}" in line:
+                in_comment = line.rfind("{") > line.rfind("}")
+    if headers or movetext:
+        yield _parse(headers, movetext)
+
+
+def format_game(game: Game) -> str:
+    """The PGN text of a game, ending with an empty line.
+
+    Raises:
+        PgnError: the FEN tag is invalid, the move numbers cannot be told.
+    """
+    headers = {**SEVEN_TAG_ROSTER, **game.headers, "Result": game.result}
+    lines = []
+    for name in list(SEVEN_TAG_ROSTER) + [name for name in headers if name not in SEVEN_TAG_ROSTER]:
+        value = headers[name].replace("\\", "\\\\").replace('"', '\\"')
+        lines.append(f'[{name} "{value}"]')
+    lines.append("")
+
+    white_first, number = True, 1
+    if game.fen != STARTING_FEN:
+        try:
+            record = parse_fen(game.fen)
+        except InvalidFenException as e:
+            raise PgnError(f"invalid starting position of {_players(game.headers)}: {e}") from None
+        white_first, number = record.white_turn, record.fullmove_number
+    tokens = []
+    for ply, san in enumerate(game.sans):
+        if (ply % 2 == 0) == white_first:
+            tokens.append(f"{number}. {san}")
+        else:
+            if ply == 0:
+                tokens.append(f"{number}... {san}")
+            else:
+                tokens.append(san)
+            number += 1
+    tokens.append(game.result)
+
+    line = ""
+    for token in tokens:
+        if line and len(line) + 1 + len(token) > LINE_LENGTH:
+            lines.append(line)
+            line = token
+        else:
+            line = f"{line} {token}" if line else token
+    lines.append(line)
+    return "\n".join(lines) + "\n\n"
+
+
+def write_games(destination: Union[str, os.PathLike, IO[str]], games: Iterable[Game]) -> int:
+    """Write games to a PGN file, return how many were written."""
+    if isinstance(destination, (str, os.PathLike)):
+        with open(destination, "w", encoding="utf-8", buffering=1 << 20) as f:
+            return write_games(f, games)
+    count = 0
+    for game in games:
+        destination.write(format_game(game))
+        count += 1
+    return count
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Read the games of a PGN file.")
+    parser.add_argument("path", help="file to read, - for the standard input")
+    parser.add_argument("--parse", action="store_true", help="replay the moves of every game to check them")
+    parser.add_argument("--backend", choices=BACKENDS, default="bitboard")
+    parser.add_argument("--output", metavar="PATH", help="write the games back with their moves in standard SAN")
+    args = parser.parse_args(argv)
+
+    board = Board(backend=args.backend)
+    games = read_games(sys.stdin if args.path == "-" else args.path)
+    stats = {"games": 0, "plies": 0, "errors": 0}
+
+    def checked(games: Iterable[Game]) -> Iterator[Game]:
+        for game in games:
+            stats["games"] += 1
+            stats["plies"] += len(game.sans)
+            if args.parse or args.output:
+                try:
+                    moves = game.moves(board)
+                    if args.output:
+                        game = Game.from_moves(moves, game.headers, game.fen, game.result, board)
+                except PgnError as e:
+                    stats["errors"] += 1
+                    print(e, file=sys.stderr)
+                    continue
+            yield game
+
+    start = time.perf_counter()
+    if args.output:
+        write_games(args.output, checked(games))
+    else:
+        for _ in checked(games):
+            pass
+    seconds = time.perf_counter() - start
+    rate = round(stats["games"] / seconds) if seconds else 0
+    print(f"{stats['games']} games  {stats['plies']} plies  {stats['errors']} errors  {seconds:.3f}s  {rate:,} games/s")
+    return 1 if stats["errors"] else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,435 @@
+"""Alpha-beta search picking a move for the side to move of a Board.
+
+The search is a fail-soft negamax with iterative deepening, aspiration
+windows and a captures-only quiescence search. Moves are tried in the order:
+transposition table move, captures by MVV-LVA, killer moves, then quiet moves
+by history score. It stops at a depth, a node budget or a deadline, whichever
+comes first.
+"""
+import argparse
+import time
+from typing import Callable, List, Union
+
+from board import BACKENDS, BLACK, EMPTY, Board, move_to_uci
+from tt import EXACT, LOWER, UPPER, TranspositionTable, unpack
+
+MATE = 30000
+# scores beyond this are mates, stored in the table relative to the node
+MATE_BOUND = MATE - 1000
+INFINITE = MATE + 1
+MAX_PLY = 128
+
+ASPIRATION_WINDOW = 40
+# nodes between two looks at the clock
+CHECK_EVERY = 1024
+
+PAWN, KNIGHT, BISHOP, ROOK, QUEEN, KING = range(1, 7)
+PIECE_VALUES = (0, 100, 320, 330, 500, 900, 0)
+
+# piece-square tables seen from white, row 0 being the 8th rank
+_PST = {
+    PAWN: (
+         0,  0,  0,  0,  0,  0,  0,  0,
+        50, 50, 50, 50, 50, 50, 50, 50,
+        10, 10, 20, 30, 30, 20, 10, 10,
+         5,  5, 10, 25, 25, 10,  5,  5,
+         0,  0,  0, 20, 20,  0,  0,  0,
+         5, -5,-10,  0,  0,-10, -5,  5,
+         5, 10, 10,-20,-20, 10, 10,  5,
+         0,  0,  0,  0,  0,  0,  0,  0),
+    KNIGHT: (
+        -50,-40,-30,-30,-30,-30,-40,-50,
+        -40,-20,  0,  0,  0,  0,-20,-40,
+        -30,  0, 10, 15, 15, 10,  0,-30,
+        -30,  5, 15, 20, 20, 15,  5,-30,
+        -30,  0, 15, 20, 20, 15,  0,-30,
+        -30,  5, 10, 15, 15, 10,  5,-30,
+        -40,-20,  0,  5,  5,  0,-20,-40,
+        -50,-40,-30,-30,-30,-30,-40,-50),
+    BISHOP: (
+        -20,-10,-10,-10,-10,-10,-10,-20,
+        -10,  0,  0,  0,  0,  0,  0,-10,
+        -10,  0,  5, 10, 10,  5,  0,-10,
+        -10,  5,  5, 10, 10,  5,  5,-10,
+        -10,  0, 10, 10, 10, 10,  0,-10,
+        -10, 10, 10, 10, 10, 10, 10,-10,
+        -10,  5,  0,  0,  0,  0,  5,-10,
+        -20,-10,-10,-10,-10,-10,-10,-20),
+    ROOK: (
+         0,  0,  0,  0,  0,  0,  0,  0,
+         5, 10, 10, 10, 10, 10, 10,  5,
+        -5,  0,  0,  0,  0,  0,  0, -5,
+        -5,  0,  0,  0,  0,  0,  0, -5,
+        -5,  0,  0,  0,  0,  0,  0, -5,
+        -5,  0,  0,  0,  0,  0,  0, -5,
+        -5,  0,  0,  0,  0,  0,  0, -5,
+         0,  0,  0,  5,  5,  0,  0,  0),
+    QUEEN: (
+        -20,-10,-10, -5, -5,-10,-10,-20,
+        -10,  0,  0,  0,  0,  0,  0,-10,
+        -10,  0,  5,  5,  5,  5,  0,-10,
+         -5,  0,  5,  5,  5,  5,  0, -5,
+          0,  0,  5,  5,  5,  5,  0, -5,
+        -10,  5,  5,  5,  5,  5,  0,-10,
+        -10,  0,  5,  0,  0,  0,  0,-10,
+        -20,-10,-10, -5, -5,-10,-10,-20),
+    KING: (
+        -30,-40,-40,-50,-50,-40,-40,-30,
+        -30,-40,-40,-50,-50,-40,-40,-30,
+        -30,-40,-40,-50,-50,-40,-40,-30,
+        -30,-40,-40,-50,-50,-40,-40,-30,
+        -20,-30,-30,-40,-40,-30,-30,-20,
+        -10,-20,-20,-20,-20,-20,-20,-10,
+         20, 20,  0,  0,  0,  0, 20, 20,
+         20, 30, 10,  0,  0, 10, 30, 20),
+}
+
+
+def _square_values() -> List[List[int]]:
+    # material plus position of every piece code on every square, from the
+    # point of view of white
+    values = [[0] * 64 for _ in range(16)]
+    for ptype, table in _PST.items():
+        for sq in range(64):
+            values[ptype][sq] = PIECE_VALUES[ptype] + table[sq]
+            values[ptype | BLACK][sq] = -(PIECE_VALUES[ptype] + table[sq ^ 56])
+    return values
+
+
+SQUARE_VALUES = _square_values()
+
+
+def evaluate(board: Board) -> int:
+    """Static score of the position for the side to move, in centipawns."""
+    score = 0
+    bitboards = board.bitboards
+    if bitboards is not None:
+        for code in range(1, 15):
+            bb = bitboards.pieces[code]
+            values = SQUARE_VALUES[code]
+            while bb:
+                lsb = bb & -bb
+                score += values[lsb.bit_length() - 1]
+                bb ^= lsb
+    else:
+        for sq, code in enumerate(board.squares):
+            if code:
+                score += SQUARE_VALUES[code][sq]
+    return score if board.state.white_turn else -score
+
+
+def allocate_time(remaining: float, increment: float = 0, moves_to_go: Union[int, None] = None) -> float:
+    """Seconds to spend on a move given the clock of the side to move."""
+    moves = moves_to_go if moves_to_go else 30
+    budget = remaining / moves + increment * 0.8
+    # always keep a margin on the clock
+    return max(0.01, min(budget, remaining * 0.5 - 0.05))
+
+
+class SearchResult():
+    def __init__(self, move: int, score: int, depth: int, nodes: int, seconds: float, pv: List[int]) -> None:
+        self.move = move
+        self.score = score
+        self.depth = depth
+        self.nodes = nodes
+        self.seconds = seconds
+        self.pv = pv
+
+    @property
+    def nps(self) -> int:
+        return int(self.nodes / self.seconds) if self.seconds else 0
+
+    def __str__(self) -> str:
+        pv = " ".join(move_to_uci(m) for m in self.pv)
+        return f"depth {self.depth} score {format_score(self.score)} nodes {self.nodes} nps {self.nps} time {int(self.seconds * 1000)} pv {pv}"
+
+
+def format_score(score: int) -> str:
+    """Score in UCI notation, ``cp <centipawns>`` or ``mate <moves>``."""
+    if score > MATE_BOUND:
+        return f"mate {(MATE - score + 1) // 2}"
+    if score < -MATE_BOUND:
+        return f"mate {-((MATE + score) // 2)}"
+    return f"cp {score}"
+
+
+class Search():
+    """Search the best move of a board.
+
+    The board is played on with make_move/unmake_move during the search and is
+    left in its original position afterwards.
+    """
+
+    def __init__(self, board: Board, tt: Union[TranspositionTable, None] = None) -> None:
+        self.board = board
+        self.tt = tt if tt is not None else TranspositionTable()
+        self.history = [[0] * 64 for _ in range(64)]
+        self.killers = [[0, 0] for _ in range(MAX_PLY)]
+        self.nodes = 0
+        self.stopped = False
+
+    def stop(self):
+        """Ask a running search to return, from any thread.
+
+        run() does not clear the request, so a stop coming before it starts
+        is not lost: the search returns at once with a legal move. A Search
+        is made for each run.
+        """
+        self.stopped = True
+
+    def run(self, depth: Union[int, None] = None, nodes: Union[int, None] = None, movetime: Union[float, None] = None,
+            info: Union[Callable[[SearchResult], None], None] = None, first_depth: int = 1) -> SearchResult:
+        """Search until one of the limits is reached.
+
+        Args:
+            depth (int, optional): last depth to complete
+            nodes (int, optional): node budget
+            movetime (float, optional): seconds to search
+            info (Callable, optional): called with the result of each completed
+                iteration
+            first_depth (int): depth of the first iteration, helpers of a
+                parallel search start deeper than the main search
+
+        Returns:
+            SearchResult: the best move of the deepest completed iteration, with
+            the depth reached, node count and timing of the whole search.
+        """
+        max_depth = min(depth or MAX_PLY - 1, MAX_PLY - 1)
+        self.node_limit = nodes
+        self.start = time.perf_counter()
+        self.deadline = self.start + movetime if movetime is not None else None
+        self.nodes = 0
+        self.next_check = CHECK_EVERY
+        self.codes = self.board.squares
+        self.killers = [[0, 0] for _ in range(MAX_PLY)]
+        for row in self.history:
+            for i in range(64):
+                row[i] >>= 3
+        self.tt.new_search()
+
+        root_moves = self.board.generate_moves()
+        result = SearchResult(root_moves[0] if root_moves else 0, 0, 0, 0, 0.0, root_moves[:1])
+        if not root_moves:
+            result.score = -MATE if self.board.in_check() else 0
+            return result
+
+        score = 0
+        self.depth_reached = 0
+        for d in range(min(first_depth, max_depth), max_depth + 1):
+            if d < 4:
+                score = self.negamax(d, -INFINITE, INFINITE, 0)
+            else:
+                score = self.aspiration(d, score)
+            if self.stopped:
+                break
+            best = unpack(self.tt.probe(self.board.key))[0]
+            if best not in root_moves:
+                best = root_moves[0]
+            self.depth_reached = d
+            result = SearchResult(best, score, d, self.nodes, time.perf_counter() - self.start, self.principal_variation(d))
+            if info is not None:
+                info(result)
+            # a mate was found, or the next iteration would not finish in time
+            if abs(score) > MATE_BOUND:
+                break
+            if self.deadline is not None and time.perf_counter() - self.start > (self.deadline - self.start) * 0.5:
+                break
+
+        result.nodes = self.nodes
+        result.seconds = time.perf_counter() - self.start
+        return result
+
+    def aspiration(self, depth: int, previous: int) -> int:
+        # search a window around the last score, widening it on each failure
+        delta = ASPIRATION_WINDOW
+        alpha, beta = previous - delta, previous + delta
+        while True:
+            score = self.negamax(depth, alpha, beta, 0)
+            if self.stopped:
+                return score
+            if score <= alpha:
+                alpha = max(-INFINITE, alpha - delta)
+            elif score >= beta:
+                beta = min(INFINITE, beta + delta)
+            else:
+                return score
+            delta *= 2
+
+    def __out_of_budget(self) -> bool:
+        self.next_check = self.nodes + CHECK_EVERY
+        # the limits only apply once there is a move to answer with
+        if self.depth_reached == 0:
+            return self.stopped
+        if self.node_limit is not None and self.nodes >= self.node_limit:
+            self.stopped = True
+        elif self.deadline is not None and time.perf_counter() >= self.deadline:
+            self.stopped = True
+        return self.stopped
+
+    def order(self, moves: List[int], tt_move: int, ply: int) -> List[int]:
+        codes = self.codes
+        killers = self.killers[ply]
+        history = self.history
+
+        def score(move: int) -> int:
+            if move == tt_move:
+                return 1 << 30
+            dest = move >> 6 & 63
+            victim = codes[dest]
+            if victim != EMPTY or move >> 12:
+                # most valuable victim, least valuable attacker
+                return (1 << 24) + PIECE_VALUES[victim & 7] * 16 + PIECE_VALUES[move >> 12] - (codes[move & 63] & 7)
+            if move == killers[0] or move == killers[1]:
+                return 1 << 23
+            return history[move & 63][dest]
+
+        return sorted(moves, key=score, reverse=True)
+
+    def negamax(self, depth: int, alpha: int, beta: int, ply: int) -> int:
+        board = self.board
+        self.nodes += 1
+        if self.nodes >= self.next_check and self.__out_of_budget():
+            return 0
+        # check extensions can go on past the tables indexed by ply
+        if ply >= MAX_PLY - 1:
+            return evaluate(board)
+
+        # a position repeated once is scored as the draw it can be made into
+        state = board.state
+        if ply and (state.halfmove_clock >= 100 or state.repetitions()):
+            return 0
+
+        key = board.key
+        tt_move = 0
+        entry = self.tt.probe(key)
+        if entry:
+            tt_move, tt_score, tt_depth, bound = unpack(entry)
+            if ply and tt_depth >= depth:
+                if tt_score > MATE_BOUND:
+                    tt_score -= ply
+                elif tt_score < -MATE_BOUND:
+                    tt_score += ply
+                if bound == EXACT or (bound == LOWER and tt_score >= beta) or (bound == UPPER and tt_score <= alpha):
+                    return tt_score
+
+        in_check = board.in_check()
+        if in_check:
+            depth += 1
+        if depth <= 0:
+            return self.quiescence(alpha, beta, ply)
+
+        moves = board.generate_moves()
+        if not moves:
+            return -MATE + ply if in_check else 0
+
+        original_alpha = alpha
+        best_score = -INFINITE
+        best_move = 0
+        codes = self.codes
+        for move in self.order(moves, tt_move, ply):
+            quiet = codes[move >> 6 & 63] == EMPTY and not move >> 12
+            board.make_move(move)
+            score = -self.negamax(depth - 1, -beta, -alpha, ply + 1)
+            board.unmake_move()
+            if self.stopped:
+                return 0
+            if score > best_score:
+                best_score, best_move = score, move
+                if score > alpha:
+                    alpha = score
+                    if score >= beta:
+                        if quiet:
+                            killers = self.killers[ply]
+                            if killers[0] != move:
+                                killers[0], killers[1] = move, killers[0]
+                            self.history[move & 63][move >> 6 & 63] += depth * depth
+                        break
+
+        if best_score >= beta:
+            bound = LOWER
+        elif best_score > original_alpha:
+            bound = EXACT
+        else:
+            bound = UPPER
+        stored = best_score
+        if stored > MATE_BOUND:
+            stored += ply
+        elif stored < -MATE_BOUND:
+            stored -= ply
+        self.tt.store(key, best_move, stored, depth, bound)
+        return best_score
+
+    def quiescence(self, alpha: int, beta: int, ply: int) -> int:
+        board = self.board
+        self.nodes += 1
+        if self.nodes >= self.next_check and self.__out_of_budget():
+            return 0
+
+        stand_pat = evaluate(board)
+        if stand_pat >= beta or ply >= MAX_PLY - 1:
+            return stand_pat
+        if stand_pat > alpha:
+            alpha = stand_pat
+
+        codes = self.codes
+        captures = [m for m in board.generate_moves() if codes[m >> 6 & 63] != EMPTY or m >> 12]
+        best_score = stand_pat
+        for move in self.order(captures, 0, ply):
+            board.make_move(move)
+            score = -self.quiescence(-beta, -alpha, ply + 1)
+            board.unmake_move()
+            if self.stopped:
+                return 0
+            if score > best_score:
+                best_score = score
+                if score > alpha:
+                    alpha = score
+                    if score >= beta:
+                        break
+        return best_score
+
+    def principal_variation(self, depth: int) -> List[int]:
+        """Follow the best moves of the table from the current position."""
+        board = self.board
+        pv = []
+        seen = set()
+        while len(pv) < depth and board.key not in seen:
+            seen.add(board.key)
+            move = unpack(self.tt.probe(board.key))[0]
+            if not move or move not in board.generate_moves():
+                break
+            pv.append(move)
+            board.make_move(move)
+        for _ in pv:
+            board.unmake_move()
+        return pv
+
+
+def best_move(board: Board, depth: Union[int, None] = None, nodes: Union[int, None] = None, movetime: Union[float, None] = None) -> SearchResult:
+    """Search the position of a board with a fresh table."""
+    return Search(board).run(depth=depth, nodes=nodes, movetime=movetime)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Search the best move of a position.")
+    parser.add_argument("--fen", help="position to search, the initial one by default")
+    parser.add_argument("--depth", type=int, help="last depth to complete")
+    parser.add_argument("--nodes", type=int, help="node budget")
+    parser.add_argument("--movetime", type=float, help="seconds to search")
+    parser.add_argument("--hash", type=float, default=16, help="transposition table size in MB (default: 16)")
+    parser.add_argument("--backend", choices=BACKENDS, default="bitboard")
+    args = parser.parse_args(argv)
+
+    from fen import load_fen
+    board = Board(backend=args.backend)
+    if args.fen:
+        load_fen(board, args.fen)
+    if args.depth is None and args.nodes is None and args.movetime is None:
+        args.movetime = 5.0
+    search = Search(board, TranspositionTable(args.hash))
+    result = search.run(depth=args.depth, nodes=args.nodes, movetime=args.movetime, info=lambda r: print(f"info {r}"))
+    print(f"bestmove {move_to_uci(result.move) if result.move else '0000'}  (depth {result.depth}, {result.nodes} nodes, {result.nps} nps)")
+
+
+if __name__ == '__main__':
+    main()
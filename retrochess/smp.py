@@ -0,0 +1,191 @@
+#!/usr/bin/env python3
+"""Lazy SMP: search a position on several processes sharing one hash table.
+
+The main search runs in the calling process, helper processes search the same
+position at the same time, half of them one ply deeper, and publish what they
+find in a ``SharedTranspositionTable``. Only the main search decides the best
+move; the helpers fill the table with results it picks up.
+
+    python smp.py --depth 6 --workers 1 2 4 8
+"""
+import argparse
+import json
+import multiprocessing
+import platform
+import sys
+import threading
+import time
+from datetime import datetime, timezone
+from typing import Callable, List, Sequence, Union
+
+from board import BACKENDS, Board, move_to_uci
+from fen import load_fen
+from perft import REFERENCE_POSITIONS
+from search import Search, SearchResult
+from tt import AGE_MASK, SharedTranspositionTable
+
+
+def _helper(index: int, name: str, size: int, backend: str, jobs, done, stop):
+    tt = SharedTranspositionTable.attach(name, size)
+    board = Board(backend=backend)
+    try:
+        while True:
+            job = jobs.get()
+            if job is None:
+                break
+            fen, moves, age = job
+            load_fen(board, fen)
+            for move in moves:
+                board.make_move(move)
+            # Search.run ages the table, start from the age the main search has
+            tt.age = (age - 1) & AGE_MASK
+            search = Search(board, tt)
+
+            # the search keeps a stop coming before run() starts
+            def watch():
+                stop.wait()
+                search.stop()
+
+            watcher = threading.Thread(target=watch, daemon=True)
+            watcher.start()
+            search.run(first_depth=1 + index % 2)
+            watcher.join()
+            done.put(search.nodes)
+    finally:
+        tt.close()
+
+
+class LazySmp():
+    """Helper processes for the searches of a position.
+
+    Args:
+        threads (int): number of searching processes, the calling one included.
+        megabytes (float): size of the shared transposition table.
+        backend (str): board backend of the helpers.
+    """
+
+    def __init__(self, threads: int, megabytes: float = 16, backend: str = "bitboard") -> None:
+        self.tt = SharedTranspositionTable(megabytes)
+        self.done = multiprocessing.Queue()
+        self.stop_event = multiprocessing.Event()
+        self.jobs = []
+        self.helpers = []
+        for index in range(1, threads):
+            jobs = multiprocessing.Queue()
+            helper = multiprocessing.Process(
+                target=_helper,
+                args=(index, self.tt.name, self.tt.size, backend, jobs, self.done, self.stop_event),
+                daemon=True,
+            )
+            helper.start()
+            self.jobs.append(jobs)
+            self.helpers.append(helper)
+        self.running = False
+
+    @property
+    def threads(self) -> int:
+        return len(self.helpers) + 1
+
+    def start(self, fen: str, moves: Sequence[int] = ()):
+        """Start the helpers on a position, before the main search starts."""
+        self.stop()
+        age = (self.tt.age + 1) & AGE_MASK
+        for jobs in self.jobs:
+            jobs.put((fen, tuple(moves), age))
+        self.running = bool(self.jobs)
+
+    def stop(self) -> int:
+        """Stop the helpers and return the number of nodes they searched."""
+        if not self.running:
+            return 0
+        self.stop_event.set()
+        nodes = sum(self.done.get() for _ in self.helpers)
+        self.stop_event.clear()
+        self.running = False
+        return nodes
+
+    def run(self, board: Board, fen: str, moves: Sequence[int] = (), depth: Union[int, None] = None,
+            nodes: Union[int, None] = None, movetime: Union[float, None] = None,
+            info: Union[Callable[[SearchResult], None], None] = None) -> SearchResult:
+        """Search the position given by a FEN and moves, also set up on the board.
+
+        The node count of the result includes the nodes of the helpers.
+        """
+        self.start(fen, moves)
+        try:
+            result = Search(board, self.tt).run(depth=depth, nodes=nodes, movetime=movetime, info=info)
+        finally:
+            helper_nodes = self.stop()
+        result.nodes += helper_nodes
+        return result
+
+    def close(self):
+        self.stop()
+        for jobs in self.jobs:
+            jobs.put(None)
+        for helper in self.helpers:
+            helper.join()
+        self.jobs = []
+        self.helpers = []
+        self.tt.close()
+
+
+def benchmark(fens: List[str], depth: int, workers: Sequence[int], megabytes: float = 16,
+              backend: str = "bitboard") -> List[dict]:
+    """Time to reach a depth on each position with each number of workers."""
+    results = []
+    for threads in workers:
+        smp = LazySmp(threads, megabytes, backend)
+        try:
+            for fen in fens:
+                smp.tt.clear()
+                board = load_fen(Board(backend=backend), fen)
+                start = time.perf_counter()
+                result = smp.run(board, fen, depth=depth)
+                results.append({
+                    "fen": fen,
+                    "workers": threads,
+                    "depth": result.depth,
+                    "seconds": round(time.perf_counter() - start, 6),
+                    "nodes": result.nodes,
+                    "move": move_to_uci(result.move),
+                })
+        finally:
+            smp.close()
+    return results
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Measure the time to depth speedup of lazy SMP.")
+    parser.add_argument("--fen", action="append", help="position to search, the reference ones by default")
+    parser.add_argument("--depth", type=int, default=5, help="depth to reach (default: 5)")
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4, 8])
+    parser.add_argument("--hash", type=float, default=16, help="transposition table size in MB (default: 16)")
+    parser.add_argument("--backend", choices=BACKENDS, default="bitboard")
+    parser.add_argument("--json", metavar="PATH", help="write the results to a JSON file")
+    args = parser.parse_args(argv)
+
+    fens = args.fen or [fen for _, fen, _ in REFERENCE_POSITIONS]
+    results = benchmark(fens, args.depth, args.workers, args.hash, args.backend)
+    base = sum(r["seconds"] for r in results if r["workers"] == args.workers[0])
+    for threads in args.workers:
+        runs = [r for r in results if r["workers"] == threads]
+        seconds = sum(r["seconds"] for r in runs)
+        nodes = sum(r["nodes"] for r in runs)
+        print(f"workers {threads:>2}  depth {args.depth}  {seconds:8.3f}s  {nodes:>10} nodes  "
+              f"speedup {base / seconds if seconds else 0:5.2f}")
+    if args.json:
+        report = {
+            "timestamp": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "backend": args.backend,
+            "results": results,
+        }
+        with open(args.json, "w") as f:
+            json.dump(report, f, indent=2)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
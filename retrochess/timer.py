@@ -1,4 +1,193 @@
+"""Chess clock.
 
-class Timer():
-    def __init__(self) -> None:
-        pass
\ No newline at end of file
+A ``TimeControl`` is one or more stages, written as in the TimeControl tag of
+PGN, with seconds, plus a Bronstein delay:
+
+    300+3             5 minutes for the game, 3 seconds added per move
+    40/5400:1800+30   40 moves in 90 minutes, then 30 minutes, 30 s per move
+    900d5             15 minutes, up to 5 seconds of each move given back
+
+A ``Clock`` keeps the time of both sides in integer nanoseconds from
+``time.monotonic_ns``. It only does arithmetic when asked, a stopped clock or
+one nobody looks at costs nothing.
+"""
+import re
+import time
+from typing import List, NamedTuple, Union
+
+# nanoseconds in a millisecond
+MS = 1_000_000
+
+_STAGE = re.compile(r"(?:(\d+)/)?(\d+(?:\.\d+)?)(?:\+(\d+(?:\.\d+)?))?(?:d(\d+(?:\.\d+)?))?")
+
+
+class Stage(NamedTuple):
+    """A period of a time control.
+
+    moves is the number of moves to play in the stage, None for the rest of
+    the game. Times are in milliseconds.
+    """
+    moves: Union[int, None]
+    base: int
+    increment: int = 0
+    delay: int = 0
+
+
+class TimeControl():
+    """The stages of a time control, the last one repeated when it has a move count.
+
+    Args:
+        stages (List[Stage]): the stages, in the order they are played.
+    """
+
+    def __init__(self, stages: List[Stage]) -> None:
+        if not stages:
+            raise ValueError("a time control needs a stage")
+        self.stages = stages
+
+    @classmethod
+    def parse(cls, text: str) -> "TimeControl":
+        """Read a time control like 40/5400:1800+30, times in seconds.
+
+        Raises:
+            ValueError: the text is not a time control.
+        """
+        stages = []
+        for part in text.strip().split(":"):
+            match = _STAGE.fullmatch(part)
+            if match is None:
+                raise ValueError(f"invalid time control {text!r}")
+            moves, base, increment, delay = match.groups()
+            stages.append(Stage(int(moves) if moves else None, round(float(base) * 1000),
+                                round(float(increment or 0) * 1000), round(float(delay or 0) * 1000)))
+        return cls(stages)
+
+    def stage(self, index: int) -> Stage:
+        return self.stages[min(index, len(self.stages) - 1)]
+
+    def __str__(self) -> str:
+        def seconds(ms: int) -> str:
+            return str(ms // 1000) if ms % 1000 == 0 else str(ms / 1000)
+        parts = []
+        for stage in self.stages:
+            part = f"{stage.moves}/" if stage.moves else ""
+            part += seconds(stage.base)
+            if stage.increment:
+                part += f"+{seconds(stage.increment)}"
+            if stage.delay:
+                part += f"d{seconds(stage.delay)}"
+            parts.append(part)
+        return ":".join(parts)
+
+
+def format_time(ms: int) -> str:
+    """The time shown for a remaining time: h:mm:ss, m:ss, then tenths under 10 seconds."""
+    ms = max(0, ms)
+    if ms < 10_000:
+        return f"{ms // 1000}.{ms // 100 % 10}"
+    seconds = ms // 1000
+    if seconds < 3600:
+        return f"{seconds // 60}:{seconds % 60:02d}"
+    return f"{seconds // 3600}:{seconds // 60 % 60:02d}:{seconds % 60:02d}"
+
+
+class Clock():
+    """The clocks of both sides, the side to move running.
+
+    The clock starts with the first press, so white does not lose time
+    before the first move, and stops when a side runs out of time.
+
+    Args:
+        control (TimeControl): time control of both sides.
+    """
+
+    def __init__(self, control: TimeControl) -> None:
+        self.control = control
+        self.reset()
+
+    def reset(self):
+        """Set both sides back to the start of the time control, stopped, white to move."""
+        base = self.control.stage(0).base * MS
+        # indexed by side, 0 for black and 1 for white
+        self.left = [base, base]
+        self.stage = [0, 0]
+        self.moves = [0, 0]
+        self.white_turn = True
+        self.running = False
+        self.flagged: Union[bool, None] = None
+        # when the running side started its move
+        self.started = 0
+
+    def remaining(self, white: bool, now: Union[int, None] = None) -> int:
+        """Time left to a side in milliseconds, counting the move going on."""
+        left = self.left[white]
+        if self.running and white == self.white_turn:
+            left -= (time.monotonic_ns() if now is None else now) - self.started
+        return max(0, left) // MS
+
+    def press(self, now: Union[int, None] = None):
+        """End the move of the side to move, the other side's clock starts."""
+        if self.flagged is not None:
+            return
+        now = time.monotonic_ns() if now is None else now
+        side = self.white_turn
+        if self.running:
+            spent = now - self.started
+            stage = self.control.stage(self.stage[side])
+            left = self.left[side] - spent
+            if left <= 0:
+                self.__flag(side)
+                return
+            left += min(spent, stage.delay * MS) + stage.increment * MS
+            self.moves[side] += 1
+            if stage.moves and self.moves[side] == stage.moves:
+                # the time of the next stage adds up to what is left
+                self.stage[side] += 1
+                self.moves[side] = 0
+                left += self.control.stage(self.stage[side]).base * MS
+            self.left[side] = left
+        self.white_turn = not side
+        self.running = True
+        self.started = now
+
+    def switch(self, now: Union[int, None] = None):
+        """Give the move back to the other side, for a takeback, without increment."""
+        if not self.running:
+            self.white_turn = not self.white_turn
+            return
+        now = time.monotonic_ns() if now is None else now
+        self.left[self.white_turn] -= now - self.started
+        self.white_turn = not self.white_turn
+        self.started = now
+
+    def stop(self, now: Union[int, None] = None):
+        if self.running:
+            now = time.monotonic_ns() if now is None else now
+            self.left[self.white_turn] -= now - self.started
+            self.running = False
+
+    def check_flag(self, now: Union[int, None] = None) -> bool:
+        """Stop the clock if the side to move ran out of time, return whether a side did."""
+        if self.running:
+            now = time.monotonic_ns() if now is None else now
+            if self.left[self.white_turn] - (now - self.started) <= 0:
+                self.__flag(self.white_turn)
+        return self.flagged is not None
+
+    def next_change(self, now: Union[int, None] = None) -> Union[int, None]:
+        """Milliseconds until the time shown for the running side changes,
+        None when the clock is stopped."""
+        if not self.running:
+            return None
+        now = time.monotonic_ns() if now is None else now
+        left = self.left[self.white_turn] - (now - self.started)
+        if left <= 0:
+            return 0
+        unit = 100 * MS if left < 10_000 * MS else 1000 * MS
+        # the shown time drops when the time left goes below a whole unit
+        return left % unit // MS + 1
+
+    def __flag(self, side: bool):
+        self.left[side] = 0
+        self.running = False
+        self.flagged = side
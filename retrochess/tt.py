@@ -0,0 +1,233 @@
+"""Fixed size hash tables indexed by zobrist keys.
+
+Both tables are preallocated ``array('Q')`` stores: their memory is set once
+from a size in megabytes and stays flat however many positions go through them.
+"""
+from array import array
+from typing import List, Tuple, Union
+
+# bound types
+EXACT = 1
+LOWER = 2
+UPPER = 3
+
+# layout of a packed entry: move | score << 16 | depth << 32 | bound << 40 | age << 42
+SCORE_OFFSET = 1 << 15
+MAX_DEPTH = 255
+AGE_MASK = 63
+
+BUCKET_SIZE = 4
+ENTRY_BYTES = 16
+
+_GOLDEN = 0x9E3779B97F4A7C15
+_FULL = 0xFFFF_FFFF_FFFF_FFFF
+
+# bytes zeroed at a time by clear()
+ZERO_CHUNK = 1 << 20
+
+
+def pack(move: int, score: int, depth: int, bound: int, age: int) -> int:
+    return move | (score + SCORE_OFFSET) << 16 | min(depth, MAX_DEPTH) << 32 | bound << 40 | age << 42
+
+
+def unpack(data: int) -> Tuple[int, int, int, int]:
+    """Split an entry into move, score, depth and bound."""
+    return data & 0xFFFF, (data >> 16 & 0xFFFF) - SCORE_OFFSET, data >> 32 & 0xFF, data >> 40 & 3
+
+
+def _zero(buffer):
+    # clear a buffer in place, a chunk at a time, without allocating its size again
+    view = memoryview(buffer).cast("B")
+    zeros = bytes(min(len(view), ZERO_CHUNK))
+    for start in range(0, len(view), len(zeros)):
+        end = min(start + len(zeros), len(view))
+        view[start:end] = zeros[:end - start]
+    view.release()
+
+
+def _entries_for(megabytes: float, entry_bytes: int, multiple: int = 1) -> int:
+    # largest power of two number of buckets fitting in the budget
+    buckets = max(1, int(megabytes * 2**20) // (entry_bytes * multiple))
+    return (1 << (buckets.bit_length() - 1)) * multiple
+
+
+class TranspositionTable():
+    """Search results of positions, bucketed with depth and age replacement.
+
+    Each entry takes 16 bytes: the full key xored with the packed result in
+    ``keys`` and the packed result in ``data``, so that an entry torn by
+    concurrent writers of a shared table never matches a key. A key maps to a
+    bucket of ``BUCKET_SIZE`` consecutive entries; storing a new position
+    replaces the entry of the same position if any, else an empty one, else
+    the one with the lowest depth, entries left over from previous searches
+    counting as shallower the older they are.
+    """
+
+    def __init__(self, megabytes: float = 16) -> None:
+        self.resize(megabytes)
+
+    def resize(self, megabytes: float):
+        """Reallocate the table, dropping its content."""
+        size = _entries_for(megabytes, ENTRY_BYTES, BUCKET_SIZE)
+        self.keys = array('Q', [0]) * size
+        self.data = array('Q', [0]) * size
+        self.mask = size // BUCKET_SIZE - 1
+        self.age = 0
+
+    @property
+    def size(self) -> int:
+        return len(self.keys)
+
+    @property
+    def megabytes(self) -> float:
+        return len(self.keys) * ENTRY_BYTES / 2**20
+
+    def clear(self):
+        """Empty the table in place, keeping its memory."""
+        _zero(self.keys)
+        _zero(self.data)
+        self.age = 0
+
+    def new_search(self):
+        """Age the entries, to be called once before each search."""
+        self.age = (self.age + 1) & AGE_MASK
+
+    def probe(self, key: int) -> int:
+        """Return the packed entry of a position, 0 when not found."""
+        keys = self.keys
+        i = (key & self.mask) * BUCKET_SIZE
+        data = self.data
+        for slot in range(i, i + BUCKET_SIZE):
+            entry = data[slot]
+            if keys[slot] ^ entry == key:
+                return entry
+        return 0
+
+    def store(self, key: int, move: int, score: int, depth: int, bound: int):
+        keys = self.keys
+        data = self.data
+        age = self.age
+        i = (key & self.mask) * BUCKET_SIZE
+        victim = i
+        victim_worth = None
+        for slot in range(i, i + BUCKET_SIZE):
+            entry = data[slot]
+            same = keys[slot] ^ entry == key
+            if same or entry == 0:
+                # keep the best move of the position when the new result has none
+                if same and move == 0:
+                    move = entry & 0xFFFF
+                victim = slot
+                break
+            worth = (entry >> 32 & 0xFF) - 4 * ((age - (entry >> 42)) & AGE_MASK)
+            if victim_worth is None or worth < victim_worth:
+                victim, victim_worth = slot, worth
+        entry = pack(move, score, depth, bound, age)
+        keys[victim] = key ^ entry
+        data[victim] = entry
+
+    def hashfull(self) -> int:
+        """Permille of the first thousand entries used by the current search."""
+        sample = min(1000, len(self.data))
+        used = sum(1 for entry in self.data[:sample] if entry and entry >> 42 == self.age)
+        return used * 1000 // sample
+
+
+class SharedTranspositionTable(TranspositionTable):
+    """A transposition table in shared memory, for searches on several processes.
+
+    The creating process owns the memory and must close the table, other
+    processes attach to it by name with ``SharedTranspositionTable.attach``.
+    Entries are read and written without locks, see TranspositionTable.
+    """
+
+    def __init__(self, megabytes: float = 16) -> None:
+        self.shm = None
+        self.owner = True
+        super().__init__(megabytes)
+
+    @classmethod
+    def attach(cls, name: str, size: int) -> "SharedTranspositionTable":
+        """Map the table created by another process, given its name and size."""
+        from multiprocessing import shared_memory
+        table = cls.__new__(cls)
+        table.owner = False
+        table.shm = shared_memory.SharedMemory(name)
+        table.__map(size)
+        return table
+
+    @property
+    def name(self) -> str:
+        return self.shm.name
+
+    def resize(self, megabytes: float):
+        # imported here, the processes not sharing tables start faster
+        from multiprocessing import shared_memory
+        size = _entries_for(megabytes, ENTRY_BYTES, BUCKET_SIZE)
+        self.close()
+        self.shm = shared_memory.SharedMemory(create=True, size=size * ENTRY_BYTES)
+        self.owner = True
+        self.__map(size)
+        self.clear()
+
+    def __map(self, size: int):
+        half = size * ENTRY_BYTES // 2
+        self.keys = self.shm.buf[:half].cast('Q')
+        self.data = self.shm.buf[half:].cast('Q')
+        self.mask = size // BUCKET_SIZE - 1
+        self.age = 0
+
+    def clear(self):
+        _zero(self.shm.buf)
+        self.age = 0
+
+    def close(self):
+        """Unmap the table, and free it in the creating process."""
+        if self.shm is None:
+            return
+        self.keys.release()
+        self.data.release()
+        self.shm.close()
+        if self.owner:
+            self.shm.unlink()
+        self.shm = None
+
+
+class MoveCache():
+    """Destinations of the pieces of a position, for the user interface.
+
+    A direct mapped table storing, for a position key and a square, the
+    bitboard of the squares the piece can move to.
+    """
+
+    def __init__(self, megabytes: float = 1) -> None:
+        size = _entries_for(megabytes, ENTRY_BYTES)
+        self.keys = array('Q', [0]) * size
+        self.targets = array('Q', [0]) * size
+        self.mask = size - 1
+
+    @staticmethod
+    def __check_key(key: int, sq: int) -> int:
+        return (key ^ (sq + 1) * _GOLDEN) & _FULL
+
+    def get(self, key: int, sq: int) -> Union[List[Tuple[int, int]], None]:
+        check = self.__check_key(key, sq)
+        i = check & self.mask
+        if check == 0 or self.keys[i] != check:
+            return None
+        targets = self.targets[i]
+        moves = []
+        while targets:
+            lsb = targets & -targets
+            moves.append(divmod(lsb.bit_length() - 1, 8))
+            targets ^= lsb
+        return moves
+
+    def put(self, key: int, sq: int, moves: List[Tuple[int, int]]):
+        check = self.__check_key(key, sq)
+        i = check & self.mask
+        targets = 0
+        for row, col in moves:
+            targets |= 1 << (row * 8 + col)
+        self.keys[i] = check
+        self.targets[i] = targets
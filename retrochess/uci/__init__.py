@@ -0,0 +1,264 @@
+"""Universal Chess Interface front end.
+
+Reads UCI commands on stdin and answers on stdout, so retrochess can be driven
+by chess GUIs and tournament managers without pygame:
+
+    python retrochess/uci
+
+The search runs on a worker thread, the command loop keeps answering
+``isready`` and ``stop`` while it thinks.
+"""
+import sys
+import threading
+from typing import List, TextIO, Union
+
+from board import Board, move_to_uci, uci_to_move
+from book import PolyglotBook
+from fen import STARTING_FEN, load_fen
+from search import Search, SearchResult, allocate_time, format_score
+from smp import LazySmp
+from tt import TranspositionTable
+
+NAME = "RetroChess"
+AUTHOR = "gerzin"
+
+DEFAULT_HASH = 16
+MAX_HASH = 4096
+MAX_THREADS = 64
+
+
+class UciEngine():
+    """State of an engine driven through the UCI protocol."""
+
+    def __init__(self, output: TextIO = sys.stdout) -> None:
+        self.output = output
+        self.output_lock = threading.Lock()
+        self.board = Board(backend="bitboard")
+        self.tt = TranspositionTable(DEFAULT_HASH)
+        self.hash = DEFAULT_HASH
+        self.threads = 1
+        # helper processes sharing the table, when searching with several threads
+        self.smp: Union[LazySmp, None] = None
+        # FEN and moves of the position, to set it up in the helpers
+        self.position = (STARTING_FEN, [])
+        self.search: Union[Search, None] = None
+        self.worker: Union[threading.Thread, None] = None
+        # set by stop, a "go infinite" search waits for it before answering
+        self.stop_requested = threading.Event()
+        # opening book answering go without a search, with OwnBook on
+        self.book: Union[PolyglotBook, None] = None
+        self.own_book = False
+
+    def send(self, line: str):
+        with self.output_lock:
+            self.output.write(line + "\n")
+            self.output.flush()
+
+    def handle(self, line: str) -> bool:
+        """Execute a command line, return False once the engine must quit."""
+        tokens = line.split()
+        if not tokens:
+            return True
+        command, args = tokens[0], tokens[1:]
+        if command == "uci":
+            self.send(f"id name {NAME}")
+            self.send(f"id author {AUTHOR}")
+            self.send(f"option name Hash type spin default {DEFAULT_HASH} min 1 max {MAX_HASH}")
+            self.send(f"option name Threads type spin default 1 min 1 max {MAX_THREADS}")
+            self.send("option name OwnBook type check default false")
+            self.send("option name BookFile type string default <empty>")
+            self.send("uciok")
+        elif command == "isready":
+            self.send("readyok")
+        elif command == "ucinewgame":
+            self.stop()
+            self.tt.clear()
+            self.board.reset()
+            self.position = (STARTING_FEN, [])
+        elif command == "setoption":
+            self.stop()
+            self.set_option(args)
+        elif command == "position":
+            self.stop()
+            self.set_position(args)
+        elif command == "go":
+            self.stop()
+            self.go(args)
+        elif command == "stop":
+            self.stop()
+        elif command == "quit":
+            self.stop()
+            return False
+        else:
+            self.send(f"info string unknown command {command}")
+        return True
+
+    def set_option(self, args: List[str]):
+        # setoption name <name> [value <value>], names may contain spaces
+        if "name" not in args:
+            return
+        value_at = args.index("value") if "value" in args else len(args)
+        name = " ".join(args[args.index("name") + 1:value_at]).lower()
+        value = " ".join(args[value_at + 1:])
+        try:
+            if name == "hash":
+                self.hash = max(1, min(MAX_HASH, int(value)))
+                self.start_threads()
+            elif name == "threads":
+                self.threads = max(1, min(MAX_THREADS, int(value)))
+                self.start_threads()
+            elif name == "ownbook":
+                self.own_book = value.lower() == "true"
+            elif name == "bookfile":
+                self.open_book(value)
+            else:
+                self.send(f"info string unknown option {name}")
+        except ValueError:
+            self.send(f"info string invalid value {value!r} for option {name}")
+
+    def open_book(self, path: str):
+        if self.book is not None:
+            self.book.close()
+            self.book = None
+        if path and path != "<empty>":
+            try:
+                self.book = PolyglotBook(path)
+            except OSError as e:
+                self.send(f"info string cannot open book {path}: {e.strerror}")
+
+    def start_threads(self):
+        """Allocate the table, shared with helper processes for several threads."""
+        if self.smp is not None:
+            self.smp.close()
+            self.smp = None
+        if self.threads > 1:
+            self.smp = LazySmp(self.threads, self.hash, self.board.backend)
+            self.tt = self.smp.tt
+        else:
+            self.tt = TranspositionTable(self.hash)
+
+    def set_position(self, args: List[str]):
+        # position [startpos | fen <six fields>] [moves <move>...]
+        moves_at = args.index("moves") if "moves" in args else len(args)
+        if args and args[0] == "fen":
+            fen = " ".join(args[1:moves_at])
+        else:
+            fen = STARTING_FEN
+        # set up on a new board, the position only changes once it is all valid
+        board = Board(backend=self.board.backend)
+        try:
+            load_fen(board, fen)
+        except (ValueError, IndexError, KeyError):
+            self.send(f"info string invalid fen {fen}")
+            return
+        moves = []
+        for text in args[moves_at + 1:]:
+            try:
+                move = uci_to_move(text)
+            except ValueError:
+                move = None
+            if move not in board.generate_moves():
+                self.send(f"info string illegal move {text}")
+                return
+            board.make_move(move)
+            moves.append(move)
+        self.board = board
+        self.position = (fen, moves)
+
+    def go(self, args: List[str]):
+        limits = {}
+        i = 0
+        while i < len(args):
+            name = args[i]
+            if name in ("depth", "nodes", "movetime", "wtime", "btime", "winc", "binc", "movestogo") and i + 1 < len(args):
+                try:
+                    limits[name] = int(args[i + 1])
+                except ValueError:
+                    pass
+                i += 2
+            else:
+                limits[name] = True
+                i += 1
+
+        infinite = "infinite" in limits or "ponder" in limits
+        if self.own_book and self.book is not None and not infinite:
+            move = self.book.choose(self.board)
+            if move is not None:
+                self.send(f"bestmove {move_to_uci(move)}")
+                return
+        movetime = None
+        if "movetime" in limits:
+            movetime = limits["movetime"] / 1000
+        elif not infinite:
+            clock, inc = ("wtime", "winc") if self.board.state.white_turn else ("btime", "binc")
+            if clock in limits:
+                movetime = allocate_time(limits[clock] / 1000, limits.get(inc, 0) / 1000, limits.get("movestogo"))
+
+        self.stop_requested.clear()
+        # made before the worker starts, a stop coming before run() is kept
+        self.search = Search(self.board, self.tt)
+        self.worker = threading.Thread(
+            target=self.think,
+            args=(self.search, limits.get("depth"), limits.get("nodes"), movetime, infinite),
+            daemon=True,
+        )
+        self.worker.start()
+
+    def think(self, search: Search, depth, nodes, movetime, infinite: bool):
+        # the GUI waits for a best move, it is sent even when the search fails
+        move = 0
+        board = search.board
+        plies = len(board.state.undo_stack)
+        try:
+            if self.smp is not None:
+                self.smp.start(*self.position)
+            try:
+                move = search.run(depth=depth, nodes=nodes, movetime=movetime, info=self.send_info).move
+            finally:
+                if self.smp is not None:
+                    self.smp.stop()
+        except Exception as e:
+            self.send(f"info string search failed: {e!r}")
+            # the board is only given back in its position by a search that returns
+            while len(board.state.undo_stack) > plies:
+                board.unmake_move()
+            try:
+                moves = board.generate_moves()
+                move = moves[0] if moves else 0
+            except Exception:
+                move = 0
+        finally:
+            # in infinite mode the best move is only given once the GUI asks
+            if infinite:
+                self.stop_requested.wait()
+            self.send(f"bestmove {move_to_uci(move) if move else '0000'}")
+
+    def send_info(self, result: SearchResult):
+        pv = " ".join(move_to_uci(m) for m in result.pv)
+        self.send(f"info depth {result.depth} score {format_score(result.score)} nodes {result.nodes} "
+                  f"nps {result.nps} time {int(result.seconds * 1000)} hashfull {self.tt.hashfull()} pv {pv}")
+
+    def stop(self):
+        """Stop the running search, if any, and wait for its best move."""
+        if self.worker is None:
+            return
+        self.stop_requested.set()
+        self.search.stop()
+        self.worker.join()
+        self.worker = None
+        self.search = None
+
+    def close(self):
+        self.stop()
+        self.open_book("")
+        if self.smp is not None:
+            self.smp.close()
+            self.smp = None
+
+
+def main(input: TextIO = sys.stdin, output: TextIO = sys.stdout):
+    engine = UciEngine(output)
+    for line in input:
+        if not engine.handle(line):
+            break
+    engine.close()
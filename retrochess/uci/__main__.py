@@ -0,0 +1,9 @@
+import sys
+from pathlib import Path
+
+# the retrochess modules import each other as top level modules
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from uci import main
+
+main()
@@ -1,59 +1,72 @@
-from typing import Tuple
+import hashlib
+from typing import List, Tuple
 import pygame
-from board import Board, Piece, PieceColor, PieceType
+from board import BLACK, PIECES, Board, Piece, piece_code
 from pygame.surface import Surface
-from math import floor
 from pathlib import Path
-from pygame.transform import flip as Flip
 
-from ui.config import Config
+from ui.config import Config, font
+from ui.layers import BakedLayer, Compositor, Layer
 
 
 def load_and_scale(path, scale:Tuple = (62, 62)):
     return pygame.transform.scale(pygame.image.load(path), scale)
 
 
+# piece codes in the order of the atlas sprites, with the file of each sprite
+ATLAS_CODES = [code for code in range(16) if PIECES[code] is not None]
+ATLAS_FILES = [f"{'b' if code & BLACK else 'w'}{PIECES[code].type.value.upper()}.svg" for code in ATLAS_CODES]
+
+
+def load_atlas(set_path: Path, size: Tuple[int, int]) -> Surface:
+    """The sprites of a piece set side by side, in the order of ATLAS_CODES.
+
+    The atlas is rasterized from the SVG files once per set content and size,
+    then read back from a PNG in Config.assets.CACHE.
+    """
+    digest = hashlib.sha1()
+    for name in ATLAS_FILES:
+        digest.update((set_path / name).read_bytes())
+    w, h = size
+    cached = Config.assets.CACHE / f"atlas-{digest.hexdigest()[:16]}-{w}x{h}.png"
+    try:
+        atlas = pygame.image.load(cached)
+    except (pygame.error, FileNotFoundError):
+        atlas = Surface((w * len(ATLAS_FILES), h), pygame.SRCALPHA)
+        for i, name in enumerate(ATLAS_FILES):
+            sprite = load_and_scale(set_path / name, size)
+            # copy the pixels as they are, alpha included, on the transparent atlas
+            atlas.blit(sprite, (i * w, 0), special_flags=pygame.BLEND_RGBA_MAX)
+        try:
+            cached.parent.mkdir(parents=True, exist_ok=True)
+            pygame.image.save(atlas, cached)
+        except (pygame.error, OSError):
+            pass
+    if pygame.display.get_surface() is not None:
+        atlas = atlas.convert_alpha()
+    return atlas
+
+
 class PieceViewer:
 
     def __init__(self, **kwargs):
         scale = kwargs.get("scale", (62, 62))
         self.set_path = Config.assets.PIECES / "pixel"
-        self.flipped = kwargs.get("flipped", False)
-        self.type_img_white = {
-            PieceType.PAWN: load_and_scale(self.set_path / "wP.svg", scale),
-            PieceType.KNIGHT.value: load_and_scale(self.set_path / "wN.svg", scale),
-            PieceType.BISHOP.value: load_and_scale(self.set_path / "wB.svg", scale),
-            PieceType.ROOK.value: load_and_scale(self.set_path / "wR.svg", scale),
-            PieceType.QUEEN.value: load_and_scale(self.set_path / "wQ.svg", scale),
-            PieceType.KING.value: load_and_scale(self.set_path / "wK.svg", scale)
-        }
-
-        self.type_img_black = {
-            PieceType.PAWN: load_and_scale(self.set_path / "bP.svg", scale),
-            PieceType.KNIGHT.value: load_and_scale(self.set_path / "bN.svg", scale),
-            PieceType.BISHOP.value: load_and_scale(self.set_path / "bB.svg", scale),
-            PieceType.ROOK.value: load_and_scale(self.set_path / "bR.svg", scale),
-            PieceType.QUEEN.value: load_and_scale(self.set_path / "bQ.svg", scale),
-            PieceType.KING.value: load_and_scale(self.set_path / "bK.svg", scale)
-        }
+        self.size = (int(scale[0]), int(scale[1]))
+        self.atlas = load_atlas(self.set_path, self.size)
+        # area of the atlas holding the sprite of each piece code
+        w, h = self.size
+        self.sprites = [None] * 16
+        for i, code in enumerate(ATLAS_CODES):
+            self.sprites[code] = pygame.Rect(i * w, 0, w, h)
 
-    
     def draw_piece(self, piece: Piece, srf: Surface):
-        pt = piece.type_
-        
-        if piece.color == PieceColor.BLACK:
-            srf.blit(Flip(self.type_img_black[pt], self.flipped, self.flipped), (0,0))
-        else:
-            srf.blit(Flip(self.type_img_white[pt], self.flipped, self.flipped), (0,0))
-        
-        
-
-def alternate_colors(*args):
-    a = [*args]
-    while True:
-        for ar in a:
-            yield a
-    
+        self.draw_code(piece_code(piece), srf)
+
+    def draw_code(self, code: int, srf: Surface):
+        """Draw the piece of a piece code on the top left corner of a surface."""
+        srf.blit(self.atlas, (0, 0), self.sprites[code])
+
 
 class BoardViewer():
     
@@ -69,12 +82,24 @@ class BoardViewer():
 
         self.piece_viewer = PieceViewer(scale=(surface.get_width() / 8, surface.get_height() / 8))
         # font for drawing the letters
-        self.font = pygame.font.Font(Config.assets.FONTS / "font0.ttf", int(self.square_size / 6))
+        self.font = font(int(self.square_size / 6))
         colors = [Config.color.LIGHT, Config.color.DARK]
         self.square_letters = [self.font.render(x, True, colors[i%2]) for i,x in enumerate("abcdefgh")]
-        self.square_letters_flipped = [Flip(self.font.render(x, True, colors[(i+1)%2]), True, True) for i,x in enumerate("abcdefgh")]
         self.square_numbers = [self.font.render(x, True, colors[i%2]) for i,x in enumerate("87654321")]
-        self.square_numbers_flipped = [Flip(self.font.render(x, True, colors[i%2]), True, True) for i,x in enumerate("12345678")]
+        # labels of each orientation, made when first shown
+        self.coordinates = {}
+
+        # layers of the board, from the bottom: the squares and their labels,
+        # baked once per orientation, the highlighted squares and the pieces
+        size = surface.get_size()
+        self.backgrounds = BakedLayer(size, self.__draw_background)
+        self.overlay = Layer(size)
+        self.pieces = Layer(size)
+        self.compositor = Compositor(surface, [self.backgrounds.get(False), self.overlay, self.pieces])
+
+        # what each square of the surface shows, as (piece code, highlight color),
+        # None when it must be painted again
+        self.__painted = [None] * 64
 
         # mouse related variables
         self.track_mouse = True # if True highlight the cell under the mouse
@@ -89,6 +114,8 @@ class BoardViewer():
     @surface.setter
     def surface(self, new_srf):
         self.__surface = new_srf
+        self.compositor.target = new_srf
+        self.__painted = [None] * 64
     
     @property
     def flipped(self):
@@ -96,8 +123,9 @@ class BoardViewer():
     
     def flip(self):
         self.__flipped = not self.__flipped
-        self.piece_viewer.flipped = self.__flipped
         self.piece_dragging = False
+        self.compositor.layers[0] = self.backgrounds.get(self.__flipped)
+        self.__painted = [None] * 64
     
     @property
     def board(self) -> Board:
@@ -111,83 +139,73 @@ class BoardViewer():
         """
         self.piece_dragging = val
     
-    def __draw_grid(self):
-        srf = self.surface
-        srf.fill(self.dark_color)
-        
-        def draw_light_squares(srf, ss):
-            for col in range(8):
-                if col % 2 :
-                    for row in (1,3,5,7):
-                        pygame.draw.rect(srf, self.light_color, (row*ss, col*ss ,ss, ss))
-                else:
-                    for row in range(4):
-                        pygame.draw.rect(srf, self.light_color, (row*2*ss, col*ss ,ss, ss))
-        
-        
-        
-        draw_light_squares(srf, self.square_size)
-
-    def __draw_pieces(self):
-        board = self.board.board
+    def __coordinates(self, flipped: bool):
+        """The labels drawn on each edge square of the surface, as lists of (image, position) keyed by square."""
+        if flipped in self.coordinates:
+            return self.coordinates[flipped]
+        ss = self.square_size
+        fh = self.font.get_height()
+        colors = [Config.color.LIGHT, Config.color.DARK]
+        labels = {}
         for i in range(8):
-            for j in range(8):
-                if p:= board[i][j]:
-                    subs = Surface.subsurface(self.surface, self.__coords_to_square_rect(i,j))
-                    self.piece_viewer.draw_piece(p, subs)
+            if flipped:
+                # h to a along the bottom, 1 to 8 down the right edge
+                letter = self.font.render("abcdefgh"[7 - i], True, colors[i % 2])
+                letter_pos = (self.square_letters[0].get_width() + 2 - letter.get_width(), ss - 2 - letter.get_height())
+                number = self.font.render("12345678"[i], True, colors[i % 2])
+                number_pos = (ss - 2 - number.get_width(), fh + 2 - number.get_height())
+            else:
+                letter, letter_pos = self.square_letters[i], (2, ss - fh - 2)
+                number, number_pos = self.square_numbers[i], (ss - self.square_letters[0].get_width() - 2, 2)
+            labels.setdefault(56 + i, []).append((letter, letter_pos))
+            labels.setdefault(i * 8 + 7, []).append((number, number_pos))
+        self.coordinates[flipped] = labels
+        return labels
+
+    def __screen_square(self, cell: Tuple[int, int]) -> int:
+        """Square of the surface, numbered from its top left corner, showing a board cell."""
+        sq = cell[0] * 8 + cell[1]
+        return 63 - sq if self.flipped else sq
 
-    def __draw_highlited_cell(self):
+    def __fills(self):
+        # the color of the squares covered by an overlay, the later overlays on top
+        fills = {}
         if self.mouse_pos and self.track_mouse:
-            i,j = self.mouse_coords_to_board_cell(self.mouse_pos)
-            subs = Surface.subsurface(self.surface, self.__coords_to_square_rect(j,i))
-            subs.fill(Config.color.HIGHLIGHT)
-    
-    def __draw_selected_cell(self):
-        if self.show_selected_cell:
-            if sc:= self.__board.state.selected_piece:
-                Surface.subsurface(self.surface, self.__coords_to_square_rect(sc[0], sc[1])).fill(Config.color.SELECTION)
-    
-    def __draw_possible_moves(self):
-        if self.board.state.possible_moves:
-            for p in self.board.state.possible_moves:
-                subs = Surface.subsurface(self.surface, self.__coords_to_square_rect(*p))
-                subs.fill(Config.color.SELECTION)
-    
-    def __draw_last_move(self):
-        lm = self.board.state.last_move
-        if lm:
-            Surface.subsurface(self.surface, self.__coords_to_square_rect(*lm[0])).fill(Config.color.LAST_MOVE)
-            Surface.subsurface(self.surface, self.__coords_to_square_rect(*lm[1])).fill(Config.color.LAST_MOVE)
-    
-    def __draw_coordinates(self):
-
-        if self.flipped:
-            letter_pos_x = self.square_size - self.square_letters_flipped[0].get_width() - 2
-            letter_pos_y = 2
-            number_pos_y = self.square_size-self.font.get_height() - 2
-            
-            for i in range(8):
-                letter = self.square_letters_flipped[i]
-                number = self.square_numbers_flipped[7-i]
-                subs = Surface.subsurface(self.surface, self.__coords_to_square_rect(0,i))
-                subs.blit(letter,(letter_pos_x, letter_pos_y))
-                
-                subs = Surface.subsurface(self.surface, self.__coords_to_square_rect(i,0))
-                subs.blit(number,(2, number_pos_y))
+            x, y = self.mouse_pos
+            fills[int(y // self.square_size) * 8 + int(x // self.square_size)] = Config.color.HIGHLIGHT
+        state = self.board.state
+        if self.show_selected_cell and state.selected_piece:
+            fills[self.__screen_square(state.selected_piece)] = Config.color.SELECTION
+        if state.last_move:
+            for cell in state.last_move:
+                fills[self.__screen_square(cell)] = Config.color.LAST_MOVE
+        if state.possible_moves:
+            for cell in state.possible_moves:
+                fills[self.__screen_square(cell)] = Config.color.SELECTION
+        return fills
 
+    def __draw_background(self, layer: Layer, flipped: bool):
+        for sq in range(64):
+            row, col = divmod(sq, 8)
+            rect = self.__coords_to_square_rect(row, col)
+            layer.fill(self.light_color if (row + col) % 2 == 0 else self.dark_color, rect)
+            for image, (x, y) in self.__coordinates(flipped).get(sq, ()):
+                layer.surface.blit(image, (rect.x + x, rect.y + y))
+
+    def __paint(self, sq: int, code: int, fill) -> pygame.Rect:
+        rect = self.__coords_to_square_rect(*divmod(sq, 8))
+        if fill is None:
+            self.overlay.clear(rect)
         else:
-            letter_pos_y = self.square_size - self.font.get_height() - 2
-            number_pos_x = self.square_size - self.square_letters[0].get_width() - 2
-            for i in range(8):
-                letter = self.square_letters[i]
-                number = self.square_numbers[i]
-                subs = Surface.subsurface(self.surface, self.__coords_to_square_rect(7,i))
-                subs.blit(letter ,(2, letter_pos_y))
-                subs = Surface.subsurface(self.surface, self.__coords_to_square_rect(i,7))
-                subs.blit(number,(number_pos_x, 2))
-                
+            # the labels stay on top of the highlight
+            self.overlay.fill(fill, rect)
+            for image, (x, y) in self.__coordinates(self.flipped).get(sq, ()):
+                self.overlay.surface.blit(image, (rect.x + x, rect.y + y))
+        self.pieces.clear(rect)
+        if code:
+            self.pieces.copy(self.piece_viewer.atlas, rect.topleft, self.piece_viewer.sprites[code])
+        return rect
 
-    
     def __coords_to_square_rect(self, i:int,j:int) -> pygame.Rect:
         """Given col,row coordinates, return the corresponding square on the chessboard
 
@@ -206,18 +224,24 @@ class BoardViewer():
         self.mouse_pos = None
           
 
-    def update(self):
-        self.__draw_grid()
-        self.__draw_highlited_cell()
-        self.__draw_selected_cell()
-        self.__draw_last_move()
-        self.__draw_possible_moves()
-        self.__draw_coordinates()
-        self.__draw_pieces()
-        
-        if self.flipped:
-            self.surface = Flip(self.surface, True, True)
-    
+    def update(self) -> List[pygame.Rect]:
+        """Paint the squares whose piece, highlight, selection or last move
+        changed since the previous update.
+
+        Returns:
+            List[pygame.Rect]: the painted areas of the surface.
+        """
+        squares = self.board.squares
+        fills = self.__fills()
+        painted = self.__painted
+        dirty = []
+        for sq in range(64):
+            code = squares[63 - sq if self.flipped else sq]
+            fill = fills.get(sq)
+            if painted[sq] != (code, fill):
+                painted[sq] = (code, fill)
+                dirty.append(self.__paint(sq, code, fill))
+        return self.compositor.compose(dirty) if dirty else []
 
     def mouse_coords_to_board_cell(self, mouse_coords) -> Tuple[int, int]:
         """Transform mouse coordinates to cell's indices
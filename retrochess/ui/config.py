@@ -1,5 +1,8 @@
+import functools
+import pygame.font
 from pygame.color import Color
 from pathlib import Path
+import os
 
 class Config:
     class Color:
@@ -13,7 +16,19 @@ class Config:
         ASSETS = Path(__file__).parent / "assets"
         PIECES = Path(__file__).parent / "assets" / "piecesets"
         FONTS  = Path(__file__).parent / "assets" / "fonts"
+        # files generated from the assets, kept between runs
+        CACHE = Path(os.environ.get("XDG_CACHE_HOME") or Path.home() / ".cache") / "retrochess"
 
     assets = Assets()
     color = Color()
-    SPACING = 10
\ No newline at end of file
+    SPACING = 10
+    # frames drawn per second at most
+    FPS = 60
+    # clock of a new game, see timer.TimeControl
+    TIME_CONTROL = "300+3"
+
+
+@functools.lru_cache(maxsize=None)
+def font(size: int) -> pygame.font.Font:
+    """The font of the interface at a size, loaded once and shared by the viewers."""
+    return pygame.font.Font(Config.assets.FONTS / "font0.ttf", size)
@@ -1,25 +1,44 @@
+from typing import List
 import pygame
 from pygame.surface import Surface
 from board import Board
 from fen import board_to_fen
-from ui.config import Config
+from ui.config import Config, font
+from ui.layers import Compositor, Layer
 
 class FenViewer:
     def __init__(self, board: Board, surface: Surface) -> None:
         self.__surface = surface
         self.board = board
-        self.font = pygame.font.Font(Config.assets.FONTS / "font0.ttf", 8)
+        self.font = font(8)
         self.fen_string = f"FEN: {board_to_fen(self.board)}"
-        self.last_move_len = None
+        self.last_position = self.__position()
+        self.painted = False
+        background = Layer(surface.get_size(), transparent=False)
+        background.fill(Config.color.LIGHT)
+        self.text = Layer(surface.get_size())
+        self.compositor = Compositor(surface, [background, self.text])
+        self.text.copy(self.font.render(self.fen_string, True, (0,0,0)), (0,0))
     
     @property
     def surface(self):
         return self.__surface
 
-    def update(self):
-        self.surface.fill(Config.color.LIGHT)
+    def __position(self):
+        # the key leaves out the move clocks, which the FEN shows
+        state = self.board.state
+        return self.board.key, state.halfmove_clock, state.fullmove_number
+
+    def update(self) -> List[pygame.Rect]:
+        """Paint the FEN of the board when it changed, return the painted areas."""
         # compute the new fen only on board changes
-        if self.board.state.moves[-1:] != self.last_move_len:
-            self.last_move_len = self.board.state.moves[-1:]
+        position = self.__position()
+        if position == self.last_position and self.painted:
+            return []
+        if position != self.last_position:
+            self.last_position = position
             self.fen_string = f"FEN: {board_to_fen(self.board)}"
-        self.surface.blit(self.font.render(self.fen_string, True, (0,0,0)), (0,0))
\ No newline at end of file
+            self.text.clear()
+            self.text.copy(self.font.render(self.fen_string, True, (0,0,0)), (0,0))
+        self.painted = True
+        return self.compositor.compose()
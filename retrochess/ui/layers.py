@@ -0,0 +1,84 @@
+from typing import Callable, Dict, Hashable, List, Tuple, Union
+import pygame
+from pygame.surface import Surface
+
+
+class Layer():
+    """A surface of a Compositor stack.
+
+    A transparent layer starts cleared. Images are put on it with copy(),
+    which keeps their pixels and alpha as they are, so that composing the
+    layer over the ones below gives the same pixels as blitting the images on
+    them directly.
+
+    Args:
+        size (Tuple[int, int]): size of the layer, the size of the target.
+        transparent (bool): False for an opaque layer, the bottom one.
+    """
+
+    def __init__(self, size: Tuple[int, int], transparent: bool = True) -> None:
+        self.surface = Surface(size, pygame.SRCALPHA if transparent else 0)
+        self.transparent = transparent
+
+    def clear(self, rect: Union[pygame.Rect, None] = None):
+        self.surface.fill((0, 0, 0, 0), rect)
+
+    def fill(self, color, rect: Union[pygame.Rect, None] = None):
+        self.surface.fill(color, rect)
+
+    def copy(self, image: Surface, dest: Tuple[int, int], area: Union[pygame.Rect, None] = None):
+        """Copy an image on a cleared area of the layer."""
+        if self.transparent:
+            self.surface.blit(image, dest, area, special_flags=pygame.BLEND_RGBA_MAX)
+        else:
+            self.surface.blit(image, dest, area)
+
+
+class BakedLayer():
+    """Layers drawn once for each value of the inputs they depend on, for the
+    ones that seldom change, like a background per board orientation.
+
+    Args:
+        size (Tuple[int, int]): size of the layers.
+        draw (Callable[[Layer, Hashable], None]): draws the layer of a key.
+        transparent (bool): whether the layers are transparent.
+    """
+
+    def __init__(self, size: Tuple[int, int], draw: Callable[[Layer, Hashable], None],
+                 transparent: bool = False) -> None:
+        self.size = size
+        self.draw = draw
+        self.transparent = transparent
+        self.layers: Dict[Hashable, Layer] = {}
+
+    def get(self, key: Hashable) -> Layer:
+        layer = self.layers.get(key)
+        if layer is None:
+            layer = self.layers[key] = Layer(self.size, self.transparent)
+            self.draw(layer, key)
+        return layer
+
+
+class Compositor():
+    """Layers stacked on a target surface, the bottom one first.
+
+    Viewers keep what they show on layers, each one drawn again only when its
+    own inputs change, and compose the areas they changed onto the target.
+
+    Args:
+        target (Surface): surface the layers are composed on.
+        layers (List[Layer]): the layers, the first one opaque.
+    """
+
+    def __init__(self, target: Surface, layers: List[Layer]) -> None:
+        self.target = target
+        self.layers = layers
+
+    def compose(self, rects: Union[List[pygame.Rect], None] = None) -> List[pygame.Rect]:
+        """Compose areas of the layers, all of them by default, and return the areas."""
+        if rects is None:
+            rects = [self.target.get_rect()]
+        for layer in self.layers:
+            for rect in rects:
+                self.target.blit(layer.surface, rect, rect)
+        return rects
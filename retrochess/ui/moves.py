@@ -3,16 +3,32 @@ from pygame.surface import Surface
 import pygame
 from board import Board
 
-from ui.config import Config
+from ui.config import Config, font
+from ui.layers import Compositor, Layer
+
+
+# rendered lines kept, a few screens worth
+LINE_CACHE_SIZE = 256
 
 
 class MovesViewer():
     def __init__(self, board: Board, surface:Surface) -> None:
         self.board = board
         self.__surface = surface
-        self.font = pygame.font.Font(Config.assets.FONTS / "font0.ttf", 14)
-        self.moves_subs = Surface.subsurface(self.surface, (1, 1, self.surface.get_width() - 1, self.surface.get_height() - 1))
-        self.max_fitting_moves = self.moves_subs.get_height() // self.font.get_height()
+        self.font = font(14)
+        background = Layer(surface.get_size(), transparent=False)
+        background.fill(Config.color.LIGHT)
+        self.text = Layer(surface.get_size())
+        self.compositor = Compositor(surface, [background, self.text])
+        self.moves_rect = pygame.Rect(1, 1, self.surface.get_width() - 1, self.surface.get_height() - 1)
+        self.max_fitting_moves = self.moves_rect.height // self.font.get_height()
+        # rendered lines keyed by (move number, move, highlighted)
+        self.lines = {}
+        # key of the line painted on each row, None for an empty row, and
+        # False when the banner is shown, None before the first paint
+        self.painted = None
+        # number of the first move shown, None to follow the last moves
+        self.first_move = None
         self.init_banner()
     
     def init_banner(self):
@@ -20,7 +36,7 @@ class MovesViewer():
         text_0 = self.font.render("Make a move to", True, Config.color.TEXT_COLOR)
         text_1 = self.font.render("start a new game", True, Config.color.TEXT_COLOR)
         text_press = self.font.render("press:", True, Config.color.TEXT_COLOR)
-        commands = [self.font.render(x, True, Config.color.TEXT_COLOR) for x in "* r - reset,* f - flip,* x - exit".split(",")]
+        commands = [self.font.render(x, True, Config.color.TEXT_COLOR) for x in "* r - reset,* f - flip,* u - undo,* x - exit".split(",")]
         
         for x in (text_0, text_1, text_press, *commands):
             self.banner_infos.append(x)
@@ -28,37 +44,77 @@ class MovesViewer():
     @property
     def surface(self):
         return self.__surface
-    
-    def update(self):
-        self.surface.fill(Config.color.LIGHT)
 
-        if self.board.state.moves:
-            self.__render_moves(self.moves_subs)
-        else:
-            self.__show_banner()
-    
-    def __render_moves(self, subsurface):
-        
-        __moves = self.board.state.moves
+    def scroll(self, lines: int):
+        """Scroll the moves by a number of lines, negative ones towards the first move.
 
-        render_move = lambda i, x : self.font.render(f"{str(i)+'.':>3} {x:<}", True, Config.color.TEXT_COLOR)
-        render_move_highlight = lambda i, x : self.font.render(f"{str(i)+'.':<3} {x:<}", True, Config.color.TEXT_COLOR, Config.color.DARK)
-        moves = [self.__moves_to_text(m) for m in __moves[-self.max_fitting_moves:]]
-        
-        start_index = max(1, len(__moves) - self.max_fitting_moves+1)
+        Scrolling past the last moves follows them again as they are played.
+        """
+        count = len(self.board.state.moves)
+        last_first = max(1, count - self.max_fitting_moves + 1)
+        first = (last_first if self.first_move is None else self.first_move) + lines
+        self.first_move = None if first >= last_first else max(1, first)
+
+    def update(self) -> List[pygame.Rect]:
+        """Paint the rows of moves that changed, return the painted areas.
 
-        moves_txt = [render_move(i, x) for i,x in enumerate(moves[:-1], start=start_index)] + [render_move_highlight(len(__moves), moves[-1])]
+        Only the rows in view are looked at, so the cost does not grow with
+        the length of the game.
+        """
+        moves = self.board.state.moves
+        if not moves:
+            if self.painted is False:
+                return []
+            self.painted = False
+            self.first_move = None
+            self.text.clear()
+            self.__show_banner()
+            return self.compositor.compose()
+
+        full = not self.painted
+        if full:
+            self.painted = [None] * self.max_fitting_moves
+            self.text.clear()
+        count = len(moves)
+        first = self.first_move or max(1, count - self.max_fitting_moves + 1)
         fh = self.font.get_height()
-        for i, move_txt in enumerate(moves_txt):
-            subsurface.blit(move_txt, (10, i * fh))
+        dirty = []
+        for row, number in enumerate(range(first, first + self.max_fitting_moves)):
+            key = (number, moves[number - 1], number == count) if number <= count else None
+            if key == self.painted[row]:
+                continue
+            self.painted[row] = key
+            rect = pygame.Rect(self.moves_rect.x, self.moves_rect.y + row * fh, self.moves_rect.width, fh)
+            self.text.clear(rect)
+            if key is not None:
+                self.text.copy(self.__line(key), (rect.x + 10, rect.y))
+            dirty.append(rect)
+        if full:
+            return self.compositor.compose()
+        return self.compositor.compose(dirty) if dirty else []
+
+    def __line(self, key) -> Surface:
+        line = self.lines.get(key)
+        if line is None:
+            if len(self.lines) >= LINE_CACHE_SIZE:
+                del self.lines[next(iter(self.lines))]
+            number, move, highlighted = key
+            if highlighted:
+                line = self.font.render(f"{str(number)+'.':<3} {self.__moves_to_text(move):<}", True,
+                                        Config.color.TEXT_COLOR, Config.color.DARK)
+            else:
+                line = self.font.render(f"{str(number)+'.':>3} {self.__moves_to_text(move):<}", True,
+                                        Config.color.TEXT_COLOR)
+            self.lines[key] = line
+        return line
         
     def __show_banner(self):
         
         for i, text in enumerate(self.banner_infos[:2]):
-            self.surface.blit(text, (10,10+i*self.font.get_height()))
+            self.text.copy(text, (10,10+i*self.font.get_height()))
         
         for i, text in enumerate(self.banner_infos[2:], start=3):
-            self.surface.blit(text, (10,12+i*self.font.get_height()))
+            self.text.copy(text, (10,12+i*self.font.get_height()))
         
 
         
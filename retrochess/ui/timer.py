@@ -1,7 +1,10 @@
+from typing import List
 from pygame.surface import Surface
 import pygame
 from board import Board
-from ui.config import Config
+from timer import format_time
+from ui.config import Config, font
+from ui.layers import BakedLayer, Compositor, Layer
 
 class TimerViewer():
     def __init__(self, board: Board, surface:Surface) -> None:
@@ -9,17 +12,66 @@ class TimerViewer():
         self.board = board
         # mouse related variables
         self.mouse_pos = None
-        self.font = pygame.font.Font(Config.assets.FONTS / "font0.ttf", int(self.__surface.get_height() / 4))
+        # hover state and clock shown by the last paint, None before the first one
+        self.painted_hover = None
+        self.painted_clock = None
+        self.backgrounds = BakedLayer(surface.get_size(), self.__draw_background)
+        self.text = Layer(surface.get_size())
+        self.compositor = Compositor(surface, [self.backgrounds.get(False), self.text])
     
     @property
     def surface(self):
         return self.__surface
+
+    @property
+    def font(self) -> pygame.font.Font:
+        # loaded when some text is first drawn
+        return font(int(self.__surface.get_height() / 4))
     
-    def update(self):
-        if self.mouse_pos:
-            self.surface.fill(Config.color.DARK)
-        else:
-            self.surface.fill(Config.color.LIGHT)
+    def update(self) -> List[pygame.Rect]:
+        """Paint the timer when the time shown or the hover state changed,
+        return the painted areas."""
+        hover = self.mouse_pos is not None
+        clock = self.board.clock
+        shown = None
+        if clock is not None:
+            shown = (format_time(clock.remaining(False)), format_time(clock.remaining(True)),
+                     clock.white_turn, clock.running, clock.flagged, self.board.result())
+        if hover == self.painted_hover and shown == self.painted_clock:
+            return []
+        self.painted_hover = hover
+        self.compositor.layers[0] = self.backgrounds.get(hover)
+        if shown != self.painted_clock:
+            self.painted_clock = shown
+            self.text.clear()
+            if shown is not None:
+                self.__draw_clock(*shown)
+        return self.compositor.compose()
+
+    def __draw_clock(self, black: str, white: str, white_turn: bool, running: bool, flagged, result):
+        # black on the top half, white on the bottom one, the side to move highlighted
+        w, h = self.surface.get_size()
+        for white_side, time_left in ((False, black), (True, white)):
+            row = pygame.Rect(0, h // 2 if white_side else 0, w, h // 2)
+            put = self.text.copy
+            if running and white_side == white_turn:
+                self.text.fill(Config.color.HIGHLIGHT, row.inflate(-2 * Config.SPACING, -Config.SPACING))
+                # the text blends over the opaque highlight
+                put = self.text.surface.blit
+            color = Config.color.SELECTION if flagged == white_side else Config.color.TEXT_COLOR
+            # the name above the digits, which get the width of the surface
+            name = font(14).render("White" if white_side else "Black", True, color)
+            digits = self.font.render(time_left, True, color)
+            put(name, (row.x + 2 * Config.SPACING, row.y + Config.SPACING))
+            put(digits, (row.right - 2 * Config.SPACING - digits.get_width(),
+                         row.bottom - Config.SPACING - digits.get_height()))
+            if result is not None:
+                # the points of the side once the game is over, under its name
+                points = font(14).render(result[0].split("-")[white_side ^ 1], True, color)
+                put(points, (row.x + 2 * Config.SPACING, row.bottom - Config.SPACING - points.get_height()))
+
+    def __draw_background(self, layer: Layer, hover: bool):
+        layer.fill(Config.color.DARK if hover else Config.color.LIGHT)
     
     def on_mouse_on(self, mouse_pos):
         self.mouse_pos = mouse_pos
@@ -0,0 +1,278 @@
+#!/usr/bin/env python3
+"""Render benchmark of the user interface, run headless.
+
+Scripted event sequences, selecting, dragging, flipping and resetting, go
+through the ``App`` of main.py as they would come from the window, one frame
+per event. SDL's dummy video driver stands in for the display, so no screen
+or GPU is needed. The time of every viewer's update() is reported, and the
+run fails when a viewer got slower than in a baseline report.
+
+    python uibench.py --json ui.json
+    python uibench.py --baseline ui.json
+"""
+import os
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+os.environ["PYGAME_HIDE_SUPPORT_PROMPT"] = "1"
+
+import argparse
+import json
+import platform
+import random
+import sys
+import time
+from datetime import datetime, timezone
+from typing import Callable, Dict, List, Tuple
+
+import pygame
+
+from board import QUEEN, Board, uci_to_move
+from main import BOARD_OFFSET, BOARD_SIZE, MOVES_OFFSET, TIMER_OFFSET, App
+
+# a Ruy Lopez played by dragging the pieces
+OPENING = ("e2e4 e7e5 g1f3 b8c6 f1b5 a7a6 b5a4 g8f6 e1g1 f8e7 f1e1 b7b5 a4b3 d7d6 c2c3 e8g8 "
+           "h2h3 c6b8 d2d4 b8d7").split()
+# mouse positions on the way of a dragged piece
+DRAG_STEPS = 8
+# slowdown tolerated against the baseline, and times too short to compare
+TOLERANCE = 0.25
+MIN_MICROSECONDS = 20
+
+
+def cell_position(cell: Tuple[int, int], flipped: bool = False) -> Tuple[int, int]:
+    """Screen position of the center of a (row, col) cell of the board."""
+    row, col = (7 - cell[0], 7 - cell[1]) if flipped else cell
+    size = BOARD_SIZE // 8
+    return (BOARD_OFFSET[0] + col * size + size // 2, BOARD_OFFSET[1] + row * size + size // 2)
+
+
+def motion(pos) -> pygame.event.Event:
+    return pygame.event.Event(pygame.MOUSEMOTION, pos=pos, rel=(0, 0), buttons=(0, 0, 0))
+
+
+def button(kind: int, pos, which: int = pygame.BUTTON_LEFT) -> pygame.event.Event:
+    return pygame.event.Event(kind, pos=pos, button=which)
+
+
+def key(which: int) -> pygame.event.Event:
+    return pygame.event.Event(pygame.KEYDOWN, key=which, mod=0, unicode="", scancode=0)
+
+
+def click(pos) -> List[pygame.event.Event]:
+    return [motion(pos), button(pygame.MOUSEBUTTONDOWN, pos), button(pygame.MOUSEBUTTONUP, pos)]
+
+
+def drag(src, dest) -> List[pygame.event.Event]:
+    events = [motion(src), button(pygame.MOUSEBUTTONDOWN, src)]
+    for step in range(1, DRAG_STEPS + 1):
+        events.append(motion((src[0] + (dest[0] - src[0]) * step // DRAG_STEPS,
+                              src[1] + (dest[1] - src[1]) * step // DRAG_STEPS)))
+    events.append(button(pygame.MOUSEBUTTONUP, dest))
+    return events
+
+
+def move_events(moves: List[int], play: Callable) -> List[pygame.event.Event]:
+    events = []
+    for move in moves:
+        src, dest = divmod(move & 63, 8), divmod(move >> 6 & 63, 8)
+        events += play(cell_position(src), cell_position(dest))
+    return events
+
+
+def hover() -> List[pygame.event.Event]:
+    """The mouse going over every square, then over the timer and back."""
+    events = [motion(cell_position(divmod(sq, 8))) for sq in range(64)]
+    timer = (TIMER_OFFSET[0] + 10, TIMER_OFFSET[1] + 10)
+    return (events + [motion(timer)] + events[::-1] + [motion(timer)]) * 2
+
+
+def select() -> List[pygame.event.Event]:
+    """Every white piece selected by a click, then unselected by a right click."""
+    events = []
+    for cell in [(row, col) for row in (6, 7) for col in range(8)]:
+        pos = cell_position(cell)
+        events += click(pos)
+        events += [button(pygame.MOUSEBUTTONDOWN, pos, pygame.BUTTON_RIGHT),
+                   button(pygame.MOUSEBUTTONUP, pos, pygame.BUTTON_RIGHT)]
+    return events
+
+
+def opening() -> List[pygame.event.Event]:
+    """An opening played by dragging the pieces, then the board reset."""
+    return move_events([uci_to_move(text) for text in OPENING], drag) + [key(pygame.K_r)]
+
+
+def flip() -> List[pygame.event.Event]:
+    """The board flipped back and forth in the middle of a game."""
+    events = move_events([uci_to_move(text) for text in OPENING[:8]], drag)
+    for _ in range(8):
+        events += [key(pygame.K_f), motion(cell_position((4, 4)))]
+    return events + [key(pygame.K_r)]
+
+
+def reset() -> List[pygame.event.Event]:
+    """A few moves clicked, then reset, over and over."""
+    events = []
+    for _ in range(6):
+        events += move_events([uci_to_move(text) for text in OPENING[:4]],
+                              lambda src, dest: click(src) + click(dest))
+        events.append(key(pygame.K_r))
+    return events
+
+
+def long_game(plies: int = 300, seed: int = 1) -> List[pygame.event.Event]:
+    """A long game of random moves clicked one after the other, the history scrolled at the end."""
+    board = Board(backend="bitboard")
+    rng = random.Random(seed)
+    moves = []
+    for _ in range(plies):
+        # the UI promotes to a queen
+        legal = [m for m in board.generate_moves() if m >> 12 in (0, QUEEN)]
+        if not legal:
+            break
+        move = rng.choice(legal)
+        board.make_move(move)
+        moves.append(move)
+    events = move_events(moves, lambda src, dest: click(src) + click(dest))
+    history = (MOVES_OFFSET[0] + 10, MOVES_OFFSET[1] + 10)
+    events.append(motion(history))
+    for y in (1,) * 40 + (-1,) * 40:
+        events.append(pygame.event.Event(pygame.MOUSEWHEEL, x=0, y=y, flipped=False))
+    return events
+
+
+SCENARIOS: Dict[str, Callable[[], List[pygame.event.Event]]] = {
+    "hover": hover,
+    "select": select,
+    "opening": opening,
+    "flip": flip,
+    "reset": reset,
+    "long_game": long_game,
+}
+
+
+def run(events: List[pygame.event.Event], screen: pygame.Surface) -> dict:
+    """Replay events on a new App, one frame each, timing the update of every viewer."""
+    app = App(screen)
+    times: Dict[str, List[float]] = {}
+    painted: Dict[str, int] = {}
+
+    def timed(viewer):
+        name = type(viewer).__name__
+        update = viewer.update
+        times[name], painted[name] = [], 0
+
+        def update_timed():
+            start = time.perf_counter()
+            rects = update()
+            times[name].append(time.perf_counter() - start)
+            painted[name] += bool(rects)
+            return rects
+        viewer.update = update_timed
+
+    for viewer, _ in app.viewers:
+        timed(viewer)
+    # the first frame draws everything, it is not part of the scenario
+    app.render()
+    for name in times:
+        times[name].clear()
+        painted[name] = 0
+
+    start = time.perf_counter()
+    for event in events:
+        app.handle(event)
+        app.render()
+    seconds = time.perf_counter() - start
+    return {
+        "frames": len(events),
+        "seconds": round(seconds, 6),
+        "fps": round(len(events) / seconds, 1) if seconds else 0,
+        "viewers": {
+            name: {
+                "mean_us": round(sum(samples) / len(samples) * 1e6, 2) if samples else 0,
+                "max_us": round(max(samples, default=0) * 1e6, 2),
+                "painted": painted[name],
+            }
+            for name, samples in times.items()
+        },
+    }
+
+
+def benchmark(names: List[str], repeat: int = 3) -> List[dict]:
+    """Run scenarios, keeping the fastest of a few runs of each."""
+    pygame.display.init()
+    pygame.font.init()
+    screen = pygame.display.set_mode((850, 600))
+    results = []
+    for name in names:
+        events = SCENARIOS[name]()
+        best = min((run(events, screen) for _ in range(repeat)), key=lambda r: r["seconds"])
+        results.append({"scenario": name, **best})
+    pygame.quit()
+    return results
+
+
+def regressions(results: List[dict], baseline: List[dict], tolerance: float = TOLERANCE) -> List[str]:
+    """The frame and viewer times slower than in the baseline by more than the tolerance."""
+    found = []
+    previous = {r["scenario"]: r for r in baseline}
+
+    def compare(what: str, now: float, before: float):
+        if now > before * (1 + tolerance) and now - before > MIN_MICROSECONDS:
+            found.append(f"{what}: {now:.1f} us, was {before:.1f} us")
+
+    for result in results:
+        old = previous.get(result["scenario"])
+        if old is None:
+            continue
+        compare(f"{result['scenario']} frame", result["seconds"] / result["frames"] * 1e6,
+                old["seconds"] / old["frames"] * 1e6)
+        for name, viewer in result["viewers"].items():
+            if name in old["viewers"]:
+                compare(f"{result['scenario']} {name}", viewer["mean_us"], old["viewers"][name]["mean_us"])
+    return found
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Time the rendering of the user interface, without a display.")
+    parser.add_argument("scenarios", nargs="*", metavar="SCENARIO",
+                        help=f"scenarios to run among {', '.join(SCENARIOS)}, all of them by default")
+    parser.add_argument("--repeat", type=int, default=3, help="runs of each scenario, the fastest is kept (default: 3)")
+    parser.add_argument("--json", metavar="PATH", help="write the results to a JSON file")
+    parser.add_argument("--baseline", metavar="PATH", help="fail when slower than the results of this JSON file")
+    parser.add_argument("--tolerance", type=float, default=TOLERANCE,
+                        help=f"slowdown allowed against the baseline (default: {TOLERANCE})")
+    args = parser.parse_args(argv)
+    unknown = [name for name in args.scenarios if name not in SCENARIOS]
+    if unknown:
+        parser.error(f"unknown scenarios: {', '.join(unknown)}")
+
+    results = benchmark(args.scenarios or list(SCENARIOS), args.repeat)
+    for result in results:
+        print(f"{result['scenario']:<10} {result['frames']:>5} frames  {result['seconds']:8.3f}s  "
+              f"{result['fps']:>9,.1f} fps")
+        for name, viewer in result["viewers"].items():
+            print(f"    {name:<12} mean {viewer['mean_us']:8.1f} us  max {viewer['max_us']:8.1f} us  "
+                  f"painted {viewer['painted']:>5}")
+
+    if args.json:
+        report = {
+            "timestamp": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "pygame": pygame.version.ver,
+            "results": results,
+        }
+        with open(args.json, "w") as f:
+            json.dump(report, f, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            found = regressions(results, json.load(f)["results"], args.tolerance)
+        for line in found:
+            print(f"regression: {line}", file=sys.stderr)
+        return 1 if found else 0
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
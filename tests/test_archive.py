@@ -0,0 +1,94 @@
+import io
+
+import pytest
+
+from archive import ArchiveWriter, GameArchive, GameInfo, convert, pack_info
+from board import Board, uci_to_move
+from fen import board_to_fen
+from pgn import read_games
+
+GAMES = [
+    ("e2e4 e7e5 g1f3 b8c6 f1b5 a7a6", {"White": "Alpha", "Black": "Beta", "Event": "Open", "Date": "2024.03.09",
+                                       "WhiteElo": "2100"}, "1-0"),
+    ("", {}, "*"),
+    ("d2d4 d7d5 c2c4 e7e6", {"White": "Gämma", "Black": "D" * 40, "Date": "1999.??.??"}, "1/2-1/2"),
+]
+
+
+def packed(uci: str):
+    return [uci_to_move(text) for text in uci.split()]
+
+
+@pytest.fixture
+def archive_path(tmp_path):
+    path = tmp_path / "games.rca"
+    with ArchiveWriter(path) as writer:
+        for number, (moves, headers, result) in enumerate(GAMES):
+            assert writer.add(packed(moves), headers, result) == number
+    return path
+
+
+def test_round_trip(archive_path):
+    with GameArchive(archive_path) as archive:
+        assert len(archive) == len(GAMES)
+        for number, (moves, _, _) in enumerate(GAMES):
+            assert list(archive.moves(number)) == packed(moves)
+        assert [list(moves) for moves in archive] == [packed(moves) for moves, _, _ in GAMES]
+        assert archive.info(0) == GameInfo("Alpha", "Beta", "Open", "2024.03.09", "1-0", 2100, 0)
+        assert archive.info(1) == GameInfo("", "", "", "????.??.??", "*", 0, 0)
+        # names are cut to 32 bytes
+        assert archive.info(2) == GameInfo("Gämma", "D" * 32, "", "1999.??.??", "1/2-1/2", 0, 0)
+
+
+def test_numbers_are_ascii():
+    assert pack_info({"Date": "2024.\u00b3.\u0661", "WhiteElo": "\u0662\u0660\u0660\u0660"}, "*") == \
+        pack_info({"Date": "2024.??.??"}, "*")
+
+
+def test_replay_and_game(archive_path):
+    with GameArchive(archive_path) as archive:
+        board = archive.replay(0)
+        assert board_to_fen(board) == "r1bqkbnr/1ppp1ppp/p1n5/1B2p3/4P3/5N2/PPPP1PPP/RNBQK2R w KQkq - 0 4"
+        game = archive.game(0, Board())
+        assert game.sans == ["e4", "e5", "Nf3", "Nc6", "Bb5", "a6"]
+        assert game.headers["White"] == "Alpha"
+        assert game.headers["WhiteElo"] == "2100"
+        assert game.result == "1-0"
+
+
+def test_missing_game(archive_path):
+    with GameArchive(archive_path) as archive:
+        with pytest.raises(IndexError):
+            archive.moves(3)
+        with pytest.raises(IndexError):
+            archive.info(-1)
+
+
+def test_empty_archive(tmp_path):
+    path = tmp_path / "empty.rca"
+    ArchiveWriter(path).close()
+    with GameArchive(path) as archive:
+        assert len(archive) == 0
+        assert list(archive) == []
+
+
+@pytest.mark.parametrize("data", [b"", b"RCGA", b"not a game archive at all, just text"])
+def test_not_an_archive(tmp_path, data):
+    path = tmp_path / "bad.rca"
+    path.write_bytes(data)
+    with pytest.raises(ValueError):
+        GameArchive(path)
+
+
+def test_convert(tmp_path):
+    pgn = """[White "A"]\n[Black "B"]\n[Result "0-1"]\n\n1. f3 e5 2. g4 Qh4# 0-1\n
+[White "C"]\n[Black "D"]\n\n1. e4 e5 2. Ke3 *\n
+[SetUp "1"]\n[FEN "4k3/8/8/8/8/8/8/4K3 w - - 0 1"]\n\n1. Kd2 *\n"""
+    path = tmp_path / "games.rca"
+    stats = convert(io.StringIO(pgn), path)
+    assert stats == {"games": 1, "plies": 4, "errors": 1, "skipped": 1}
+    with GameArchive(path) as archive:
+        game = archive.game(0)
+        original = next(read_games(io.StringIO(pgn)))
+        assert game.sans == original.sans
+        assert game.result == "0-1"
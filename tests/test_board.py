@@ -0,0 +1,84 @@
+import random
+
+import pytest
+
+from board import BACKENDS, Board, PieceType, uci_to_move
+from fen import load_fen
+from timer import Clock, TimeControl
+
+SHUFFLE = [((7, 6), (5, 5)), ((0, 6), (2, 5)), ((5, 5), (7, 6)), ((2, 5), (0, 6))]
+
+
+@pytest.mark.parametrize("backend", BACKENDS)
+def test_moves_of_a_square(backend):
+    board = Board(backend=backend)
+    rng = random.Random(3)
+    for _ in range(80):
+        moves = board.generate_moves()
+        if not moves:
+            break
+        for sq in range(64):
+            expected = sorted({divmod(m >> 6 & 63, 8) for m in moves if m & 63 == sq})
+            assert sorted(board.generate_possible_moves(divmod(sq, 8))) == expected
+        board.make_move(rng.choice(moves))
+
+
+def test_bitboard_sync_keeps_the_mailbox():
+    board = Board(backend="bitboard")
+    squares = board.squares
+    other = load_fen(Board(backend="mailbox"), "4k3/8/8/8/8/8/8/4K2R w K - 0 1")
+    board.bitboards.sync(other.squares)
+    assert board.squares is squares
+    assert board.squares == other.squares
+    assert board.at(7, 7).type is PieceType.ROOK
+
+
+def test_flag_ends_the_game():
+    clock = Clock(TimeControl.parse("60+0"))
+    board = Board(clock=clock)
+    assert board.move((6, 4), (4, 4))
+    assert clock.check_flag(clock.started + 61_000_000_000)
+    assert board.result() == ("1-0", "on time")
+    assert not board.move((1, 4), (3, 4))
+    assert len(board.state.undo_stack) == 1
+
+
+def test_threefold_repetition_ends_the_game():
+    board = Board()
+    for src, dest in SHUFFLE * 2:
+        assert board.result() is None
+        assert board.move(src, dest)
+    assert board.state.repetitions() == 2
+    assert board.draw_claim() == "threefold repetition"
+    assert board.result() == ("1/2-1/2", "threefold repetition")
+    assert not board.move((6, 4), (4, 4))
+    board.select(6, 4)
+    assert board.state.selected_piece is None
+    # a takeback leaves the position repeated once less
+    board.takeback()
+    assert board.result() is None
+    assert board.move((7, 6), (5, 5))
+
+
+def test_repetitions_need_the_same_side_to_move():
+    board = Board()
+    for text in "g1f3 g8f6 f3g1 f6g8 g1f3".split():
+        board.make_move(uci_to_move(text))
+    assert board.state.repetitions() == 1
+    board.make_move(uci_to_move("g8f6"))
+    assert board.state.repetitions() == 1
+    assert board.draw_claim() is None
+
+
+def test_fifty_move_rule():
+    board = load_fen(Board(), "8/8/8/4k3/8/8/8/R3K3 w - - 99 80")
+    assert board.draw_claim() is None
+    assert board.move((7, 0), (6, 0))
+    assert board.result() == ("1/2-1/2", "fifty-move rule")
+
+
+def test_fifty_move_rule_after_mate():
+    board = load_fen(Board(), "7k/8/6K1/8/8/8/8/R7 w - - 99 80")
+    assert board.move((7, 0), (0, 0))
+    assert board.draw_claim() is None
+    assert board.result() is None
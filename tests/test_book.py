@@ -0,0 +1,85 @@
+import random
+
+import pytest
+
+from board import Board, uci_to_move
+from book import ENTRY, BookEntry, PolyglotBook, decode_move
+from fen import load_fen
+
+# Polyglot key of the initial position and of 1. e4
+START = 0x463B96181691FC9C
+E4 = 0x823C9B50FD114196
+
+
+def raw(uci: str, promotion: int = 0) -> int:
+    # Polyglot moves count ranks from the first one
+    from_file, from_rank = ord(uci[0]) - ord("a"), int(uci[1]) - 1
+    to_file, to_rank = ord(uci[2]) - ord("a"), int(uci[3]) - 1
+    return to_file | to_rank << 3 | from_file << 6 | from_rank << 9 | promotion << 12
+
+
+def test_decode_move():
+    board = Board()
+    assert decode_move(raw("e2e4"), board.squares) == uci_to_move("e2e4")
+    assert decode_move(raw("g1f3"), board.squares) == uci_to_move("g1f3")
+
+
+def test_decode_castling():
+    board = load_fen(Board(), "r3k2r/8/8/8/8/8/8/R3K2R w KQkq - 0 1")
+    assert decode_move(raw("e1h1"), board.squares) == uci_to_move("e1g1")
+    assert decode_move(raw("e1a1"), board.squares) == uci_to_move("e1c1")
+    assert decode_move(raw("e8h8"), board.squares) == uci_to_move("e8g8")
+    # a rook on e1 moving to h1 is not castling
+    board = load_fen(Board(), "3k4/8/8/8/8/8/8/4R1K1 w - - 0 1")
+    assert decode_move(raw("e1h1"), board.squares) == uci_to_move("e1h1")
+
+
+@pytest.mark.parametrize("promotion, letter", [(1, "n"), (2, "b"), (3, "r"), (4, "q")])
+def test_decode_promotion(promotion, letter):
+    board = load_fen(Board(), "4k3/P7/8/8/8/8/8/4K3 w - - 0 1")
+    assert decode_move(raw("a7a8", promotion), board.squares) == uci_to_move("a7a8" + letter)
+
+
+@pytest.fixture
+def book_path(tmp_path):
+    entries = [
+        (START, raw("e2e4"), 10, 0),
+        (START, raw("d2d4"), 5, 1),
+        (START, raw("e2e5"), 7, 0),
+        (START, raw("a2a3"), 0, 0),
+        (E4, raw("c7c5"), 3, 0),
+    ]
+    path = tmp_path / "book.bin"
+    path.write_bytes(b"".join(ENTRY.pack(*entry) for entry in sorted(entries, key=lambda e: e[0])))
+    return path
+
+
+def test_entries(book_path):
+    with PolyglotBook(book_path) as book:
+        assert len(book) == 5
+        board = Board()
+        # the illegal e2e5 is dropped
+        assert book.entries(board) == [BookEntry(uci_to_move("e2e4"), 10, 0), BookEntry(uci_to_move("d2d4"), 5, 1),
+                                       BookEntry(uci_to_move("a2a3"), 0, 0)]
+        board.make_move(uci_to_move("e2e4"))
+        assert book.entries(board) == [BookEntry(uci_to_move("c7c5"), 3, 0)]
+        board.make_move(uci_to_move("c7c5"))
+        assert book.entries(board) == []
+        assert book.choose(board) is None
+
+
+def test_choose(book_path):
+    with PolyglotBook(book_path) as book:
+        board = Board()
+        assert book.choose(board, weighted=False) == uci_to_move("e2e4")
+        picked = {book.choose(board, random.Random(seed)) for seed in range(50)}
+        # moves without weight are never played
+        assert picked == {uci_to_move("e2e4"), uci_to_move("d2d4")}
+
+
+def test_empty_book(tmp_path):
+    path = tmp_path / "empty.bin"
+    path.write_bytes(b"")
+    with PolyglotBook(path) as book:
+        assert len(book) == 0
+        assert book.entries(Board()) == []
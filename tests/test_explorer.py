@@ -0,0 +1,95 @@
+import random
+
+import pytest
+
+from archive import RESULTS, ArchiveWriter, GameArchive
+from board import Board
+from explorer import PositionIndex, build_index
+from fen import load_fen
+
+
+@pytest.fixture(scope="module")
+def archive_path(tmp_path_factory):
+    # random games, which share their first moves often enough
+    path = tmp_path_factory.mktemp("explorer") / "games.rca"
+    rng = random.Random(11)
+    with ArchiveWriter(path) as writer:
+        for _ in range(40):
+            board = Board(backend="bitboard")
+            moves = []
+            for ply in range(rng.randrange(0, 30)):
+                legal = sorted(board.generate_moves())
+                if not legal:
+                    break
+                move = legal[rng.randrange(3 if ply < 4 else len(legal)) % len(legal)]
+                board.make_move(move)
+                moves.append(move)
+            writer.add(moves, result=rng.choice(RESULTS))
+    return path
+
+
+def brute_force(archive, key):
+    # the games reaching a key and the moves played from it, with their results
+    games, moves = [], {}
+    for number, game in enumerate(archive):
+        board = Board(backend="bitboard")
+        result = archive.info(number).result
+        for ply in range(len(game) + 1):
+            if board.key == key:
+                if not games or games[-1] != number:
+                    games.append(number)
+                if ply < len(game):
+                    moves.setdefault(game[ply], []).append(result)
+            if ply < len(game):
+                board.make_move(game[ply])
+    return games, moves
+
+
+@pytest.mark.parametrize("run_size", [1, 7, 100, 1 << 20])
+def test_run_sizes_give_the_same_index(archive_path, tmp_path, run_size):
+    with GameArchive(archive_path) as archive:
+        reference = tmp_path / "reference.rcx"
+        count = build_index(archive, reference)
+        path = tmp_path / "index.rcx"
+        assert build_index(archive, path, run_size=run_size) == count
+    assert count == sum(len(moves) + 1 for moves in GameArchive(archive_path))
+    assert path.read_bytes() == reference.read_bytes()
+
+
+@pytest.mark.parametrize("run_size", [5, 1 << 20])
+def test_query(archive_path, tmp_path, run_size):
+    path = tmp_path / "index.rcx"
+    with GameArchive(archive_path) as archive:
+        build_index(archive, path, run_size=run_size)
+        with PositionIndex(path) as index:
+            # every position of the first plies of a few games
+            for number in range(0, len(archive), 5):
+                board = Board(backend="bitboard")
+                for move in list(archive.moves(number)[:6]) + [None]:
+                    stats = index.query(board)
+                    games, moves = brute_force(archive, board.key)
+                    assert stats.games == games
+                    assert {m.move: m.count for m in stats.moves} == {m: len(r) for m, r in moves.items()}
+                    for m in stats.moves:
+                        results = moves[m.move]
+                        assert (m.white, m.draws, m.black) == (results.count("1-0"), results.count("1/2-1/2"),
+                                                               results.count("0-1"))
+                    assert [m.count for m in stats.moves] == sorted((m.count for m in stats.moves), reverse=True)
+                    if move is None:
+                        break
+                    board.make_move(move)
+
+
+def test_unknown_position(archive_path, tmp_path):
+    path = tmp_path / "index.rcx"
+    with GameArchive(archive_path) as archive:
+        build_index(archive, path)
+    with PositionIndex(path) as index:
+        assert index.query(load_fen(Board(), "4k3/8/8/8/8/8/8/4K3 w - - 0 1")) == ([], [])
+
+
+def test_not_an_index(tmp_path):
+    path = tmp_path / "bad.rcx"
+    path.write_bytes(b"RCGA" + bytes(20))
+    with pytest.raises(ValueError):
+        PositionIndex(path)
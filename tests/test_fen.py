@@ -0,0 +1,71 @@
+import io
+
+import pytest
+
+from board import BACKENDS, Board
+from fen import STARTING_FEN, InvalidFenException, board_to_fen, load_fen, parse_fen, read_fens
+from perft import REFERENCE_POSITIONS
+
+
+@pytest.mark.parametrize("fen", [p[1] for p in REFERENCE_POSITIONS] + [
+    "rnbqkbnr/ppp1p1pp/8/3pPp2/8/8/PPPP1PPP/RNBQKBNR w KQkq f6 0 3",
+    "4k3/8/8/8/3pP3/8/8/4K3 b - e3 0 1",
+    "8/8/8/8/8/8/8/K6k b - - 99 120",
+])
+def test_round_trip(fen):
+    assert board_to_fen(load_fen(Board(backend="bitboard"), fen)) == fen
+
+
+def test_missing_fields_have_defaults():
+    record = parse_fen("4k3/8/8/8/8/8/8/4K3")
+    assert record.white_turn
+    assert record.castling_rights == 0
+    assert record.en_passant is None
+    assert (record.halfmove_clock, record.fullmove_number) == (0, 1)
+
+
+@pytest.mark.parametrize("fen", [
+    "",
+    "rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1 extra",
+    "rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP w KQkq - 0 1",
+    "rnbqkbnr/pppppppp/9/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1",
+    "rnbqkbnr/pppppppp/44/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1",
+    "rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQXBNR w KQkq - 0 1",
+    "rnbqqbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQ - 0 1",
+    "Pnbqkbnr/pppppppp/8/8/8/8/1PPPPPPP/RNBQKBNR w KQkq - 0 1",
+    "rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR x KQkq - 0 1",
+    "rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBN1 w KQkq - 0 1",
+    "rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KKkq - 0 1",
+    "rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq e6 0 1",
+    "rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - x 1",
+    "rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 0",
+    "rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - \u00b2 1",
+    "rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 \u0663",
+])
+def test_rejects_invalid_positions(fen):
+    with pytest.raises(InvalidFenException):
+        parse_fen(fen)
+
+
+@pytest.mark.parametrize("backend", BACKENDS)
+@pytest.mark.parametrize("fen", [
+    "4k3/8/8/8/8/8/8/4R1K1 w - - 0 1",
+    "4k3/8/8/8/8/8/3q4/4K3 b - - 0 1",
+    "4k3/8/8/8/8/8/8/3Kq3 b - - 0 1",
+])
+def test_rejects_the_side_not_to_move_in_check(backend, fen):
+    parse_fen(fen)
+    with pytest.raises(InvalidFenException):
+        load_fen(Board(backend=backend), fen)
+
+
+def test_read_fens_skips_the_side_not_to_move_in_check():
+    source = io.StringIO("4k3/8/8/8/8/8/8/4R1K1 w - - 0 1\n4k3/8/8/8/8/8/8/4R1K1 b - - 0 1\n")
+    boards = [board_to_fen(board) for board in read_fens(source, Board(), skip_invalid=True)]
+    assert boards == ["4k3/8/8/8/8/8/8/4R1K1 b - - 0 1"]
+    with pytest.raises(InvalidFenException):
+        list(read_fens(io.StringIO("4k3/8/8/8/8/8/8/4R1K1 w - - 0 1\n"), Board()))
+
+
+def test_starting_position():
+    assert board_to_fen(Board()) == STARTING_FEN
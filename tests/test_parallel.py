@@ -0,0 +1,43 @@
+import pytest
+
+from board import Board
+from fen import STARTING_FEN, board_to_fen, load_fen
+from parallel import AnalysisPool
+from perft import Perft
+from search import Search
+
+# Qd8 mates at once, so the tree has a root move without any child
+BACK_RANK_MATE = "6k1/5ppp/8/8/8/8/8/3Q2K1 w - - 0 1"
+# most queen moves keep black stalemated
+STALEMATES = "7k/8/6Q1/8/8/8/8/K7 w - - 0 1"
+
+
+@pytest.mark.parametrize("fen", [BACK_RANK_MATE, STALEMATES])
+def test_perft_divide_does_not_depend_on_workers(fen):
+    expected = Perft(load_fen(Board(backend="bitboard"), fen)).divide(3)
+    for workers in (1, 4):
+        with AnalysisPool(workers) as pool:
+            divide = pool.perft(fen, 3)
+        assert divide == expected
+        assert list(divide) == list(expected)
+
+
+def test_perft_divide_keeps_mating_moves():
+    with AnalysisPool(8) as pool:
+        assert pool.perft(BACK_RANK_MATE, 3)["d1d8"] == 0
+
+
+def test_a_failing_position_does_not_abort_the_batch(monkeypatch):
+    run = Search.run
+
+    def fail_on_mate(self, *args, **kwargs):
+        if board_to_fen(self.board) == BACK_RANK_MATE:
+            raise RuntimeError("boom")
+        return run(self, *args, **kwargs)
+
+    # the workers are forked after the patch
+    monkeypatch.setattr(Search, "run", fail_on_mate)
+    fens = [STALEMATES, BACK_RANK_MATE, "not a fen", STARTING_FEN]
+    with AnalysisPool(2) as pool:
+        results = [result for _, result in pool.search(fens, 1)]
+    assert [result is None for result in results] == [False, True, True, False]
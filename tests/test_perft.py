@@ -0,0 +1,53 @@
+import pytest
+
+from board import BACKENDS, Board
+from fen import load_fen
+from perft import REFERENCE_POSITIONS, Perft
+
+# deepest counts run for each backend, the mailbox one being much slower
+MAX_NODES = {"mailbox": 10_000, "bitboard": 100_000}
+
+
+@pytest.mark.parametrize("backend", BACKENDS)
+@pytest.mark.parametrize("name, fen, counts", REFERENCE_POSITIONS, ids=[p[0] for p in REFERENCE_POSITIONS])
+def test_reference_counts(backend, name, fen, counts):
+    perft = Perft(load_fen(Board(backend=backend), fen))
+    for depth, expected in enumerate(counts, 1):
+        if expected > MAX_NODES[backend]:
+            break
+        assert perft.count(depth) == expected
+
+
+@pytest.mark.parametrize("backend", BACKENDS)
+def test_divide_adds_up(backend):
+    name, fen, counts = REFERENCE_POSITIONS[1]
+    divide = Perft(load_fen(Board(backend=backend), fen)).divide(2)
+    assert len(divide) == counts[0]
+    assert sum(divide.values()) == counts[1]
+
+
+def test_divide_needs_a_depth():
+    with pytest.raises(ValueError):
+        Perft(Board()).divide(0)
+
+
+def test_count_rejects_negative_depths():
+    perft = Perft(Board())
+    assert perft.count(0) == 1
+    with pytest.raises(ValueError):
+        perft.count(-1)
+
+
+def test_divide_without_moves():
+    board = load_fen(Board(), "7k/5Q2/6K1/8/8/8/8/8 b - - 0 1")
+    assert Perft(board).divide(2) == {}
+
+
+@pytest.mark.parametrize("name, fen, counts", REFERENCE_POSITIONS, ids=[p[0] for p in REFERENCE_POSITIONS])
+def test_backends_agree_on_each_square(name, fen, counts):
+    mailbox = load_fen(Board(backend="mailbox"), fen)
+    bitboard = load_fen(Board(backend="bitboard"), fen)
+    for sq in range(64):
+        cell = divmod(sq, 8)
+        assert sorted(bitboard.generate_possible_moves(cell)) == sorted(mailbox.generate_possible_moves(cell))
+    assert sorted(bitboard.generate_moves()) == sorted(mailbox.generate_moves())
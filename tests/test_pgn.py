@@ -0,0 +1,97 @@
+import io
+
+import pytest
+
+from board import Board, uci_to_move
+from fen import STARTING_FEN, board_to_fen
+from pgn import Game, PgnError, format_game, read_games
+
+PGN = """[Event "Casual"]
+[Site "?"]
+[Date "2024.01.02"]
+[Round "1"]
+[White "Alpha"]
+[Black "Beta"]
+[Result "1-0"]
+
+1. e4 e5 2. Nf3 {a comment} Nc6 3. Bb5 a6 (3... Nf6 4. O-O) 4. Ba4 Nf6 5. O-O Be7
+6. Re1 b5 7. Bb3 d6 8. c3 O-O 1-0
+
+[Event "Promotion"]
+[White "Gamma"]
+[Black "Delta"]
+[Result "*"]
+[SetUp "1"]
+[FEN "4k3/1P6/8/8/8/8/8/4K3 w - - 0 1"]
+
+1. b8=Q+ Kd7 2. Qb5+ *
+"""
+
+
+def test_read_games():
+    games = list(read_games(io.StringIO(PGN)))
+    assert len(games) == 2
+    first, second = games
+    assert first.headers["White"] == "Alpha"
+    assert first.result == "1-0"
+    assert first.sans[:4] == ["e4", "e5", "Nf3", "Nc6"]
+    assert len(first.sans) == 16
+    assert second.fen == "4k3/1P6/8/8/8/8/8/4K3 w - - 0 1"
+    assert second.sans == ["b8=Q+", "Kd7", "Qb5+"]
+
+
+def test_moves():
+    board = Board()
+    first = next(read_games(io.StringIO(PGN)))
+    moves = first.moves(board)
+    assert moves[0] == uci_to_move("e2e4")
+    assert moves[8] == uci_to_move("e1g1")
+    assert board_to_fen(board) == "r1bq1rk1/2p1bppp/p1np1n2/1p2p3/4P3/1BP2N2/PP1P1PPP/RNBQR1K1 w - - 1 9"
+
+
+def test_illegal_move():
+    game = Game({"White": "A", "Black": "B"}, ["e4", "e5", "Ke3"])
+    with pytest.raises(PgnError):
+        game.moves()
+
+
+@pytest.mark.parametrize("fen", ["8/8/8 w", "4k3/8/8/8/8/8/8/4R1K1 w - - 0 1", "4k3/8/8/8/8/8/8/4K3 w - - 0 x"])
+def test_invalid_fen_tag(fen):
+    game = Game({"White": "A", "Black": "B", "SetUp": "1", "FEN": fen}, ["Kd2"])
+    with pytest.raises(PgnError):
+        game.moves()
+    with pytest.raises(PgnError):
+        Game.from_moves([], fen=fen)
+
+
+def test_format_invalid_fen_tag():
+    with pytest.raises(PgnError):
+        format_game(Game({"FEN": "8/8/8 w - - 0"}, ["Kd2"]))
+
+
+def test_format_move_numbers_from_the_fen():
+    game = Game({"FEN": "4k3/8/8/8/8/8/8/4K3 b - - 0 12"}, ["Kd7", "Kd2"])
+    assert "12... Kd7 13. Kd2 *" in format_game(game)
+
+
+@pytest.mark.parametrize("index", [0, 1])
+def test_format_round_trip(index):
+    game = list(read_games(io.StringIO(PGN)))[index]
+    again = list(read_games(io.StringIO(format_game(game))))
+    assert len(again) == 1
+    # the seven tag roster is always written
+    assert game.headers.items() <= again[0].headers.items()
+    assert again[0].sans == game.sans
+    assert again[0].result == game.result
+
+
+@pytest.mark.parametrize("fen, uci", [
+    (STARTING_FEN, "e2e4 e7e5 g1f3 b8c6 f1b5 g8f6 e1g1 f6e4 f1e1 e4d6 f3e5 f8e7"),
+    ("r3k2r/p1ppqpb1/bn2pnp1/3PN3/1p2P3/2N2Q1p/PPPBBPPP/R3K2R w KQkq - 0 1", "e1c1 e8g8 e5f7 b4c3 f7h6"),
+    ("4k3/1P6/8/8/8/8/6p1/4K2R w K - 0 1", "b7b8n g2h1r e1e2 h1h2"),
+    ("7k/8/8/8/1N3N2/8/8/K7 w - - 0 1", "b4d5 h8g8 f4e6"),
+])
+def test_san_round_trip(fen, uci):
+    moves = [uci_to_move(text) for text in uci.split()]
+    game = Game.from_moves(moves, {"White": "A", "Black": "B"}, fen)
+    assert game.moves() == moves
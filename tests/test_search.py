@@ -0,0 +1,45 @@
+import time
+
+from board import Board, uci_to_move
+from fen import load_fen
+from search import INFINITE, MAX_PLY, Search
+
+
+class PlyTable(list):
+    # records the highest ply looked up
+    highest = -1
+
+    def __getitem__(self, ply):
+        self.highest = max(self.highest, ply)
+        return super().__getitem__(ply)
+
+
+def test_no_move_without_legal_moves():
+    board = load_fen(Board(backend="bitboard"), "7k/5Q2/6K1/8/8/8/8/8 b - - 0 1")
+    assert Search(board).run(depth=3).move == 0
+
+
+def test_finds_mate_in_one():
+    board = load_fen(Board(backend="bitboard"), "6k1/5ppp/8/8/8/8/8/3Q2K1 w - - 0 1")
+    assert Search(board).run(depth=3).move == uci_to_move("d1d8")
+
+
+def test_negamax_stops_at_the_last_ply():
+    # check extensions keep adding depth, the search must not go past the ply tables
+    board = load_fen(Board(backend="bitboard"), "4k3/8/8/8/8/8/3Q4/4K3 w - - 0 1")
+    search = Search(board)
+    search.run(depth=1)
+    search.killers = PlyTable(search.killers)
+    score = search.negamax(4, -INFINITE, INFINITE, MAX_PLY - 2)
+    assert -INFINITE < score < INFINITE
+    assert 0 <= search.killers.highest < MAX_PLY
+
+
+def test_stop_before_run_is_kept():
+    board = Board(backend="bitboard")
+    search = Search(board)
+    search.stop()
+    start = time.perf_counter()
+    result = search.run(movetime=5)
+    assert time.perf_counter() - start < 1
+    assert result.move in board.generate_moves()
@@ -0,0 +1,44 @@
+from tt import EXACT, LOWER, UPPER, BUCKET_SIZE, TranspositionTable, pack, unpack
+
+
+def test_pack_round_trip():
+    for move, score, depth, bound in ((0, 0, 0, EXACT), (0x5FFF, -30000, 255, LOWER), (1234, 29000, 7, UPPER)):
+        assert unpack(pack(move, score, depth, bound, 5)) == (move, score, depth, bound)
+
+
+def test_store_and_probe():
+    tt = TranspositionTable(1)
+    key = 0x123456789ABCDEF0
+    assert tt.probe(key) == 0
+    tt.store(key, 100, -55, 6, LOWER)
+    assert unpack(tt.probe(key)) == (100, -55, 6, LOWER)
+    # another key of the same bucket does not match
+    assert tt.probe(key ^ 1 << 63) == 0
+
+
+def test_store_keeps_the_move_without_a_new_one():
+    tt = TranspositionTable(1)
+    tt.store(42, 300, 10, 3, EXACT)
+    tt.store(42, 0, 20, 4, UPPER)
+    assert unpack(tt.probe(42)) == (300, 20, 4, UPPER)
+
+
+def test_replaces_the_shallowest_entry():
+    tt = TranspositionTable(1)
+    buckets = tt.mask + 1
+    keys = [1 + i * buckets for i in range(BUCKET_SIZE + 1)]
+    for depth, key in enumerate(keys[:BUCKET_SIZE], 1):
+        tt.store(key, 1, 0, depth, EXACT)
+    tt.store(keys[-1], 1, 0, 9, EXACT)
+    assert tt.probe(keys[0]) == 0
+    assert all(tt.probe(key) for key in keys[1:])
+
+
+def test_clear_in_place():
+    tt = TranspositionTable(1)
+    keys = tt.keys
+    tt.store(99, 1, 2, 3, EXACT)
+    tt.clear()
+    assert tt.probe(99) == 0
+    assert tt.keys is keys
+    assert not any(tt.data)
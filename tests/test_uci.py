@@ -0,0 +1,43 @@
+import io
+
+import search
+from fen import board_to_fen
+from uci import UciEngine
+
+
+def lines(output: io.StringIO):
+    return output.getvalue().splitlines()
+
+
+def test_bestmove_after_a_failed_search(monkeypatch):
+    def fail(self, *args, **kwargs):
+        # the search dies partway, with a move still made on the board
+        self.board.make_move(self.board.generate_moves()[0])
+        raise RuntimeError("boom")
+
+    monkeypatch.setattr(search.Search, "run", fail)
+    output = io.StringIO()
+    engine = UciEngine(output)
+    engine.handle("position startpos moves e2e4")
+    engine.handle("go depth 3")
+    engine.stop()
+    assert any(line.startswith("info string search failed") for line in lines(output))
+    bestmove = lines(output)[-1].split()
+    assert bestmove[0] == "bestmove" and bestmove[1] != "0000"
+    assert len(engine.board.state.undo_stack) == 1
+    engine.close()
+
+
+def test_position_with_an_illegal_move_is_not_applied():
+    output = io.StringIO()
+    engine = UciEngine(output)
+    engine.handle("position startpos moves e2e4")
+    fen = board_to_fen(engine.board)
+    engine.handle("position startpos moves d2d4 d7d5 e1e5 g8f6")
+    assert lines(output)[-1] == "info string illegal move e1e5"
+    assert board_to_fen(engine.board) == fen
+    assert len(engine.position[1]) == 1
+    engine.handle("position fen 4k3/8/8/8/8/8/8/4R1K1 w - - 0 1")
+    assert lines(output)[-1].startswith("info string invalid fen")
+    assert board_to_fen(engine.board) == fen
+    engine.close()
@@ -0,0 +1,54 @@
+import random
+
+import pytest
+
+from board import BACKENDS, Board, uci_to_move
+from fen import STARTING_FEN, load_fen
+from zobrist import position_key
+
+# keys of the Polyglot book format specification
+POLYGLOT_KEYS = [
+    ("", 0x463B96181691FC9C),
+    ("e2e4", 0x823C9B50FD114196),
+    ("e2e4 d7d5", 0x0756B94461C50FB0),
+    ("e2e4 d7d5 e4e5", 0x662FAFB965DB29D4),
+    ("e2e4 d7d5 e4e5 f7f5", 0x22A48B5A8E47FF78),
+    ("e2e4 d7d5 e4e5 f7f5 e1e2", 0x652A607CA3F242C1),
+    ("e2e4 d7d5 e4e5 f7f5 e1e2 e8f7", 0x00FDD303C946BDD9),
+    ("a2a4 b7b5 h2h4 b5b4 c2c4", 0x3C8123EA7B067637),
+    ("a2a4 b7b5 h2h4 b5b4 c2c4 b4c3 a1a3", 0x5C3F9B829B279560),
+]
+
+
+@pytest.mark.parametrize("backend", BACKENDS)
+@pytest.mark.parametrize("moves, key", POLYGLOT_KEYS)
+def test_polyglot_keys(backend, moves, key):
+    board = Board(backend=backend)
+    for text in moves.split():
+        board.make_move(uci_to_move(text))
+    assert board.key == key
+    state = board.state
+    assert position_key(board.squares, state.white_turn, state.castling_rights, state.en_passant) == key
+
+
+@pytest.mark.parametrize("backend", BACKENDS)
+def test_incremental_keys_match_from_scratch(backend):
+    board = Board(backend=backend)
+    rng = random.Random(7)
+    for _ in range(10):
+        load_fen(board, STARTING_FEN)
+        keys = [board.key]
+        for _ in range(60):
+            moves = board.generate_moves()
+            if not moves:
+                break
+            board.make_move(rng.choice(moves))
+            state = board.state
+            assert board.key == position_key(board.squares, state.white_turn, state.castling_rights,
+                                             state.en_passant)
+            keys.append(board.key)
+        # unmaking gives the keys back
+        while board.state.undo_stack:
+            keys.pop()
+            board.unmake_move()
+            assert board.key == keys[-1]